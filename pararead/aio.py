@@ -0,0 +1,135 @@
+""" Processing driven from an asyncio event loop. """
+
+import asyncio
+from collections import namedtuple
+import functools
+import logging
+import os
+import shutil
+import time
+
+from .pipeline import ChunkOutput
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["AsyncRun", "ChunkCompleted", "Progress"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+ChunkCompleted = namedtuple("ChunkCompleted", field_names=["chunk", "result"])
+Progress = namedtuple("Progress",
+                      field_names=["completed", "total", "elapsed"])
+
+
+class AsyncRun(object):
+    """
+    Processing of a reads file, supervised by an asyncio event loop.
+
+    Iterate asynchronously to receive a ChunkCompleted event as each chunk
+    finishes, followed by a Progress event; or await result() for just the
+    names of the chunks with non-null result. The worker pool is polled from
+    the event loop, so no thread is dedicated to the run (other than those
+    of pipeline stages, if any); the steps that block, i.e. partitioning,
+    starting and stopping the workers, and finishing the pipeline, are run
+    in the loop's default executor. If iteration is cancelled or abandoned
+    before it's finished, the workers are stopped and temporary files are
+    removed.
+    """
+
+    def __init__(self, processor, **run_kwargs):
+        """
+        :param pararead.ParaReadProcessor processor: processor with files
+            already registered.
+        :param run_kwargs: arguments as for the processor's run().
+        """
+        self.processor = processor
+        self.run_kwargs = run_kwargs
+        self.good_chunks = None
+        self._events = None
+
+    def __aiter__(self):
+        if self._events is None:
+            self._events = self._generate()
+        return self._events
+
+    async def result(self):
+        """
+        Finish processing, if it's not already finished.
+
+        :return Iterable[str]: names of chunks for which result is non-null.
+        """
+        async for _ in self:
+            pass
+        return self.good_chunks
+
+    async def aclose(self):
+        """ Abandon processing, stopping workers and removing temp files. """
+        if self._events is not None:
+            await self._events.aclose()
+
+    async def _generate(self):
+        processor = self.processor
+        loop = asyncio.get_running_loop()
+        plan = await loop.run_in_executor(None, functools.partial(
+                processor._prepare_run, in_process=False, **self.run_kwargs))
+        executor, pipeline = plan.executor, plan.pipeline
+        poll_interval = executor.poll_interval
+        total = len(plan.nonempties)
+        result_by_nonempty = {}
+        start = time.time()
+        finished = False
+
+        yield Progress(0, total, 0.0)
+        session = await loop.run_in_executor(
+                None, executor.session, plan.nonempties)
+        if pipeline is not None:
+            pipeline.start()
+        try:
+            while not session.done:
+                for chunk, result in session.poll():
+                    result_by_nonempty[chunk] = result
+                    if pipeline is not None:
+                        output = ChunkOutput(
+                                chunk, processor._tempf(chunk), result)
+                        # Don't block the loop, but wait for room all the
+                        # same, which is what holds back submissions.
+                        while not pipeline.put(output, block=False):
+                            await asyncio.sleep(poll_interval)
+                    yield ChunkCompleted(chunk, result)
+                    yield Progress(len(result_by_nonempty), total,
+                                   time.time() - start)
+                await asyncio.sleep(poll_interval)
+            finished = True
+        finally:
+            # Shielded, so that the workers are stopped and the temporary
+            # files removed even if the task is cancelled again meanwhile.
+            await asyncio.shield(loop.run_in_executor(None, functools.partial(
+                    self._finish, session, pipeline, finished)))
+        self.good_chunks = await loop.run_in_executor(
+                None, processor._collect_results, plan, result_by_nonempty)
+
+    def _finish(self, session, pipeline, finished):
+        """
+        Stop the workers and the pipeline, and clean up if unfinished.
+
+        :param pararead.execution.PoolSession session: the processing.
+        :param pararead.pipeline.Pipeline pipeline: the pipeline for the
+            chunks' outputs, if any.
+        :param bool finished: whether every chunk was processed.
+        :raise pararead.exceptions.PipelineStageException: if processing
+            finished but a pipeline stage failed.
+        """
+        session.close()
+        if pipeline is not None:
+            pipeline.close(raise_errors=finished)
+        if not finished:
+            temp_folder = self.processor.temp_folder
+            _LOGGER.warning("Processing cancelled; removing temporary "
+                            "files: '%s'", temp_folder)
+            if os.path.exists(temp_folder):
+                shutil.rmtree(temp_folder)
@@ -0,0 +1,278 @@
+"""
+Scanning and writing of BGZF-compressed files (e.g., BAM) by blocks.
+
+A BGZF file is a series of independently compressed blocks, each with a
+gzip header that records the block's size. A block can be found from an
+arbitrary byte offset by searching for the header, and one block can be
+decompressed without touching the rest of the file, which is what allows
+cutting a file into chunks without reading it through. Likewise, files of
+whole blocks can be concatenated as they are, which is what allows chunks
+to be compressed separately and joined.
+"""
+
+import struct
+import zlib
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["BgzfWriter", "compressed_offset", "find_block_start",
+           "find_record_start", "make_virtual_offset", "read_block",
+           "EOF_BLOCK"]
+
+
+# Fixed part of a BGZF block header: gzip magic, deflate, FEXTRA flag,
+# (mtime, XFL, OS vary), XLEN 6, and the 'BC' subfield of length 2.
+_MAGIC = b"\x1f\x8b\x08\x04"
+_SUBFIELD = b"\x06\x00BC\x02\x00"
+_HEADER_SIZE = 18
+# Number of bytes of a file to search at once for a block header.
+_SEARCH_SIZE = 2 ** 16
+# Largest plausible size of one BAM record, for telling records from noise.
+_MAX_RECORD_SIZE = 2 ** 24
+# Fixed-size fields of a BAM record, following its block_size field.
+_RECORD_FIELDS = struct.Struct("<iiBBHHHiiii")
+# Most data compressed into one block, as by htslib, so that even data that
+# doesn't compress fits within a block's maximum size.
+BLOCK_DATA_SIZE = 0xFF00
+# Empty block that marks the end of a BGZF file.
+EOF_BLOCK = _MAGIC + b"\x00\x00\x00\x00\x00\xff" + _SUBFIELD + \
+    b"\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+
+def make_virtual_offset(block_offset, within_block):
+    """
+    Combine offset of a block in the file and of a position within the
+    decompressed block, as used by htslib to seek in a BGZF file.
+
+    :param int block_offset: offset of the block's start in the file.
+    :param int within_block: offset within the decompressed block.
+    :return int: virtual file offset.
+    """
+    return (block_offset << 16) | within_block
+
+
+def compressed_offset(handle, virtual_offset):
+    """
+    Approximate the offset in the file of a virtual offset, by interpolation
+    within its block, for measuring amounts of data between virtual offsets.
+
+    :param file handle: binary file object.
+    :param int virtual_offset: virtual offset, e.g. from tell() of a reads
+        file.
+    :return float: offset of the block in the file, plus the fraction of
+        the block's compressed size that precedes the virtual offset.
+    """
+    block_offset, within_block = virtual_offset >> 16, virtual_offset & 0xFFFF
+    handle.seek(block_offset)
+    header = handle.read(_HEADER_SIZE)
+    if not within_block or not _is_block_header(header):
+        return float(block_offset)
+    size = _block_size(header)
+    # A block ends with the size of its decompressed data.
+    handle.seek(block_offset + size - 4)
+    data_size = struct.unpack("<I", handle.read(4))[0]
+    return block_offset + float(size) * within_block / max(data_size, 1)
+
+
+def _is_block_header(header):
+    return len(header) >= _HEADER_SIZE and header.startswith(_MAGIC) and \
+        header[10:16] == _SUBFIELD
+
+
+def _block_size(header):
+    return struct.unpack("<H", header[16:18])[0] + 1
+
+
+def find_block_start(handle, offset):
+    """
+    Find the first block that starts at or after a byte offset.
+
+    A match for the header is confirmed by the header of the block that
+    it implies should follow, or by the end of the file.
+
+    :param file handle: binary file object positioned anywhere.
+    :param int offset: byte offset from which to search.
+    :return int | NoneType: offset of the block's start, or null if there's
+        no block after the given offset.
+    """
+    while True:
+        handle.seek(offset)
+        # Overlap successive windows by a header's length, so that a header
+        # straddling the boundary isn't missed.
+        window = handle.read(_SEARCH_SIZE + _HEADER_SIZE)
+        if len(window) < _HEADER_SIZE:
+            return None
+        i = window.find(_MAGIC)
+        while i != -1:
+            candidate = offset + i
+            handle.seek(candidate)
+            header = handle.read(_HEADER_SIZE)
+            if _is_block_header(header):
+                handle.seek(candidate + _block_size(header))
+                following = handle.read(_HEADER_SIZE)
+                if not following or _is_block_header(following):
+                    return candidate
+            i = window.find(_MAGIC, i + 1)
+        offset += _SEARCH_SIZE
+
+
+def read_block(handle, block_offset):
+    """
+    Read and decompress one block.
+
+    :param file handle: binary file object.
+    :param int block_offset: offset of the block's start.
+    :return (bytes, int): decompressed data of the block, and the size of
+        the compressed block (i.e., offset of the next block relative to
+        this one's); empty data and zero size at end of file.
+    """
+    handle.seek(block_offset)
+    header = handle.read(_HEADER_SIZE)
+    if not header:
+        return b"", 0
+    if not _is_block_header(header):
+        raise ValueError("No BGZF block at offset {}".format(block_offset))
+    size = _block_size(header)
+    # Deflated data, then CRC32 and uncompressed size (4 bytes each).
+    compressed = handle.read(size - _HEADER_SIZE)
+    return zlib.decompress(compressed[:-8], -15), size
+
+
+def _is_record(data, start, num_references):
+    """
+    Determine whether BAM record fields plausibly start at a position.
+
+    :return int | NoneType: offset of the following record if the fields
+        are plausible (possibly beyond the data), otherwise null.
+    """
+    if start + 4 + _RECORD_FIELDS.size > len(data):
+        return None
+    block_size = struct.unpack_from("<i", data, start)[0]
+    ref_id, pos, l_read_name, _, _, n_cigar_op, flag, l_seq, \
+        next_ref_id, next_pos, _ = _RECORD_FIELDS.unpack_from(data, start + 4)
+    if not (_RECORD_FIELDS.size <= block_size <= _MAX_RECORD_SIZE and
+            -1 <= ref_id < num_references and pos >= -1 and
+            -1 <= next_ref_id < num_references and next_pos >= -1 and
+            l_read_name > 1 and flag <= 0xFFF and l_seq >= 0):
+        return None
+    if _RECORD_FIELDS.size + l_read_name + 4 * n_cigar_op + \
+            (l_seq + 1) // 2 + l_seq > block_size:
+        return None
+    name_start = start + 4 + _RECORD_FIELDS.size
+    name = data[name_start:name_start + l_read_name]
+    if len(name) == l_read_name:
+        # Read names are printable characters other than '@', ending in NUL.
+        if name[-1:] != b"\x00" or \
+                any(c < 33 or c > 126 or c == 64
+                    for c in bytearray(name[:-1])):
+            return None
+    return start + 4 + block_size
+
+
+def find_record_start(handle, block_offset, num_references,
+                      records_to_confirm=3):
+    """
+    Find the first BAM record that starts within a block.
+
+    Candidate positions are checked for plausible record fields, and a
+    candidate is confirmed by the records that follow it, which are
+    sought in the subsequent blocks as needed.
+
+    :param file handle: binary file object for a BAM file.
+    :param int block_offset: offset of the start of the block.
+    :param int num_references: number of reference sequences in the header.
+    :param int records_to_confirm: number of consecutive plausible records
+        required for confirmation, when the data go on that far.
+    :return int | NoneType: virtual offset of the record, or null if no
+        record starts in the block.
+    """
+    data, size = read_block(handle, block_offset)
+    first_block_size = len(data)
+    # Enough following data to check successors of a record near the end.
+    next_offset = block_offset + size
+    while size and len(data) < first_block_size + 2 * _SEARCH_SIZE:
+        more, size = read_block(handle, next_offset)
+        data += more
+        next_offset += size
+    for start in range(first_block_size):
+        position, confirmed = start, 0
+        while confirmed < records_to_confirm:
+            following = _is_record(data, position, num_references)
+            if following is None:
+                break
+            confirmed += 1
+            if following >= len(data):
+                # The data end here, so there's nothing more to check.
+                confirmed = records_to_confirm
+                break
+            position = following
+        if confirmed == records_to_confirm or \
+                (confirmed and position == len(data)):
+            return make_virtual_offset(block_offset, start)
+    return None
+
+
+class BgzfWriter(object):
+    """
+    Compress data into BGZF blocks, tracking the virtual offset of what's
+    written, e.g. for indexing.
+    """
+
+    def __init__(self, handle, compresslevel=6):
+        """
+        :param file handle: binary file object to which to write blocks.
+        :param int compresslevel: zlib compression level.
+        """
+        self._handle = handle
+        self._compresslevel = compresslevel
+        self._buffer = bytearray()
+        self._block_offset = 0
+
+    def tell(self):
+        """
+        Determine the virtual offset at which the next data will be written,
+        relative to the first block written.
+
+        :return int: virtual offset.
+        """
+        return make_virtual_offset(self._block_offset, len(self._buffer))
+
+    def write(self, data):
+        """
+        Write data, compressing each block as it fills.
+
+        :param bytes data: data to write.
+        """
+        self._buffer.extend(data)
+        while len(self._buffer) >= BLOCK_DATA_SIZE:
+            self._write_block(bytes(self._buffer[:BLOCK_DATA_SIZE]))
+            del self._buffer[:BLOCK_DATA_SIZE]
+
+    def flush(self):
+        """ Compress whatever's buffered as a block. """
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer = bytearray()
+
+    def close(self, eof=True):
+        """
+        Finish writing; the underlying file is left open.
+
+        :param bool eof: whether to end with the end-of-file marker block;
+            omit it for a part of a file, to be concatenated with others.
+        """
+        self.flush()
+        if eof:
+            self._handle.write(EOF_BLOCK)
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self._compresslevel, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        size = _HEADER_SIZE + len(deflated) + 8
+        self._handle.write(
+                _MAGIC + b"\x00\x00\x00\x00\x00\xff" + _SUBFIELD +
+                struct.pack("<H", size - 1) + deflated +
+                struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data)))
+        self._block_offset += size
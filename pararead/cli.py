@@ -0,0 +1,325 @@
+"""
+Command-line runner for processor classes.
+
+Rather than a script per processor, each hand-rolling its options and the
+register_files(), run(), and combine() sequence, the pararead command loads
+a processor class by dotted path and exposes the knobs for tuning a job:
+
+    pararead mypackage.counts.MyCounter reads.bam -O counts.txt -C 8 \\
+        --regions targets.bed --retries 2 --profile counts.prof
+
+Further arguments to the processor's constructor are given as
+-P name=value, with the value parsed as JSON if possible. Options that
+aren't given are left to the processor, so that its own defaults (e.g., a
+pileup's windows, and output in order) hold. Once done, the time taken by
+each step, and the throughput, are printed.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+from timeit import default_timer
+
+from ._version import __version__
+from .logs import add_logging_options, logger_via_cli
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["build_parser", "load_processor_class", "main", "parse_params",
+           "summarize"]
+
+
+CHUNKING_MODES = ("chromosome", "name")
+# Ways to execute the processing of chunks: in a pool of worker processes,
+# or serially in this process.
+EXECUTORS = ("pool", "serial")
+
+# Argument of the processor's constructor for each option that's one.
+_PROCESSOR_OPTIONS = {
+    "temp_folder": "temp_folder_parent_path", "retain_temp": "retain_temp",
+    "limit": "limit", "regions": "regions", "window_size": "window_size",
+    "region_ownership": "region_ownership", "region_halo": "region_halo",
+    "intermediate_output_type": "intermediate_output_type",
+    "output_type": "output_type", "tabix": "tabix",
+    "index_type": "index_type"}
+# Argument of the processor's run() for each option that's one.
+_RUN_OPTIONS = {
+    "interleave_chunk_sizes": "interleave_chunk_sizes",
+    "retries": "retries", "retry_backoff": "retry_backoff",
+    "chunk_timeout": "chunk_timeout", "memory_budget": "memory_budget",
+    "ordered_output": "ordered_output", "profile": "profile"}
+
+
+def load_processor_class(path):
+    """
+    Import a processor class by its dotted path.
+
+    :param str path: dotted path to the class, e.g. 'package.module.Class',
+        or with a colon before the class name, e.g. 'package.module:Class'.
+    :return type: the processor class.
+    :raise ValueError: if the path doesn't name a class in a module, or the
+        class isn't a ParaReadProcessor.
+    """
+    from .processor import ParaReadProcessor
+    module_name, sep, class_name = path.rpartition(":" if ":" in path else ".")
+    if not module_name or not class_name:
+        raise ValueError("Not a dotted path to a class: '{}'".format(path))
+    try:
+        cls = getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError("Can't load processor class '{}': {}".format(path, e))
+    if not isinstance(cls, type) or not issubclass(cls, ParaReadProcessor):
+        raise ValueError("Not a ParaReadProcessor: '{}'".format(path))
+    return cls
+
+
+def parse_params(pairs):
+    """
+    Parse arguments for a processor's constructor.
+
+    :param Iterable[str] pairs: each argument, as 'name=value'; the value is
+        parsed as JSON if possible, and otherwise taken as text.
+    :return dict: value of each argument, by name.
+    :raise ValueError: if an argument isn't of the form 'name=value'.
+    """
+    params = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep or not name:
+            raise ValueError("Not of the form 'name=value': '{}'".format(pair))
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+def build_parser():
+    """
+    Define the command-line interface.
+
+    :return argparse.ArgumentParser: parser of the command's arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="pararead",
+        description="Run a processor of sequencing reads in parallel. "
+                    "Options not given take the processor's defaults.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-V", "--version", action="version",
+        version="%(prog)s {}".format(__version__))
+    parser.add_argument(
+        "processor", help="Dotted path to the processor class, e.g. "
+                          "'pararead.processors.ReadCounter'.")
+    parser.add_argument(
+        "readsfile", help="Path to sequencing reads file.")
+    parser.add_argument(
+        "-O", "--outfile", required=True, help="Path to output file.")
+    parser.add_argument(
+        "-C", "--cores", default=1,
+        help="Number of cores, or 'auto' to choose the cores, and chunks, "
+             "from those available, by calibration.")
+    parser.add_argument(
+        "-P", "--param", action="append", default=[], metavar="NAME=VALUE",
+        help="Further argument to the processor's constructor; repeatable.")
+    parser.add_argument(
+        "--temp-folder", default=argparse.SUPPRESS,
+        help="Folder in which to create the temporary folder; by default, "
+             "that of the output.")
+    parser.add_argument(
+        "--retain-temp", action="store_true", default=argparse.SUPPRESS,
+        help="Keep the temporary folder of chunks' output.")
+    parser.add_argument(
+        "--resume", action="store_true", default=False,
+        help="Skip the job if its output file already exists.")
+
+    chunking = parser.add_argument_group("chunking")
+    chunking.add_argument(
+        "--chunking", choices=CHUNKING_MODES, default=argparse.SUPPRESS,
+        help="Split reads by chromosome (or by regions or windows, if "
+             "given), or by name, for a file with records of a name "
+             "adjacent.")
+    chunking.add_argument(
+        "--limit", nargs="+", metavar="CHROMOSOME",
+        default=argparse.SUPPRESS,
+        help="Chromosomes to which to restrict processing.")
+    chunking.add_argument(
+        "--regions", default=argparse.SUPPRESS,
+        help="BED file of regions to which to restrict processing.")
+    chunking.add_argument(
+        "--window-size", type=int, default=argparse.SUPPRESS,
+        help="Number of base pairs per chunk, to split chromosomes (or "
+             "regions) into windows.")
+    chunking.add_argument(
+        "--region-ownership", choices=("overlap", "start"),
+        default=argparse.SUPPRESS,
+        help="Which chunk a read spanning chunks belongs to.")
+    chunking.add_argument(
+        "--region-halo", type=int, default=argparse.SUPPRESS,
+        help="Flanking base pairs around each region to also fetch.")
+    chunking.add_argument(
+        "--interleave-chunk-sizes", action="store_true",
+        default=argparse.SUPPRESS,
+        help="Interleave chunks by size, for even work per core.")
+
+    execution = parser.add_argument_group("execution")
+    execution.add_argument(
+        "--executor", choices=EXECUTORS, default=argparse.SUPPRESS,
+        help="Process chunks in a pool of worker processes, which enforces "
+             "the time limit even with one core, or serially in this "
+             "process; by default, serially only with one core.")
+    execution.add_argument(
+        "--retries", type=int, default=argparse.SUPPRESS,
+        help="Additional attempts for a chunk for which processing fails.")
+    execution.add_argument(
+        "--retry-backoff", type=float, default=argparse.SUPPRESS,
+        help="Seconds before retrying a failed chunk, doubling each time.")
+    execution.add_argument(
+        "--chunk-timeout", type=float, default=argparse.SUPPRESS,
+        help="Maximum seconds for processing of a chunk.")
+    execution.add_argument(
+        "--memory-budget", default=argparse.SUPPRESS,
+        help="Limit on the estimated memory of chunks processed at once, "
+             "in bytes or e.g. '8G'.")
+    ordering = execution.add_mutually_exclusive_group()
+    ordering.add_argument(
+        "--ordered-output", action="store_true", dest="ordered_output",
+        default=argparse.SUPPRESS,
+        help="Write the output in order while processing, not by combining.")
+    ordering.add_argument(
+        "--no-ordered-output", action="store_false", dest="ordered_output",
+        default=argparse.SUPPRESS,
+        help="Write the output by combining, even for a processor that "
+             "writes it in order by default.")
+    execution.add_argument(
+        "--profile", metavar="PATH", default=argparse.SUPPRESS,
+        help="Profile processing of chunks, merging the profiles into this "
+             "pstats file.")
+
+    output = parser.add_argument_group("output")
+    output.add_argument(
+        "--intermediate-output-type", default=argparse.SUPPRESS,
+        help="Type of each chunk's output, e.g. 'rec' for binary records.")
+    output.add_argument(
+        "--output-type", default=argparse.SUPPRESS,
+        help="Type of final output, e.g. 'parquet'.")
+    output.add_argument(
+        "--tabix", default=argparse.SUPPRESS,
+        help="Layout of output lines ('bed', 'gff', or 'vcf'), to compress "
+             "the output and index it for tabix.")
+    output.add_argument(
+        "--index-type", choices=("tbi", "csi"), default=argparse.SUPPRESS,
+        help="Type of index for output for tabix.")
+    output.add_argument(
+        "--strict", action="store_true", default=False,
+        help="Fail if a chunk's output is missing when combining.")
+
+    return add_logging_options(parser)
+
+
+def _processor_kwargs(opts):
+    """ Arguments for the processor's constructor, from options given. """
+    given = vars(opts)
+    kwargs = {"outfile": opts.outfile}
+    kwargs.update((name, given[dest]) for dest, name in
+                  _PROCESSOR_OPTIONS.items() if dest in given)
+    if "chunking" in given:
+        kwargs["by_name"] = opts.chunking == "name"
+    kwargs.update(parse_params(opts.param))
+    return kwargs
+
+
+def _run_kwargs(opts):
+    """ Arguments for the processor's run(), from options given. """
+    given = vars(opts)
+    kwargs = {name: given[dest] for dest, name in _RUN_OPTIONS.items()
+              if dest in given}
+    if "executor" in given:
+        kwargs["in_process"] = opts.executor == "serial"
+    return kwargs
+
+
+def _count_reads(processor):
+    """ Number of reads in the reads file, if its index tells; else null. """
+    try:
+        readsfile = processor.readsfile
+        return readsfile.mapped + readsfile.unmapped
+    except (AttributeError, ValueError):
+        return None
+
+
+def summarize(path_reads_file, num_chunks, num_reads, elapsed_by_step):
+    """
+    Describe the time taken by each step of a job, and its throughput.
+
+    :param str path_reads_file: path to the reads file processed.
+    :param int num_chunks: number of chunks processed successfully.
+    :param int num_reads: number of reads in the file, if known.
+    :param Sequence[(str, float)] elapsed_by_step: seconds taken by each
+        step, in order.
+    :return list[str]: lines of the summary.
+    """
+    total = sum(elapsed for _, elapsed in elapsed_by_step)
+    lines = ["Processed {} chunk(s) of '{}' in {:.2f}s".format(
+            num_chunks, path_reads_file, total)]
+    lines.extend("  {}: {:.2f}s".format(step, elapsed)
+                 for step, elapsed in elapsed_by_step)
+    if total > 0:
+        throughput = ["{:.1f} MB/s".format(
+                os.path.getsize(path_reads_file) / 1e6 / total)]
+        if num_reads is not None:
+            throughput.insert(0, "{:.0f} reads/s".format(num_reads / total))
+        lines.append("Throughput: {}".format(", ".join(throughput)))
+    return lines
+
+
+def main(cmdl=None):
+    """
+    Run a processor, per command-line arguments.
+
+    :param Sequence[str] cmdl: command-line arguments; by default, those
+        given to the program.
+    :return int: exit status: 0 if the job succeeded (or was already done),
+        1 if no chunk was processed successfully.
+    """
+    parser = build_parser()
+    opts = parser.parse_args(cmdl)
+    logger = logger_via_cli(opts)
+
+    if opts.resume and os.path.exists(opts.outfile):
+        logger.info("Output exists; skipping: '{}'".format(opts.outfile))
+        return 0
+    elapsed_by_step = []
+    start = default_timer()
+    try:
+        processor_class = load_processor_class(opts.processor)
+        processor = processor_class(opts.readsfile, cores=opts.cores,
+                                    **_processor_kwargs(opts))
+    except ValueError as e:
+        parser.error(str(e))
+    processor.register_files()
+    elapsed_by_step.append(("setup", default_timer() - start))
+
+    run_kwargs = _run_kwargs(opts)
+    start = default_timer()
+    good_chunks = processor.run(**run_kwargs)
+    elapsed_by_step.append(("run", default_timer() - start))
+
+    if not run_kwargs.get("ordered_output", processor.ordered_output):
+        start = default_timer()
+        processor.combine(good_chunks, strict=opts.strict)
+        elapsed_by_step.append(("combine", default_timer() - start))
+
+    for line in summarize(opts.readsfile, len(good_chunks),
+                          _count_reads(processor), elapsed_by_step):
+        print(line)
+    return 0 if good_chunks else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
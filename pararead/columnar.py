@@ -0,0 +1,169 @@
+"""
+Columnar final output (Parquet or Arrow IPC) assembled from chunks' tables.
+
+A worker stores its chunk's records as a table in an Arrow IPC file, and
+combine() assembles the chunks' tables into one columnar output without
+parsing anything: each chunk's file is memory-mapped, and its table becomes
+one row group of a Parquet file, or record batches of an Arrow IPC file, so
+a reader can load just the columns, or the chunks, that it needs. The chunk
+of each row group is recorded in the output's schema metadata.
+
+This requires pyarrow, which is imported only when columnar output is used.
+"""
+
+import json
+
+from .records import field_codes
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["combine_tables", "read_table", "read_table_records",
+           "table_schema", "write_table", "ARROW_OUTPUT_TYPE",
+           "CHUNKS_METADATA_KEY", "COLUMNAR_OUTPUT_TYPES",
+           "PARQUET_OUTPUT_TYPE"]
+
+
+ARROW_OUTPUT_TYPE = "arrow"
+PARQUET_OUTPUT_TYPE = "parquet"
+COLUMNAR_OUTPUT_TYPES = (ARROW_OUTPUT_TYPE, PARQUET_OUTPUT_TYPE)
+
+# Key of the schema metadata that lists the chunk of each row group.
+CHUNKS_METADATA_KEY = b"pararead.chunks"
+
+# Name of the pyarrow type factory for each record field code.
+_ARROW_TYPES = {"?": "bool_", "q": "int64", "d": "float64",
+                "s": "string", "y": "binary"}
+
+
+def _pyarrow():
+    """ Import pyarrow, explaining its absence. """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Columnar output requires pyarrow "
+                          "(pip install pyarrow)")
+    return pyarrow
+
+
+def table_schema(columns, field_types):
+    """
+    Determine the Arrow schema of a table of records.
+
+    :param Iterable[str] columns: name of each field.
+    :param Iterable[type | str] field_types: type of each field (bool, int,
+        float, str, or bytes), as for binary records.
+    :return pyarrow.Schema: schema for tables of the records.
+    :raise ImportError: if pyarrow isn't installed.
+    """
+    pa = _pyarrow()
+    columns = list(columns)
+    codes = field_codes(field_types)
+    if len(columns) != len(codes):
+        raise ValueError("{} column name(s) for {} field(s)".format(
+                len(columns), len(codes)))
+    return pa.schema([(name, getattr(pa, _ARROW_TYPES[code])())
+                      for name, code in zip(columns, codes)])
+
+
+def write_table(path, columns, field_types, records):
+    """
+    Write records as a table, to an Arrow IPC file.
+
+    :param str path: path to the file to write.
+    :param Iterable[str] columns: name of each field.
+    :param Iterable[type | str] field_types: type of each field.
+    :param Iterable[Sequence] records: records to write.
+    :return str: path to the file written.
+    :raise ImportError: if pyarrow isn't installed.
+    """
+    pa = _pyarrow()
+    schema = table_schema(columns, field_types)
+    values = [[] for _ in schema.names]
+    for record in records:
+        for column, value in zip(values, record):
+            column.append(value)
+    table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type)
+             for column, field in zip(values, schema)], schema=schema)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            writer.write_table(table)
+    return path
+
+
+def read_table(path):
+    """
+    Read a table from an Arrow IPC file, without copying its data.
+
+    :param str path: path to a file written by write_table().
+    :return pyarrow.Table: the table, backed by the memory-mapped file.
+    :raise ImportError: if pyarrow isn't installed.
+    """
+    pa = _pyarrow()
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def read_table_records(path):
+    """
+    Read the records of a table in an Arrow IPC file.
+
+    :param str path: path to a file written by write_table().
+    :return Iterable[tuple]: each record, as a tuple of field values.
+    :raise ImportError: if pyarrow isn't installed.
+    """
+    table = read_table(path)
+    return zip(*(column.to_pylist() for column in table.columns))
+
+
+def combine_tables(paths, outpath, output_type=PARQUET_OUTPUT_TYPE,
+                   chunks=None):
+    """
+    Assemble tables into one columnar file, with a row group per table.
+
+    :param Iterable[str] paths: paths to Arrow IPC files of tables with the
+        same schema, in order.
+    :param str outpath: path to the file to write.
+    :param str output_type: PARQUET_OUTPUT_TYPE or ARROW_OUTPUT_TYPE.
+    :param Iterable[str] chunks: chunk of each table, recorded (for tables
+        with rows) in the output's schema metadata under CHUNKS_METADATA_KEY.
+    :return str: path to the file written.
+    :raise ValueError: if the output type isn't columnar, if there are no
+        tables, or if a table's schema differs from that of the first.
+    :raise ImportError: if pyarrow isn't installed.
+    """
+    if output_type not in COLUMNAR_OUTPUT_TYPES:
+        raise ValueError("Unsupported columnar output type: '{}'; choose "
+                         "from: {}".format(output_type, COLUMNAR_OUTPUT_TYPES))
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No tables to combine")
+    pa = _pyarrow()
+    tables = [read_table(path) for path in paths]
+    schema = tables[0].schema
+    for path, table in zip(paths, tables):
+        if not table.schema.equals(schema):
+            raise ValueError("Schema of '{}' differs from that of '{}'".
+                             format(path, paths[0]))
+    # Empty tables make no row groups, so aren't recorded either.
+    nonempty = [i for i, table in enumerate(tables) if table.num_rows]
+    if chunks is not None:
+        chunks = [str(c) for c in chunks]
+        schema = schema.with_metadata({CHUNKS_METADATA_KEY: json.dumps(
+                [chunks[i] for i in nonempty]).encode("utf-8")})
+    tables = [tables[i].replace_schema_metadata(schema.metadata)
+              for i in nonempty]
+    if output_type == PARQUET_OUTPUT_TYPE:
+        import pyarrow.parquet as pq
+        with pq.ParquetWriter(outpath, schema) as writer:
+            for table in tables:
+                writer.write_table(table, row_group_size=table.num_rows)
+    else:
+        with pa.OSFile(outpath, 'wb') as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                for table in tables:
+                    writer.write_table(table)
+    return outpath
@@ -62,6 +62,22 @@ class MissingOutputFileException(Exception):
 
 
 
+class PipelineStageException(Exception):
+    """ A stage handling chunk outputs failed. """
+    def __init__(self, stage_name, error):
+        reason = "Pipeline stage '{}' failed: {}".format(stage_name, error)
+        super(PipelineStageException, self).__init__(reason)
+
+
+
+class RecordFormatException(Exception):
+    """ A file of binary records is malformed. """
+    def __init__(self, path, problem):
+        reason = "Bad file of records: '{}' ({})".format(path, problem)
+        super(RecordFormatException, self).__init__(reason)
+
+
+
 class UnknownChromosomeException(Exception):
     """ Represent case in which data about a chromosome is not available. """
     def __init__(self, requested, known=None):
@@ -0,0 +1,376 @@
+""" Fault-tolerant execution of per-chunk work across worker processes. """
+
+from collections import namedtuple
+import itertools
+import logging
+import os
+import signal
+import threading
+import time
+import traceback
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["ChunkExecutor", "ChunkFailure", "PoolSession"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Signal used to stop a worker that has exceeded the per-chunk time limit.
+_KILL_SIGNAL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+# Set in each pool worker by the initializer; workers announce the start
+# of each attempt on it so that the parent knows which process to watch.
+_STARTED_QUEUE = None
+
+# Set in each pool worker by the initializer: the per-chunk function, sent
+# to the worker once rather than with each chunk, as a processor may carry
+# large state (e.g., annotation tables).
+_WORKER_FUNC = None
+
+
+ChunkFailure = namedtuple("ChunkFailure",
+                          field_names=["chunk", "attempts", "error"])
+
+
+class _Attempt(object):
+    """ Bookkeeping for one submission of one chunk to the worker pool. """
+
+    def __init__(self, chunk, number, pending_result, cost=0):
+        self.chunk = chunk
+        self.number = number
+        self.cost = cost
+        self.pending_result = pending_result
+        self.submitted = time.time()
+        self.started = None
+        self.pid = None
+
+
+def _init_worker(started_queue, func):
+    """
+    Pool initializer: hold on to the attempt start notification queue, and
+    to the per-chunk function.
+    """
+    global _STARTED_QUEUE, _WORKER_FUNC
+    _STARTED_QUEUE = started_queue
+    _WORKER_FUNC = func
+
+
+def _run_chunk(chunk, attempt_id):
+    """
+    Worker-side wrapper around the processing of a single chunk.
+
+    Any exception is caught and returned as formatted text so that one bad
+    chunk cannot take down the whole map, and so that exception types that
+    don't survive pickling still get reported faithfully. The function to
+    apply is the one given to the worker when it started, so a task carries
+    only the chunk.
+
+    :param object chunk: key/descriptor of the reads chunk to process.
+    :param int attempt_id: identifier of this submission.
+    :return (bool, object): flag indicating success, and either the result
+        of the call or the formatted traceback of the error it raised.
+    """
+    if _STARTED_QUEUE is not None:
+        _STARTED_QUEUE.put((attempt_id, os.getpid()))
+    try:
+        return True, _WORKER_FUNC(chunk)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+class ChunkExecutor(object):
+    """
+    Apply a function to each chunk, isolating failures between chunks.
+
+    A chunk whose processing raises an exception, exceeds the time limit,
+    or whose worker process dies (e.g., OOM kill or segfault) is retried
+    with exponential backoff. Once its attempts are exhausted it's recorded
+    in the failures mapping and reported with a null result, which is the
+    same signal used for chunks that a processor declares as failed. The
+    pool itself replaces dead workers, so the job carries on.
+
+    Given a memory budget and an estimate of each chunk's memory cost,
+    chunks are admitted to the pool only while the estimated total for
+    those in flight stays within budget. A chunk that doesn't fit is passed
+    over in favor of lighter ones that do, so that workers don't sit idle.
+    """
+
+    def __init__(self, func, cores, retries=0, retry_backoff=1.0,
+                 timeout=None, memory_budget=None, chunk_cost=None,
+                 in_process=None, poll_interval=0.1):
+        """
+        :param callable func: function to apply to each chunk.
+        :param int cores: number of worker processes.
+        :param int retries: number of additional attempts for a chunk after
+            its first one fails.
+        :param float retry_backoff: seconds to wait before the first retry;
+            the wait doubles with each subsequent attempt.
+        :param float timeout: maximum number of seconds for a single attempt
+            to process a chunk; unlimited if unspecified.
+        :param int memory_budget: maximum total estimated memory cost of the
+            chunks being processed at once; unlimited if unspecified.
+        :param callable | Mapping chunk_cost: estimated memory cost of each
+            chunk, in the units of the budget, as function of or mapping from
+            chunk; required for the budget to have an effect.
+        :param bool in_process: whether to process chunks serially in this
+            process rather than in a worker pool, in which case the time limit
+            can't be enforced; by default, do so only with a single core.
+        :param float poll_interval: maximum number of seconds between checks
+            on the state of the workers.
+        """
+        self.func = func
+        self.cores = int(cores)
+        self.retries = max(int(retries or 0), 0)
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.memory_budget = memory_budget
+        self.chunk_cost = chunk_cost
+        self.in_process = self.cores == 1 if in_process is None else in_process
+        self.poll_interval = poll_interval
+        self.failures = {}
+
+    def imap(self, chunks):
+        """
+        Process each chunk, yielding results in order of completion.
+
+        :param Iterable chunks: keys/descriptors of the chunks to process.
+        :return Iterable[(object, object)]: pairs of chunk and result; the
+            result is null for a chunk that ultimately failed.
+        """
+        self.failures = {}
+        if self.in_process:
+            return self._imap_serial(chunks)
+        return self._imap_pool(chunks)
+
+    def _cost(self, chunk):
+        """ Estimated memory cost of processing the given chunk. """
+        if self.chunk_cost is None:
+            return 0
+        if callable(self.chunk_cost):
+            return self.chunk_cost(chunk)
+        return self.chunk_cost.get(chunk, 0)
+
+    def _admissible(self, cost, running):
+        """ Determine whether a chunk's cost fits within the budget. """
+        if self.memory_budget is None or not running:
+            # An expensive chunk eventually runs alone rather than never.
+            return True
+        in_flight = sum(attempt.cost for attempt in running.values())
+        return in_flight + cost <= self.memory_budget
+
+    def _backoff_delay(self, attempt_number):
+        return self.retry_backoff * 2 ** (attempt_number - 1)
+
+    def _fail(self, chunk, attempt_number, error):
+        """
+        Record a failed attempt, logging it; return whether to try again.
+        """
+        _LOGGER.warning("Attempt %d of %d failed for reads chunk '%s': %s",
+                        attempt_number, self.retries + 1, chunk, error)
+        if attempt_number <= self.retries:
+            return True
+        _LOGGER.error("Giving up on reads chunk '%s' after %d attempt(s)",
+                      chunk, attempt_number)
+        self.failures[chunk] = ChunkFailure(chunk, attempt_number, error)
+        return False
+
+    def _imap_serial(self, chunks):
+        for chunk in chunks:
+            attempt_number = 0
+            while True:
+                attempt_number += 1
+                try:
+                    result = self.func(chunk)
+                except Exception:
+                    if self._fail(chunk, attempt_number,
+                                  traceback.format_exc()):
+                        time.sleep(self._backoff_delay(attempt_number))
+                        continue
+                    result = None
+                yield chunk, result
+                break
+
+    def session(self, chunks):
+        """
+        Begin processing of chunks by a worker pool, to be driven by polling.
+
+        This affords control of the processing loop, e.g. for driving it
+        from an event loop; imap() is the simpler choice otherwise.
+
+        :param Iterable chunks: keys/descriptors of the chunks to process.
+        :return pararead.execution.PoolSession: the processing underway.
+        """
+        self.failures = {}
+        return PoolSession(self, chunks)
+
+    def _imap_pool(self, chunks):
+        session = PoolSession(self, chunks)
+        try:
+            while not session.done:
+                for chunk, result in session.poll():
+                    yield chunk, result
+                session.wait()
+        finally:
+            session.close()
+
+
+class PoolSession(object):
+    """
+    Processing of a collection of chunks by a pool of worker processes.
+
+    Each call to poll() submits whatever chunks may now be submitted and
+    collects whatever attempts have finished or failed; the session is done
+    once every chunk has a result.
+    """
+
+    def __init__(self, executor, chunks):
+        """
+        :param pararead.execution.ChunkExecutor executor: the settings and
+            function for processing the chunks.
+        :param Iterable chunks: keys/descriptors of the chunks to process.
+        """
+        self.executor = executor
+        # Queue of (chunk, attempt number, earliest submission time).
+        self._waiting = [(c, 1, 0) for c in chunks]
+        self._cost_by_chunk = {c: executor._cost(c) for c, _, _ in self._waiting}
+        budget = executor.memory_budget
+        if budget is not None:
+            too_costly = [c for c, cost in self._cost_by_chunk.items()
+                          if cost > budget]
+            if too_costly:
+                _LOGGER.warning(
+                        "Estimated memory cost exceeds budget (%s) for "
+                        "%d chunk(s), which will run alone: %s",
+                        budget, len(too_costly), too_costly)
+        # Imported here, as only a run with workers needs it, and importing
+        # it is a large share of the time it takes to import this package.
+        import multiprocessing
+        self._running = {}
+        self._attempt_ids = itertools.count(1)
+        self._processes = {}
+        # Unlike a Queue, this writes synchronously, so a notification isn't
+        # lost if the worker dies right after sending it.
+        self._started_queue = multiprocessing.SimpleQueue()
+        self._wakeup = threading.Event()
+        # The function goes to each worker once, as it starts; with the fork
+        # start method, it's inherited rather than pickled at all.
+        self._workers = multiprocessing.Pool(
+                executor.cores, initializer=_init_worker,
+                initargs=(self._started_queue, executor.func))
+
+    @property
+    def done(self):
+        return not (self._waiting or self._running)
+
+    def wait(self, timeout=None):
+        """
+        Block until an attempt may have finished, or a timeout elapses.
+
+        :param float timeout: maximum number of seconds to wait; by default,
+            the executor's polling interval.
+        """
+        self._wakeup.wait(timeout or self.executor.poll_interval)
+        self._wakeup.clear()
+
+    def close(self):
+        """ Stop the workers, abandoning any chunks still in progress. """
+        if self._workers is not None:
+            self._workers.terminate()
+            self._workers.join()
+            self._workers = None
+
+    def poll(self):
+        """
+        Submit chunks as possible, and collect results of finished chunks.
+
+        :return list[(object, object)]: pairs of chunk and result for chunks
+            that have finished, with a null result for each chunk that has
+            failed and exhausted its attempts.
+        """
+        executor = self.executor
+        running = self._running
+        finished = []
+        now = time.time()
+
+        # Keep at most one attempt per worker in flight, so that an
+        # attempt's clock starts when it's actually being worked on.
+        for item in list(self._waiting):
+            if len(running) >= executor.cores:
+                break
+            chunk, number, not_before = item
+            cost = self._cost_by_chunk[chunk]
+            if not_before > now or not executor._admissible(cost, running):
+                continue
+            self._waiting.remove(item)
+            attempt_id = next(self._attempt_ids)
+            pending = self._workers.apply_async(
+                    _run_chunk, (chunk, attempt_id),
+                    callback=self._notify, error_callback=self._notify)
+            running[attempt_id] = _Attempt(chunk, number, pending, cost=cost)
+
+        import multiprocessing
+        self._update_started()
+        for proc in multiprocessing.active_children():
+            self._processes[proc.pid] = proc
+
+        for attempt_id, attempt in list(running.items()):
+            if attempt.pending_result.ready():
+                del running[attempt_id]
+                try:
+                    success, value = attempt.pending_result.get()
+                except Exception as e:
+                    # E.g., a result that can't be pickled.
+                    success, value = False, repr(e)
+                if success:
+                    finished.append((attempt.chunk, value))
+                    continue
+                error = value
+            elif attempt.pid is not None and not self._is_alive(attempt.pid):
+                proc = self._processes.get(attempt.pid)
+                error = "worker process {} died (exit code {})".\
+                        format(attempt.pid, proc and proc.exitcode)
+            elif executor.timeout and attempt.started and \
+                    time.time() - attempt.started > executor.timeout:
+                error = "timed out after {} seconds".format(executor.timeout)
+                try:
+                    os.kill(attempt.pid, _KILL_SIGNAL)
+                except OSError:
+                    pass
+            else:
+                continue
+
+            # The attempt failed; a late result, if any, is ignored.
+            running.pop(attempt_id, None)
+            if executor._fail(attempt.chunk, attempt.number, error):
+                self._waiting.append((
+                    attempt.chunk, attempt.number + 1,
+                    time.time() + executor._backoff_delay(attempt.number)))
+            else:
+                finished.append((attempt.chunk, None))
+
+        return finished
+
+    def _notify(self, _):
+        self._wakeup.set()
+
+    def _is_alive(self, pid):
+        try:
+            return self._processes[pid].is_alive()
+        except KeyError:
+            # Replaced and reaped between checks.
+            return False
+
+    def _update_started(self):
+        """ Attach worker process ID and start time to running attempts. """
+        while not self._started_queue.empty():
+            attempt_id, pid = self._started_queue.get()
+            try:
+                attempt = self._running[attempt_id]
+            except KeyError:
+                continue
+            attempt.pid = pid
+            attempt.started = time.time()
@@ -0,0 +1,147 @@
+""" Declarative filtering of sequencing reads, applied as reads are fetched. """
+
+import sys
+if sys.version_info < (3, 0):
+    from itertools import ifilter as _filter
+else:
+    _filter = filter
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["ReadFilter", "FLAG_DUPLICATE", "FLAG_PAIRED", "FLAG_PROPER_PAIR",
+           "FLAG_QC_FAIL", "FLAG_READ1", "FLAG_SECONDARY",
+           "FLAG_SUPPLEMENTARY", "FLAG_UNMAPPED", "DEFAULT_EXCLUDED_FLAGS"]
+
+
+FLAG_PAIRED = 0x1
+FLAG_PROPER_PAIR = 0x2
+FLAG_UNMAPPED = 0x4
+FLAG_READ1 = 0x40
+FLAG_SECONDARY = 0x100
+FLAG_QC_FAIL = 0x200
+FLAG_DUPLICATE = 0x400
+FLAG_SUPPLEMENTARY = 0x800
+
+# Reads that are commonly excluded from analysis, as by samtools' defaults.
+DEFAULT_EXCLUDED_FLAGS = \
+    FLAG_UNMAPPED | FLAG_SECONDARY | FLAG_QC_FAIL | FLAG_DUPLICATE
+
+
+class ReadFilter(object):
+    """
+    Criteria that reads must meet: flag bits, mapping quality, and tags.
+
+    The criteria are compiled into a single predicate, specialized to those
+    given, so that the check for each read is as cheap as possible: all
+    flag requirements and exclusions are checked by one masked comparison,
+    and criteria that aren't used cost nothing. Without criteria, reads
+    pass through untouched.
+    """
+
+    def __init__(self, flag_required=0, flag_excluded=0, min_mapq=0,
+                 tags=None):
+        """
+        :param int flag_required: bits that must all be set in a read's flag.
+        :param int flag_excluded: bits that must all be unset.
+        :param int min_mapq: minimum mapping quality.
+        :param Mapping[str, object | callable] tags: for each tag, the value
+            that a read must have, or a function of the value determining
+            whether the read passes; a read without the tag fails. As a
+            filter goes to worker processes with its processor, a function
+            must be picklable, e.g. defined at module level.
+        :raise ValueError: if a flag bit is both required and excluded.
+        """
+        if flag_required & flag_excluded:
+            raise ValueError(
+                "Flag bit(s) both required and excluded: {}".format(
+                    hex(flag_required & flag_excluded)))
+        self.flag_required = flag_required
+        self.flag_excluded = flag_excluded
+        self.min_mapq = min_mapq
+        self.tags = dict(tags or {})
+        self._predicate = self._compile()
+
+    def __getstate__(self):
+        # The compiled predicate is a closure, which can't be pickled.
+        state = dict(self.__dict__)
+        del state["_predicate"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._predicate = self._compile()
+
+    def __bool__(self):
+        return self._predicate is not None
+
+    __nonzero__ = __bool__
+
+    def __call__(self, read):
+        """
+        Determine whether a read meets the criteria.
+
+        :param pysam.AlignedSegment read: read to check.
+        :return bool: whether the read passes.
+        """
+        return self._predicate is None or self._predicate(read)
+
+    def __repr__(self):
+        return "{}(flag_required={}, flag_excluded={}, min_mapq={}, " \
+               "tags={})".format(self.__class__.__name__,
+                                 hex(self.flag_required),
+                                 hex(self.flag_excluded),
+                                 self.min_mapq, self.tags)
+
+    def filter(self, reads):
+        """
+        Select the reads that meet the criteria.
+
+        :param Iterable[pysam.AlignedSegment] reads: reads to filter.
+        :return Iterable[pysam.AlignedSegment]: reads that pass.
+        """
+        if self._predicate is None:
+            return reads
+        # Looping in filter() rather than a generator keeps the only
+        # interpreted code the predicate itself.
+        return _filter(self._predicate, reads)
+
+    def _compile(self):
+        """ Build the cheapest predicate that checks the criteria. """
+        required = self.flag_required
+        mask = self.flag_required | self.flag_excluded
+        min_mapq = self.min_mapq
+        tag_checks = [(t, c if callable(c) else _equals(c))
+                      for t, c in self.tags.items()]
+
+        if mask and min_mapq:
+            base = lambda r: r.flag & mask == required and \
+                r.mapping_quality >= min_mapq
+        elif mask:
+            base = lambda r: r.flag & mask == required
+        elif min_mapq:
+            base = lambda r: r.mapping_quality >= min_mapq
+        else:
+            base = None
+        if not tag_checks:
+            return base
+
+        def passes_tags(read):
+            for tag, check in tag_checks:
+                try:
+                    value = read.get_tag(tag)
+                except KeyError:
+                    return False
+                if not check(value):
+                    return False
+            return True
+
+        if base is None:
+            return passes_tags
+        return lambda r: base(r) and passes_tags(r)
+
+
+def _equals(expected):
+    """ Make a check for a tag value equal to that given. """
+    return lambda value: value == expected
@@ -0,0 +1,254 @@
+"""
+Demultiplexing of reads by group (e.g., read group or sample) in one pass.
+
+Rather than a filtered pass over the reads file for each group, each worker
+sorts the reads of its chunk into buffers by the value of a tag (RG by
+default), appending each group's output to a file of its own for the chunk
+when the buffers fill. Each chunk's ordinary output lists the groups it
+produced output for, and combine() gathers each group's output across
+chunks into one file per group.
+"""
+
+import abc
+import logging
+import os
+import re
+
+from .processor import ParaReadProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["GroupedProcessor", "ReadGroupSplitter", "group_ids"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of lines of output held across a chunk's groups before writing.
+DEFAULT_GROUP_BUFFER_SIZE = 10 ** 4
+
+
+def group_ids(readsfile):
+    """
+    Get the IDs of the read groups declared in a reads file's header.
+
+    :param pysam.AlignmentFile readsfile: reads file.
+    :return list[str]: ID of each @RG line, in header order.
+    """
+    return [rg["ID"] for rg in readsfile.header.to_dict().get("RG", [])]
+
+
+def _file_safe(group):
+    """ Make a group's value usable in a file name. """
+    return re.sub(r"[^\w.-]", "_", str(group))
+
+
+class GroupedProcessor(ParaReadProcessor):
+    """
+    Base for processors of reads with output for each group of reads.
+
+    A concrete implementation defines process_read(), which produces rows
+    of output for a read; those rows go to the output of the read's group,
+    the value of its group_tag. The per-group outputs are written by
+    combine() to files named for the output file and the group (see
+    group_outfile()), while the output file itself lists each group with
+    the path to its output.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    # Tag whose value determines a read's group.
+    group_tag = "RG"
+    # Group for reads without the tag; null to leave them out.
+    untagged_group = None
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param str group_tag: tag whose value determines a read's group;
+            by default, that declared by the class attribute group_tag.
+        :param int buffer_size: number of lines of output to hold across a
+            chunk's groups before writing them; default
+            DEFAULT_GROUP_BUFFER_SIZE.
+        """
+        self.group_tag = kwargs.pop("group_tag", self.group_tag)
+        self.buffer_size = kwargs.pop(
+                "buffer_size", DEFAULT_GROUP_BUFFER_SIZE)
+        super(GroupedProcessor, self).__init__(*args, **kwargs)
+
+    @abc.abstractmethod
+    def process_read(self, read):
+        """
+        Process a read.
+
+        :param pysam.AlignedSegment read: read to process.
+        :return Iterable[Iterable]: rows of output fields for the read's
+            group, which are written tab-separated.
+        """
+        pass
+
+    def __call__(self, chunk):
+        buffers, num_buffered, groups = {}, 0, []
+        # Groups whose files this attempt has written; others start anew,
+        # leaving nothing of a failed attempt at the chunk.
+        started = set()
+        for read in self.fetch_chunk(chunk):
+            group = self.group_of(read)
+            if group is None:
+                continue
+            lines = ["\t".join(str(field) for field in row) + "\n"
+                     for row in self.process_read(read)]
+            if not lines:
+                continue
+            try:
+                buffers[group].extend(lines)
+            except KeyError:
+                buffers[group] = lines
+                if group not in groups:
+                    groups.append(group)
+            num_buffered += len(lines)
+            if num_buffered >= self.buffer_size:
+                self._flush(chunk, buffers, started)
+                buffers, num_buffered = {}, 0
+        self._flush(chunk, buffers, started)
+        # The chunk's own output records the groups it has output for.
+        with open(self._tempf(chunk), 'w') as manifest:
+            for group in groups:
+                manifest.write("{}\n".format(group))
+        return chunk
+
+    def group_of(self, read):
+        """
+        Determine the group of a read.
+
+        :param pysam.AlignedSegment read: read to assign to a group.
+        :return str | NoneType: value of the read's group tag, or else the
+            untagged group.
+        """
+        try:
+            return str(read.get_tag(self.group_tag))
+        except KeyError:
+            return self.untagged_group
+
+    def group_file(self, chunk, group):
+        """
+        Path to the output of a group for a chunk.
+
+        :param str | pararead.regions.RegionChunk chunk: chunk of reads.
+        :param str group: group of reads.
+        :return str: path to the chunk's output for the group.
+        """
+        return os.path.join(self.temp_folder, "{}.group_{}.{}".format(
+                chunk, _file_safe(group), self.intermediate_output_type))
+
+    def group_outfile(self, group):
+        """
+        Path to the final output of a group.
+
+        :param str group: group of reads.
+        :return str: output file path, with the group before the extension.
+        """
+        base, ext = os.path.splitext(self.outfile)
+        return "{}.{}{}".format(base, _file_safe(group), ext)
+
+    def combine(self, good_chromosomes, strict=False, chrom_sep=None):
+        """
+        Gather each group's output across chunks into a file of its own.
+
+        :param Iterable[str] good_chromosomes: identifier (e.g., chromosome)
+            for each chunk of reads processed.
+        :param bool strict: whether to throw an exception upon encountering a
+            missing file rather than logging a warning and skipping it.
+        :param str chrom_sep: delimiter to write between chunks' output
+            within each group's file.
+        :return Iterable[str]: path to each file successfully combined.
+        """
+        if not good_chromosomes:
+            _LOGGER.warning("No successful chromosomes, so no combining.")
+            return
+        self._check_chunks_of_interest(good_chromosomes)
+        chunks_by_group, paths = {}, []
+        for chunk, manifest in self._chunk_outputs(good_chromosomes, strict):
+            with open(manifest, 'r') as f:
+                for group in f.read().splitlines():
+                    chunks_by_group.setdefault(group, []).append(chunk)
+        groups = self.order_groups(chunks_by_group.keys())
+        _LOGGER.info("Merging output of %d group(s)", len(groups))
+        with open(self.outfile, 'w') as index:
+            for group in groups:
+                outpath = self.group_outfile(group)
+                with open(outpath, 'w') as outfile:
+                    self.write_group_header(outfile, group)
+                    for chunk in chunks_by_group[group]:
+                        path = self.group_file(chunk, group)
+                        with open(path, 'r') as f:
+                            for line in f:
+                                outfile.write(line)
+                        if chrom_sep:
+                            outfile.write(chrom_sep)
+                        paths.append(path)
+                index.write("{}\t{}\n".format(group, outpath))
+        return paths
+
+    def order_groups(self, groups):
+        """
+        Order the groups for output.
+
+        :param Iterable[str] groups: groups with output.
+        :return list[str]: groups, with read groups declared in the header
+            first, in header order, then the rest sorted.
+        """
+        declared = group_ids(self.readsfile) if self.group_tag == "RG" \
+            else []
+        groups = set(groups)
+        return [g for g in declared if g in groups] + \
+            sorted(groups.difference(declared))
+
+    def write_group_header(self, outfile, group):
+        """
+        Write anything that precedes a group's output; nothing by default.
+
+        :param file outfile: handle on the group's output file.
+        :param str group: group whose output is to be written.
+        """
+        pass
+
+    def _flush(self, chunk, buffers, started):
+        """
+        Write each group's buffered output to its file for the chunk,
+        appending to the file if this attempt at the chunk started it.
+        """
+        for group, lines in buffers.items():
+            mode = 'a' if group in started else 'w'
+            with open(self.group_file(chunk, group), mode) as f:
+                f.writelines(lines)
+            started.add(group)
+
+    def _prepare_run(self, ordered_output=False, **kwargs):
+        if ordered_output:
+            raise ValueError("Output by group can't be written in order "
+                             "while processing; use combine()")
+        return super(GroupedProcessor, self)._prepare_run(**kwargs)
+
+
+class ReadGroupSplitter(GroupedProcessor):
+    """
+    Split reads into a SAM file per group, each with the header of the reads
+    file, less the @RG lines of other read groups.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("intermediate_output_type", "sam")
+        super(ReadGroupSplitter, self).__init__(*args, **kwargs)
+
+    def process_read(self, read):
+        yield (read.to_string(), )
+
+    def write_group_header(self, outfile, group):
+        # Deferred, as is pysam's import throughout the package's core.
+        from pysam import AlignmentHeader
+        header = self.readsfile.header.to_dict()
+        if self.group_tag == "RG" and "RG" in header:
+            header["RG"] = [rg for rg in header["RG"] if rg["ID"] == group]
+        outfile.write(str(AlignmentHeader.from_dict(header)))
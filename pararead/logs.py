@@ -1,6 +1,5 @@
 """ Package logging functions and constants. """
 
-import argparse
 import logging
 import os
 import sys
@@ -0,0 +1,245 @@
+"""
+Processing of paired-end reads by fragment, i.e. with both mates together.
+
+Within a chunk, each read waits in a buffer until its mate turns up. Reads
+whose mates belong to another chunk (e.g., a different chromosome or
+window) are left over once the chunk is done; the worker writes them out,
+and a reconciliation stage in the parent pairs them up as chunks finish,
+so that no second pass over the reads is needed.
+"""
+
+import abc
+import logging
+import os
+
+from .filters import DEFAULT_EXCLUDED_FLAGS, FLAG_PAIRED, FLAG_SUPPLEMENTARY
+from .pipeline import Pipeline, PipelineStage
+from .processor import ParaReadProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["FragmentProcessor", "FragmentWriter", "MateBuffer",
+           "MateReconciler", "pair_orientation"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Name (without extension) of the file of fragments paired by reconciliation.
+RECONCILED_MATES_NAME = "reconciled_mates"
+
+
+def pair_orientation(read1, read2):
+    """
+    Determine the relative orientation of a pair of mates.
+
+    :param pysam.AlignedSegment read1: one mate.
+    :param pysam.AlignedSegment read2: the other mate.
+    :return str: strand of the leftmost mate then of the other mate, as 'F'
+        for forward and 'R' for reverse, e.g. 'FR' for a typical pair; for
+        mates on different chromosomes, first mate then second mate.
+    """
+    if read1.reference_id == read2.reference_id and \
+            read2.reference_start < read1.reference_start:
+        read1, read2 = read2, read1
+    return "".join("R" if r.is_reverse else "F" for r in (read1, read2))
+
+
+class MateBuffer(object):
+    """ Hold reads until their mates arrive. """
+
+    def __init__(self):
+        self.waiting = {}
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def add(self, read):
+        """
+        Take a read, pairing it with its mate if that's already here.
+
+        :param pysam.AlignedSegment read: primary alignment of a paired read.
+        :return NoneType | (pysam.AlignedSegment, pysam.AlignedSegment): null
+            if the read's mate hasn't arrived, otherwise first mate and
+            second mate.
+        """
+        mate = self.waiting.pop(read.query_name, None)
+        if mate is None:
+            self.waiting[read.query_name] = read
+            return None
+        return (mate, read) if mate.is_read1 else (read, mate)
+
+    def drain(self):
+        """
+        Give up the reads still waiting for their mates.
+
+        :return list[pysam.AlignedSegment]: reads left without a mate.
+        """
+        reads = list(self.waiting.values())
+        self.waiting = {}
+        return reads
+
+
+class FragmentProcessor(ParaReadProcessor):
+    """
+    Base for processors of fragments, i.e. pairs of mates.
+
+    A concrete implementation defines process_fragment(), which produces
+    rows of output for a pair of mates. Pairs whose mates are in different
+    chunks are processed in the parent process as chunks finish, and the
+    rows for those are added to the output by combine(), so output can't be
+    written in order while processing. Only primary
+    alignments of mapped reads in pairs are considered; reads whose mates
+    never turn up (e.g., unmapped or filtered out) are ignored.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    flag_required = FLAG_PAIRED
+    flag_excluded = DEFAULT_EXCLUDED_FLAGS | FLAG_SUPPLEMENTARY
+
+    @abc.abstractmethod
+    def process_fragment(self, read1, read2):
+        """
+        Process a fragment.
+
+        :param pysam.AlignedSegment read1: first mate.
+        :param pysam.AlignedSegment read2: second mate.
+        :return Iterable[Iterable]: rows of output fields, which are written
+            tab-separated.
+        """
+        pass
+
+    def __call__(self, chunk):
+        mates = MateBuffer()
+        with open(self._tempf(chunk), 'w') as out:
+            for read in self.fetch_chunk(chunk):
+                pair = mates.add(read)
+                if pair is not None:
+                    _write_rows(out, self.process_fragment(*pair))
+        with open(self.mates_file(chunk), 'w') as leftovers:
+            for read in mates.drain():
+                if not read.mate_is_unmapped:
+                    leftovers.write(read.to_string() + "\n")
+        return chunk
+
+    def mates_file(self, chunk):
+        """
+        Path to the file of reads of a chunk whose mates weren't found.
+
+        :param str | pararead.regions.RegionChunk chunk: chunk of reads.
+        :return str: path to the chunk's file of unpaired reads, as SAM.
+        """
+        return os.path.join(self.temp_folder, "{}.mates.sam".format(chunk))
+
+    @property
+    def reconciled_file(self):
+        """ Path to the output for fragments paired by reconciliation. """
+        return self._tempf(RECONCILED_MATES_NAME)
+
+    def combine(self, good_chromosomes, strict=False, chrom_sep=None):
+        """
+        Combine chunks' output, then add output of reconciled fragments.
+
+        :param Iterable[str] good_chromosomes: identifier (e.g., chromosome)
+            for each chunk of reads processed.
+        :param bool strict: whether to throw an exception upon encountering a
+            missing file rather than logging a warning and skipping it.
+        :param str chrom_sep: delimiter to write between chunks' output.
+        :return Iterable[str]: path to each file successfully combined.
+        """
+        paths = super(FragmentProcessor, self).combine(
+                good_chromosomes, strict=strict, chrom_sep=chrom_sep)
+        if paths is None or not os.path.exists(self.reconciled_file):
+            return paths
+        with open(self.outfile, 'a') as outfile, \
+                open(self.reconciled_file, 'r') as reconciled:
+            for line in reconciled:
+                outfile.write(line)
+        return paths + [self.reconciled_file]
+
+    def _prepare_run(self, pipeline=None, ordered_output=False, **kwargs):
+        """ Put mate reconciliation first in the pipeline for the run. """
+        if ordered_output:
+            raise ValueError("Reconciled fragments are added to the output "
+                             "by combine(), not written in order while "
+                             "processing; use combine()")
+        reconciler = MateReconciler(self)
+        if pipeline is None:
+            pipeline = Pipeline([reconciler])
+        elif isinstance(pipeline, Pipeline):
+            pipeline = Pipeline([reconciler] + pipeline.stages,
+                                queue_size=pipeline.queue_size)
+        else:
+            pipeline = Pipeline([reconciler] + list(pipeline))
+        return super(FragmentProcessor, self)._prepare_run(
+                pipeline=pipeline, **kwargs)
+
+
+class MateReconciler(PipelineStage):
+    """
+    Pair up mates left over by different chunks, in the parent process.
+
+    As each chunk finishes, its leftover reads are matched against those
+    held from earlier chunks; each completed fragment is processed, and the
+    rest wait for later chunks. Reads still waiting at the end have no mate
+    among the reads processed.
+    """
+
+    def __init__(self, processor):
+        """
+        :param pararead.mates.FragmentProcessor processor: processor for the
+            fragments, with the registered reads file for its header.
+        """
+        self.processor = processor
+        self.mates = MateBuffer()
+        self.num_reconciled = 0
+        self._header = processor.readsfile.header
+        self._out = None
+
+    def process(self, output):
+        # Deferred, as is pysam's import throughout the package's core.
+        from pysam import AlignedSegment
+        path = self.processor.mates_file(output.chunk)
+        if self._out is None:
+            self._out = open(self.processor.reconciled_file, 'w')
+        with open(path, 'r') as leftovers:
+            for line in leftovers:
+                read = AlignedSegment.fromstring(line.rstrip("\n"),
+                                                 self._header)
+                pair = self.mates.add(read)
+                if pair is not None:
+                    _write_rows(self._out,
+                                self.processor.process_fragment(*pair))
+                    self.num_reconciled += 1
+        os.remove(path)
+        return output
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        _LOGGER.info("Reconciled %d fragment(s) with mates in different "
+                     "chunks", self.num_reconciled)
+        if self.mates:
+            _LOGGER.debug("%d read(s) without a mate", len(self.mates))
+
+
+class FragmentWriter(FragmentProcessor):
+    """
+    Write the span of each fragment, as BEDPE-like rows: position of each
+    mate, fragment name, and orientation of the mates.
+    """
+
+    def process_fragment(self, read1, read2):
+        yield (read1.reference_name, read1.reference_start,
+               read1.reference_end, read2.reference_name,
+               read2.reference_start, read2.reference_end,
+               read1.query_name, pair_orientation(read1, read2))
+
+
+def _write_rows(out, rows):
+    for row in rows:
+        out.write("\t".join(str(field) for field in row) + "\n")
@@ -0,0 +1,135 @@
+"""
+Parallel processing of reads grouped by name, e.g. queryname-sorted BAM.
+
+Such a file is split into chunks of about equal compressed size, cut where
+the BGZF blocks of the file are found rather than by reading it through:
+from the block nearest each target offset, the first record is located,
+and the cut is moved forward to the first record with a different name, so
+that records with the same name (a template: mates, secondary and
+supplementary alignments) are never split between chunks.
+"""
+
+from collections import namedtuple
+import itertools
+import logging
+import os
+
+from .bgzf import find_block_start, find_record_start
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["NameChunk", "fetch_name_chunk", "group_by_name",
+           "make_name_chunks"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class NameChunk(namedtuple("NameChunk", ["index", "start", "end", "size"])):
+    """
+    Contiguous records of a file grouped by name, between virtual offsets.
+
+    The end is the virtual offset of the first record of the next chunk,
+    or null for a chunk that runs to the end of the file, and the size is
+    the approximate number of compressed bytes the chunk spans.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        return "names_{}".format(self.index)
+
+
+def make_name_chunks(readsfile, num_chunks):
+    """
+    Split a file of reads grouped by name into chunks.
+
+    :param pysam.AlignmentFile readsfile: BAM file, with records of the same
+        name adjacent; its position is changed.
+    :param int num_chunks: number of chunks to aim for; fewer are made if
+        the file's too small, or if a group of records spans several cuts.
+    :return list[pararead.namesorted.NameChunk]: chunks, in file order.
+    """
+    path = readsfile.filename
+    if not isinstance(path, str):
+        path = path.decode()
+    readsfile.reset()
+    first = readsfile.tell()
+    file_size = os.path.getsize(path)
+    cuts = [first]
+    with open(path, 'rb') as handle:
+        for i in range(1, num_chunks):
+            target = (first >> 16) + i * (file_size - (first >> 16)) // \
+                num_chunks
+            cut = _find_cut(readsfile, handle, target)
+            if cut is None:
+                break
+            if cut > cuts[-1]:
+                cuts.append(cut)
+    ends = cuts[1:] + [None]
+    chunks = [NameChunk(i, start, end,
+                        ((end >> 16) if end else file_size) - (start >> 16))
+              for i, (start, end) in enumerate(zip(cuts, ends))]
+    _LOGGER.info("Split reads into %d chunk(s) by name", len(chunks))
+    return chunks
+
+
+def _find_cut(readsfile, handle, offset):
+    """
+    Find the virtual offset of the first record after a byte offset that
+    starts a new name.
+
+    :return int | NoneType: virtual offset of the record, or null if none.
+    """
+    block = find_block_start(handle, offset)
+    while block is not None:
+        record = find_record_start(handle, block, readsfile.nreferences)
+        if record is not None:
+            break
+        # A block within a single large record; try the next one.
+        block = find_block_start(handle, block + 1)
+    if block is None:
+        return None
+    readsfile.seek(record)
+    name = None
+    while True:
+        position = readsfile.tell()
+        try:
+            read = next(readsfile)
+        except StopIteration:
+            return None
+        if name is None:
+            name = read.query_name
+        elif read.query_name != name:
+            return position
+
+
+def fetch_name_chunk(readsfile, chunk):
+    """
+    Pull the reads of a chunk.
+
+    :param pysam.AlignmentFile readsfile: handle on the reads file, of which
+        the position is changed; this mustn't be shared with other processes.
+    :param pararead.namesorted.NameChunk chunk: chunk to pull.
+    :return Iterable[pysam.AlignedSegment]: reads of the chunk, in file order.
+    """
+    readsfile.seek(chunk.start)
+    while chunk.end is None or readsfile.tell() < chunk.end:
+        try:
+            yield next(readsfile)
+        except StopIteration:
+            return
+
+
+def group_by_name(reads):
+    """
+    Group adjacent reads with the same name.
+
+    :param Iterable[pysam.AlignedSegment] reads: reads grouped by name.
+    :return Iterable[list[pysam.AlignedSegment]]: records of each name.
+    """
+    for _, records in itertools.groupby(reads, key=lambda r: r.query_name):
+        yield list(records)
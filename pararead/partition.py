@@ -0,0 +1,374 @@
+"""
+Partitioning of a reads file into chunks for parallel processing.
+
+A partitioner determines the chunks of reads to process, with an estimate
+of the number of reads in each (for scheduling, and to skip empty chunks),
+and pulls the reads of a chunk in a worker. A processor uses the partitioner
+it's given, or else one of the built-in ones, per its chunking parameters;
+any partitioner plugs into the same scheduling, memory budgeting, ordered
+output, and logging in run().
+"""
+
+import abc
+from collections import namedtuple
+import logging
+import math
+
+from .bgzf import compressed_offset
+from .exceptions import MissingHeaderException
+from .namesorted import fetch_name_chunk, make_name_chunks
+from .regions import \
+    RegionChunk, fetch_regions, make_region_chunks, merge_intervals, \
+    parse_regions, whole_chromosomes
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["Partitioner", "ChunkEstimate", "ChromosomePartitioner",
+           "RegionPartitioner", "WindowPartitioner", "ReadBalancedPartitioner",
+           "NamePartitioner"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of chunks per core to aim for, when the number of chunks is free.
+CHUNKS_PER_CORE = 5
+# Rough size of a read in a compressed (BAM) file, in bytes.
+COMPRESSED_READ_SIZE = 64
+# Number of positions to sample per chunk when balancing chunks by reads.
+SAMPLES_PER_CHUNK = 16
+
+
+# A chunk of reads, with the number of reads it's estimated to hold; null if
+# there's no estimate, zero if the chunk is known to be empty.
+ChunkEstimate = namedtuple("ChunkEstimate", field_names=["chunk", "num_reads"])
+
+
+def _target_num_chunks(processor):
+    # A number of chunks may have been chosen by tuning; see pararead.tuning.
+    return getattr(processor, "_num_chunks", None) or \
+        processor.cores * CHUNKS_PER_CORE
+
+
+def _reads_by_chromosome(readsfile):
+    """ Count reads on each chromosome, from the index. """
+    return {istat.contig: istat.total
+            for istat in readsfile.get_index_statistics()}
+
+
+class Partitioner(object):
+    """
+    Base for strategies for splitting a reads file into chunks.
+
+    A concrete implementation defines partition(), which determines the
+    chunks, and fetch(), which pulls the reads of a chunk. A chunk is any
+    hashable, picklable value whose text form is unique among the chunks, as
+    it names the chunk's output file.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def partition(self, processor, readsfile):
+        """
+        Split the reads into chunks.
+
+        :param pararead.ParaReadProcessor processor: processor for which to
+            partition the reads, providing e.g. the number of cores and
+            chromosomes of interest.
+        :param pysam.AlignmentFile readsfile: the registered reads file.
+        :return list[pararead.partition.ChunkEstimate]: each chunk with its
+            estimated number of reads, in the order of the final output.
+        """
+        pass
+
+    @abc.abstractmethod
+    def fetch(self, processor, chunk):
+        """
+        Pull the reads of a chunk, in a worker process.
+
+        :param pararead.ParaReadProcessor processor: processor of the chunk.
+        :param object chunk: chunk of reads, from partition().
+        :return Iterable[pysam.AlignedSegment]: the chunk's reads, before
+            the processor's filtering.
+        """
+        pass
+
+    def output_order(self, readsfile, chunks):
+        """
+        Arrange chunks in the order of their output in the final output.
+
+        :param pysam.AlignmentFile readsfile: the registered reads file.
+        :param Iterable chunks: chunks with output, as from partition().
+        :return list: the chunks, in order of output; by default, as given.
+        """
+        return list(chunks)
+
+    def __repr__(self):
+        return "{}()".format(self.__class__.__name__)
+
+
+class ChromosomePartitioner(Partitioner):
+    """ One chunk per chromosome, by name. """
+
+    def partition(self, processor, readsfile):
+        size_by_chromosome = processor._size_by_chromosome
+        if size_by_chromosome is None:
+            raise MissingHeaderException(readsfile.filename)
+        reads_by_chrom = _reads_by_chromosome(readsfile)
+        limit = set(processor.limit) if processor.limit else None
+        return [ChunkEstimate(c, reads_by_chrom.get(c, 0))
+                for c in readsfile.references
+                if c in size_by_chromosome and (limit is None or c in limit)]
+
+    def fetch(self, processor, chunk):
+        # Workers share the file handle, so each needs its own iterator.
+        return processor.readsfile.fetch(chunk, multiple_iterators=True)
+
+    def output_order(self, readsfile, chunks):
+        chunks = set(chunks)
+        return [c for c in readsfile.references if c in chunks]
+
+
+class RegionPartitioner(Partitioner):
+    """
+    Chunks of genomic regions (or of windows of them), grouped into chunks
+    that cover about equal numbers of bases; see pararead.regions.
+    """
+
+    def __init__(self, regions=None, window_size=None, ownership="overlap",
+                 halo=0):
+        """
+        :param str | Iterable[(str, int, int)] regions: path to a BED file, or
+            chromosome, 0-based start, and exclusive end of each region; by
+            default, whole chromosomes.
+        :param int window_size: number of base pairs per chunk, to split
+            regions into fixed-size windows; by default, the regions are
+            grouped into a number of chunks per core.
+        :param str ownership: rule for the chunk to which a read spanning
+            chunks belongs; see pararead.regions.RegionChunk.
+        :param int halo: number of flanking base pairs around each region
+            from which to also pull reads.
+        """
+        self.regions = regions
+        self.window_size = window_size
+        self.ownership = ownership
+        self.halo = halo
+
+    def __repr__(self):
+        return "{}(window_size={}, ownership={}, halo={})".format(
+            self.__class__.__name__, self.window_size, self.ownership,
+            self.halo)
+
+    def intervals(self, processor, readsfile):
+        """
+        Determine the merged intervals of interest.
+
+        :param pararead.ParaReadProcessor processor: processor for which to
+            partition the reads, providing chromosomes of interest.
+        :param pysam.AlignmentFile readsfile: the registered reads file.
+        :return list[pararead.regions.Interval]: sorted, nonoverlapping
+            intervals, in header order of chromosomes.
+        """
+        if self.regions is None:
+            intervals = whole_chromosomes(
+                    processor._size_by_chromosome, readsfile.references)
+        else:
+            intervals = parse_regions(self.regions)
+        if processor.limit:
+            limit = set(processor.limit)
+            intervals = [i for i in intervals if i.chrom in limit]
+        merged = merge_intervals(intervals, chrom_order=readsfile.references)
+        _LOGGER.debug("%d region(s), %d after merging",
+                      len(intervals), len(merged))
+        return merged
+
+    def partition(self, processor, readsfile):
+        chunks = make_region_chunks(
+                self.intervals(processor, readsfile),
+                num_chunks=_target_num_chunks(processor),
+                chunk_size=self.window_size, ownership=self.ownership)
+        reads_by_chrom = _reads_by_chromosome(readsfile)
+        estimates = []
+        for c in chunks:
+            # Assume reads are spread evenly along the chromosome.
+            num_reads = int(math.ceil(
+                    float(reads_by_chrom.get(c.chrom, 0)) * c.size /
+                    processor.get_chrom_size(c.chrom)))
+            estimates.append(ChunkEstimate(c, num_reads))
+        return estimates
+
+    def fetch(self, processor, chunk):
+        # A handle of one's own for the whole chunk, rather than an iterator
+        # with a reopened file for each of what may be many regions.
+        readsfile = processor.open_reads_file()
+        try:
+            for read in fetch_regions(readsfile, chunk, halo=self.halo):
+                yield read
+        finally:
+            readsfile.close()
+
+    def output_order(self, readsfile, chunks):
+        # By position: chromosomes in header order, then by start.
+        rank = {c: i for i, c in enumerate(readsfile.references)}
+        return sorted(chunks, key=lambda c: (rank.get(c.chrom, len(rank)),
+                                             c.intervals[0][0]))
+
+
+class WindowPartitioner(RegionPartitioner):
+    """ Fixed-size windows tiling each chromosome. """
+
+    def __init__(self, window_size, ownership="overlap", halo=0):
+        """
+        :param int window_size: number of base pairs per window.
+        :param str ownership: rule for the window to which a read spanning
+            windows belongs; see pararead.regions.RegionChunk.
+        :param int halo: number of flanking base pairs around each window
+            from which to also pull reads.
+        """
+        super(WindowPartitioner, self).__init__(
+                window_size=window_size, ownership=ownership, halo=halo)
+
+
+class ReadBalancedPartitioner(RegionPartitioner):
+    """
+    Windows of each chromosome holding about equal numbers of reads.
+
+    Where reads lie is estimated from the index, without reading through
+    the file: the position in the file of the first read that starts at
+    each of a number of sampled positions along a chromosome tells about
+    how much of the file lies between those positions. Each chromosome gets
+    a share of the chunks in proportion to its reads, and its windows are
+    cut where the share of the file's data is even.
+    """
+
+    def __init__(self, num_chunks=None, ownership="overlap", halo=0):
+        """
+        :param int num_chunks: number of chunks to aim for; by default, a
+            number per core.
+        :param str ownership: rule for the window to which a read spanning
+            windows belongs; see pararead.regions.RegionChunk.
+        :param int halo: number of flanking base pairs around each window
+            from which to also pull reads.
+        """
+        super(ReadBalancedPartitioner, self).__init__(
+                ownership=ownership, halo=halo)
+        self.num_chunks = num_chunks
+
+    def partition(self, processor, readsfile):
+        reads_by_chrom = _reads_by_chromosome(readsfile)
+        chroms = [i.chrom for i in self.intervals(processor, readsfile)]
+        total = sum(reads_by_chrom.get(c, 0) for c in chroms)
+        num_chunks = self.num_chunks or _target_num_chunks(processor)
+        estimates = []
+        handle = processor.open_reads_file()
+        raw = open(processor.path_reads_file, 'rb')
+        try:
+            for chrom in chroms:
+                num_reads = reads_by_chrom.get(chrom, 0)
+                size = processor.get_chrom_size(chrom)
+                if not num_reads:
+                    estimates.append(ChunkEstimate(
+                        RegionChunk(chrom, [(0, size)],
+                                    ownership=self.ownership), 0))
+                    continue
+                share = max(int(round(
+                        float(num_chunks) * num_reads / total)), 1)
+                estimates.extend(self._split_chromosome(
+                        handle, raw, chrom, size, num_reads, share))
+        finally:
+            handle.close()
+            raw.close()
+        return estimates
+
+    def _split_chromosome(self, readsfile, raw, chrom, size, num_reads,
+                          num_chunks):
+        """ Cut a chromosome into windows with about equal data. """
+        num_samples = min(num_chunks * SAMPLES_PER_CHUNK, size)
+        bounds = [size * i // num_samples for i in range(num_samples)]
+        offsets = [_data_offset(readsfile, raw, chrom, p, size)
+                   for p in bounds]
+        sampled = [i for i, o in enumerate(offsets) if o is not None]
+        if not sampled:
+            # No read starts on the chromosome, e.g. only unmapped ones.
+            return [ChunkEstimate(RegionChunk(
+                    chrom, [(0, size)], ownership=self.ownership), num_reads)]
+        # The data end with the chromosome's last read.
+        for _ in readsfile.fetch(chrom, bounds[sampled[-1]], size):
+            pass
+        end_offset = compressed_offset(raw, readsfile.tell())
+        bounds.append(size)
+        offsets = [end_offset if o is None else o for o in offsets] + \
+            [end_offset]
+        data = offsets[-1] - offsets[0]
+        cuts = [0]
+        for i in range(1, num_samples):
+            # Cut where the next even share of the data is reached.
+            if data and len(cuts) < num_chunks and \
+                    offsets[i] - offsets[0] >= \
+                    data * len(cuts) / num_chunks:
+                cuts.append(i)
+        cuts.append(num_samples)
+        estimates = []
+        for i, j in zip(cuts[:-1], cuts[1:]):
+            start, end = bounds[i], bounds[j]
+            portion = (offsets[j] - offsets[i]) / data if data \
+                else float(end - start) / size
+            chunk = RegionChunk(chrom, [(start, end)],
+                                preceding_end=start if start else None,
+                                ownership=self.ownership)
+            estimates.append(ChunkEstimate(
+                    chunk, int(math.ceil(num_reads * portion))))
+        return estimates
+
+
+def _data_offset(readsfile, raw, chrom, position, end):
+    """
+    Approximate position in the file of the first read that starts at or
+    after a position, or null if there's none before the end.
+    """
+    for read in readsfile.fetch(chrom, position, end):
+        # Reads that start before the position but overlap it come first.
+        if read.reference_start >= position:
+            return compressed_offset(raw, readsfile.tell())
+    return None
+
+
+class NamePartitioner(Partitioner):
+    """
+    Chunks of about equal compressed size of a file of reads grouped by name
+    (e.g., queryname-sorted), cut at BGZF blocks such that no records with
+    the same name are split; see pararead.namesorted.
+    """
+
+    def partition(self, processor, readsfile):
+        sort_order = readsfile.header.to_dict().get("HD", {}).get("SO")
+        if sort_order == "coordinate":
+            raise ValueError("Reads can't be chunked by name in a file "
+                             "sorted by coordinate: '{}'".
+                             format(processor.path_reads_file))
+        if sort_order != "queryname":
+            _LOGGER.warning("Reads file isn't declared queryname-sorted "
+                            "(SO: %s); assuming records with the same name "
+                            "are adjacent", sort_order)
+        handle = processor.open_reads_file()
+        try:
+            chunks = make_name_chunks(
+                    handle, num_chunks=_target_num_chunks(processor))
+        finally:
+            handle.close()
+        # Each chunk starts with a record, so none is empty.
+        return [ChunkEstimate(c, int(math.ceil(
+                    float(c.size) / COMPRESSED_READ_SIZE)))
+                for c in chunks]
+
+    def fetch(self, processor, chunk):
+        # Seeking a shared handle would move it for every other worker.
+        readsfile = processor.open_reads_file()
+        try:
+            for read in fetch_name_chunk(readsfile, chunk):
+                yield read
+        finally:
+            readsfile.close()
@@ -0,0 +1,189 @@
+"""
+Parallel processing of pileups, tiled into windows along each chromosome.
+
+Rather than pileup of a whole chromosome in one worker, each chunk is a
+window of the chromosome, and the worker hands its pileup to the processor
+in batches of columns, or of per-position base counts. Each column is
+processed by exactly one chunk, as the pileup of each window is truncated
+to the window, while including every read that covers it.
+"""
+
+import abc
+from collections import namedtuple
+import logging
+
+from .filters import DEFAULT_EXCLUDED_FLAGS
+from .processor import ParaReadProcessor
+from .regions import RegionChunk, merge_intervals
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["PileupProcessor", "AlleleCounter", "BaseCounts",
+           "PileupColumnData", "NUCLEOTIDES", "DEFAULT_PILEUP_WINDOW_SIZE",
+           "DEFAULT_PILEUP_BATCH_SIZE"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of base pairs per window of a chromosome to process as one chunk.
+DEFAULT_PILEUP_WINDOW_SIZE = 10 ** 6
+
+# Number of positions per batch handed to the processor.
+DEFAULT_PILEUP_BATCH_SIZE = 10 ** 4
+
+# Order of the nucleotides for which count_coverage() gives counts.
+NUCLEOTIDES = ("A", "C", "G", "T")
+
+
+# Data of a pileup column that remain valid once the pileup has moved on.
+PileupColumnData = namedtuple("PileupColumnData", field_names=[
+        "pos", "bases", "qualities"])
+
+# Count of each nucleotide (see NUCLEOTIDES) at each position of an
+# interval, as an array per nucleotide.
+BaseCounts = namedtuple("BaseCounts", field_names=["start", "end", "counts"])
+
+
+class PileupProcessor(ParaReadProcessor):
+    """
+    Base for processors of pileups, by windows of each chromosome.
+
+    A concrete implementation defines process_batch(), which receives the
+    pileup in batches: by default, of PileupColumnData for each column; with
+    use_counts, as BaseCounts, arrays of per-position counts of each
+    nucleotide, computed within htslib. Each batch produces rows of output.
+    By default, run() writes each window's output to the output file in
+    genomic order as soon as preceding windows are done, so no combine()
+    is needed.
+
+    The pileup's reads are those meeting the processor's criteria for reads
+    (see pararead.filters.ReadFilter); by default, duplicates, secondary
+    alignments, reads that fail QC, and unmapped reads are excluded. Given
+    a region_halo, batches also cover that many flanking positions around
+    each window, for context; the chunk's contains() tells whether a
+    position is the chunk's own.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    flag_excluded = DEFAULT_EXCLUDED_FLAGS
+    # Whether to hand over arrays of base counts rather than columns.
+    use_counts = False
+    # Bases with quality below this aren't counted.
+    min_base_quality = 13
+    ordered_output = True
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param int window_size: number of base pairs per window; default
+            DEFAULT_PILEUP_WINDOW_SIZE.
+        :param int batch_size: number of positions per batch; default
+            DEFAULT_PILEUP_BATCH_SIZE.
+        :raise ValueError: if the criteria for reads can't be applied to
+            pileup columns.
+        """
+        self.batch_size = kwargs.pop("batch_size", DEFAULT_PILEUP_BATCH_SIZE)
+        kwargs.setdefault("window_size", DEFAULT_PILEUP_WINDOW_SIZE)
+        super(PileupProcessor, self).__init__(*args, **kwargs)
+        if not self.use_counts and self.read_filter.tags:
+            raise ValueError("Pileup columns can't be restricted to reads "
+                             "by tag; use base counts or filter the columns")
+
+    @abc.abstractmethod
+    def process_batch(self, chunk, batch):
+        """
+        Process a batch of the pileup.
+
+        :param pararead.regions.RegionChunk chunk: the window (or regions) of
+            which the batch is part.
+        :param list[pararead.pileup.PileupColumnData] | pararead.pileup.BaseCounts
+            batch: columns of the pileup, or with use_counts, base counts.
+        :return Iterable[Iterable]: rows of output fields, which are written
+            tab-separated to the chunk's output.
+        """
+        pass
+
+    def __call__(self, chunk):
+        region = chunk
+        if not isinstance(chunk, RegionChunk):
+            # Chromosome chunks, if windows have been turned off; output is
+            # still by the chunk itself, where run() and combine() expect it.
+            region = RegionChunk(chunk, [(0, self.get_chrom_size(chunk))])
+        readsfile = self.open_reads_file()
+        try:
+            with open(self._tempf(chunk), 'w') as out:
+                for batch in self.batches(readsfile, region):
+                    for row in self.process_batch(region, batch):
+                        out.write("\t".join(str(field) for field in row))
+                        out.write("\n")
+        finally:
+            readsfile.close()
+        return chunk
+
+    def batches(self, readsfile, chunk):
+        """
+        Split the pileup of a chunk into batches.
+
+        :param pysam.AlignmentFile readsfile: handle on the reads file.
+        :param pararead.regions.RegionChunk chunk: window(s) of interest.
+        :return Iterable[list[pararead.pileup.PileupColumnData] |
+            pararead.pileup.BaseCounts]: batches of the pileup.
+        """
+        halo = self.region_halo
+        intervals = [(i.start, i.end) for i in merge_intervals(
+            [(chunk.chrom, max(start - halo, 0), end + halo)
+             for start, end in chunk.intervals])]
+        if self.use_counts:
+            return self._count_batches(readsfile, chunk.chrom, intervals)
+        return self._column_batches(readsfile, chunk.chrom, intervals)
+
+    def _count_batches(self, readsfile, chrom, intervals):
+        read_filter = self.read_filter
+        size = self.get_chrom_size(chrom)
+        for start, end in intervals:
+            end = min(end, size)
+            for batch_start in range(start, end, self.batch_size):
+                batch_end = min(batch_start + self.batch_size, end)
+                counts = readsfile.count_coverage(
+                        chrom, batch_start, batch_end,
+                        quality_threshold=self.min_base_quality,
+                        read_callback=read_filter if read_filter else "all")
+                yield BaseCounts(batch_start, batch_end, counts)
+
+    def _column_batches(self, readsfile, chrom, intervals):
+        read_filter = self.read_filter
+        batch = []
+        for start, end in intervals:
+            # Truncation keeps columns to the interval, but all reads
+            # overlapping it contribute.
+            columns = readsfile.pileup(
+                    chrom, start, end, truncate=True,
+                    flag_filter=read_filter.flag_excluded,
+                    flag_require=read_filter.flag_required,
+                    min_mapping_quality=read_filter.min_mapq,
+                    min_base_quality=self.min_base_quality)
+            for column in columns:
+                # Column proxies are invalid once the pileup moves on.
+                batch.append(PileupColumnData(
+                        column.reference_pos, column.get_query_sequences(),
+                        column.get_query_qualities()))
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+class AlleleCounter(PileupProcessor):
+    """ Count of each nucleotide at each covered position. """
+
+    use_counts = True
+
+    def process_batch(self, chunk, batch):
+        for offset, counts in enumerate(zip(*batch.counts)):
+            pos = batch.start + offset
+            if any(counts) and chunk.contains(pos):
+                yield (chunk.chrom, pos) + counts
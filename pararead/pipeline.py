@@ -0,0 +1,402 @@
+""" Streaming of chunk outputs through stages in the parent process. """
+
+from collections import namedtuple
+import gzip
+import logging
+import os
+import shutil
+import sys
+import threading
+if sys.version_info < (3, 0):
+    from Queue import Full, Queue
+else:
+    from queue import Full, Queue
+
+from .exceptions import CommandOrderException, PipelineStageException
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["ChunkOutput", "Pipeline", "PipelineStage",
+           "ConcatenatingWriter", "GzipCompressor", "ObjectStoreUploader",
+           "OrderedWriter"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bound on number of chunk outputs waiting for each stage.
+DEFAULT_QUEUE_SIZE = 2
+
+# Bytes of out-of-order chunk output to hold in memory before leaving the
+# rest on disk, when writing output in order.
+DEFAULT_REORDER_BUFFER_SIZE = 64 * 2 ** 20
+
+# Marks the end of the stream of chunk outputs.
+_END = object()
+
+
+ChunkOutput = namedtuple("ChunkOutput", field_names=["chunk", "path", "result"])
+
+# Out-of-order output left on disk rather than held in memory.
+_Spilled = namedtuple("_Spilled", field_names=["path"])
+
+
+class PipelineStage(object):
+    """
+    One step in handling of chunk outputs, in the parent process.
+
+    A stage receives a chunk output once processing of that chunk has
+    finished and passes along the (possibly altered) chunk output to the
+    next stage. Returning null drops the output from the rest of the
+    pipeline. A chunk output with a null result signals that processing of
+    the chunk failed; rather than being processed, it's discarded by each
+    stage. Each stage runs in its own thread, so stages overlap with one
+    another and with the processing of chunks by workers.
+    """
+
+    def process(self, output):
+        """
+        Handle one chunk's output.
+
+        :param pararead.pipeline.ChunkOutput output: the chunk, path to its
+            output file, and the result of its processing.
+        :return pararead.pipeline.ChunkOutput: what to pass to next stage.
+        """
+        return output
+
+    def discard(self, chunk):
+        """
+        Take note of a chunk for which there's no output.
+
+        :param object chunk: key/descriptor of the chunk that failed.
+        """
+        pass
+
+    def close(self):
+        """ Finalize the stage once all chunk outputs have been handled. """
+        pass
+
+    @property
+    def name(self):
+        return self.__class__.__name__
+
+
+class _CallableStage(PipelineStage):
+    """ Adapt a plain function of chunk output to the stage interface. """
+
+    def __init__(self, func):
+        self.func = func
+
+    def process(self, output):
+        return self.func(output)
+
+    @property
+    def name(self):
+        return getattr(self.func, "__name__", repr(self.func))
+
+
+class Pipeline(object):
+    """
+    Stages connected by bounded queues, each stage running in its own thread.
+
+    A full queue blocks the producer; when the producer is the loop that
+    hands chunks to the worker pool, this holds back submission of new
+    chunks until the stages catch up, bounding the backlog of finished but
+    unhandled outputs.
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        :param Iterable[PipelineStage | callable] stages: the steps through
+            which to pass each chunk output, in order.
+        :param int queue_size: maximum number of outputs waiting at a stage.
+        """
+        self.stages = [s if isinstance(s, PipelineStage) else _CallableStage(s)
+                       for s in stages]
+        self.queue_size = queue_size
+        self._queues = []
+        self._threads = []
+        self._errors = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(raise_errors=exc_type is None)
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def start(self):
+        """ Launch a thread for each stage. """
+        self._queues = [Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._errors = []
+        downstreams = self._queues[1:] + [None]
+        self._threads = [
+            threading.Thread(target=self._run_stage, args=(s, inq, outq),
+                             name="pararead-{}".format(s.name))
+            for s, inq, outq in zip(self.stages, self._queues, downstreams)]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def put(self, output, block=True):
+        """
+        Feed a chunk output to the first stage, blocking if it's backed up.
+
+        :param pararead.pipeline.ChunkOutput output: output to handle.
+        :param bool block: whether to wait for room in the first stage's
+            queue if it's full, rather than declining the output.
+        :return bool: whether the output was accepted.
+        :raise pararead.exceptions.CommandOrderException: if the pipeline
+            hasn't been started.
+        :raise pararead.exceptions.PipelineStageException: if a stage has
+            already failed.
+        """
+        self._raise_if_failed()
+        if not self.stages:
+            return True
+        if not self._queues:
+            raise CommandOrderException("Pipeline has not been started")
+        try:
+            self._queues[0].put(output, block=block)
+        except Full:
+            return False
+        return True
+
+    def close(self, raise_errors=True):
+        """
+        Signal the end of the outputs and wait for each stage to finish.
+
+        :param bool raise_errors: whether to raise an exception if a stage
+            failed.
+        :raise pararead.exceptions.PipelineStageException: if a stage failed.
+        """
+        if self._queues:
+            self._queues[0].put(_END)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self._queues = []
+        if raise_errors:
+            self._raise_if_failed()
+
+    def _raise_if_failed(self):
+        if self._errors:
+            stage, error = self._errors[0]
+            raise PipelineStageException(stage.name, error)
+
+    def _run_stage(self, stage, inqueue, outqueue):
+        failed = False
+        while True:
+            output = inqueue.get()
+            if output is _END:
+                break
+            if failed:
+                # Keep draining so that upstream isn't blocked forever.
+                continue
+            try:
+                if output.result is None:
+                    stage.discard(output.chunk)
+                else:
+                    output = stage.process(output)
+            except Exception as e:
+                _LOGGER.error("Pipeline stage '%s' failed on chunk '%s': %s",
+                              stage.name, output.chunk, e)
+                self._errors.append((stage, e))
+                failed = True
+                continue
+            if output is not None and outqueue is not None:
+                outqueue.put(output)
+        if not failed:
+            try:
+                stage.close()
+            except Exception as e:
+                _LOGGER.error("Pipeline stage '%s' failed to close: %s",
+                              stage.name, e)
+                self._errors.append((stage, e))
+        if outqueue is not None:
+            outqueue.put(_END)
+
+
+class ConcatenatingWriter(PipelineStage):
+    """ Append each chunk's output to a final output file as it arrives. """
+
+    def __init__(self, outfile, chrom_sep=None):
+        """
+        :param str outfile: path to the final output file.
+        :param str chrom_sep: delimiter to write after each chunk's output.
+        """
+        self.outfile = outfile
+        self.chrom_sep = chrom_sep
+        self._handle = None
+
+    def process(self, output):
+        if self._handle is None:
+            self._handle = open(self.outfile, 'wb')
+        with open(output.path, 'rb') as chunk_file:
+            shutil.copyfileobj(chunk_file, self._handle)
+        if self.chrom_sep:
+            self._handle.write(self.chrom_sep.encode())
+        return output
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class GzipCompressor(PipelineStage):
+    """ Compress each chunk's output, passing along the compressed file. """
+
+    def __init__(self, remove_original=True, compresslevel=6):
+        """
+        :param bool remove_original: whether to delete the uncompressed file.
+        :param int compresslevel: gzip compression level, from 1 to 9.
+        """
+        self.remove_original = remove_original
+        self.compresslevel = compresslevel
+
+    def process(self, output):
+        path_gz = output.path + ".gz"
+        with open(output.path, 'rb') as raw, \
+                gzip.open(path_gz, 'wb', self.compresslevel) as compressed:
+            shutil.copyfileobj(raw, compressed)
+        if self.remove_original:
+            os.remove(output.path)
+        return output._replace(path=path_gz)
+
+
+class ObjectStoreUploader(PipelineStage):
+    """
+    Copy each chunk's output to an object store rooted at a local folder.
+
+    Objects are keyed by an optional prefix and the output file's name.
+    """
+
+    def __init__(self, store_folder, prefix=""):
+        """
+        :param str store_folder: root folder of the object store.
+        :param str prefix: prefix for the key of each stored object.
+        """
+        self.store_folder = store_folder
+        self.prefix = prefix
+        self.uploaded = []
+
+    def process(self, output):
+        key = self.prefix + os.path.basename(output.path)
+        destination = os.path.join(self.store_folder, key)
+        folder = os.path.dirname(destination)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        # Write under a temporary name so a partial object is never visible.
+        shutil.copyfile(output.path, destination + ".part")
+        os.rename(destination + ".part", destination)
+        self.uploaded.append(key)
+        return output
+
+
+class OrderedWriter(PipelineStage):
+    """
+    Write chunk outputs to the final output file in a fixed chunk order.
+
+    A chunk's output is written as soon as those of all preceding chunks
+    have been written or discarded. Outputs that arrive out of order wait
+    in a reorder buffer, in memory up to a size limit; beyond that, they're
+    left in their files on disk and read back when their turn comes.
+    """
+
+    def __init__(self, outfile, order, chrom_sep=None,
+                 max_buffer_size=DEFAULT_REORDER_BUFFER_SIZE):
+        """
+        :param str outfile: path to the final output file.
+        :param Iterable order: chunks, in the order in which to write output.
+        :param str chrom_sep: delimiter to write after each chunk's output,
+            as by combine(); none if there's just one chunk in the order.
+        :param int max_buffer_size: maximum number of bytes of out-of-order
+            output to hold in memory.
+        """
+        self.outfile = outfile
+        self.order = list(order)
+        self.chrom_sep = chrom_sep if len(self.order) > 1 else None
+        self.max_buffer_size = max_buffer_size
+        self.buffered_size = 0
+        self.num_spilled = 0
+        self._handle = None
+        self._next = 0
+        self._positions = {c: i for i, c in enumerate(self.order)}
+        # Map position in the order to content held in memory, spilled
+        # output, or null for a discarded chunk.
+        self._waiting = {}
+
+    def process(self, output):
+        position = self._position(output.chunk)
+        if position != self._next:
+            size = os.path.getsize(output.path)
+            if self.buffered_size + size <= self.max_buffer_size:
+                with open(output.path, 'rb') as chunk_file:
+                    self._waiting[position] = chunk_file.read()
+                self.buffered_size += size
+            else:
+                self._waiting[position] = _Spilled(output.path)
+                self.num_spilled += 1
+        else:
+            self._write(output.path)
+            self._next += 1
+        self._drain()
+        return output
+
+    def discard(self, chunk):
+        self._waiting[self._position(chunk)] = None
+        self._drain()
+
+    def close(self):
+        missing = [self.order[i] for i in range(self._next, len(self.order))
+                   if i not in self._waiting]
+        if missing:
+            _LOGGER.warning("No output arrived for %d chunk(s) for ordered "
+                            "output: %s", len(missing), missing)
+            for i in range(self._next, len(self.order)):
+                self._waiting.setdefault(i, None)
+            self._drain()
+        if self._handle is None:
+            # Still create the output file, even if there's nothing in it.
+            self._handle = open(self.outfile, 'wb')
+        self._handle.close()
+        self._handle = None
+
+    def _position(self, chunk):
+        try:
+            return self._positions[chunk]
+        except KeyError:
+            raise ValueError("Chunk not in output order: {}".format(chunk))
+
+    def _drain(self):
+        """ Write out whatever's waiting that's now next in order. """
+        while self._next in self._waiting:
+            content = self._waiting.pop(self._next)
+            if content is None:
+                pass
+            elif isinstance(content, _Spilled):
+                self._write(content.path)
+            else:
+                self.buffered_size -= len(content)
+                self._write(content=content)
+            self._next += 1
+
+    def _write(self, path=None, content=None):
+        """ Write the content of the given file, or the content given. """
+        if self._handle is None:
+            self._handle = open(self.outfile, 'wb')
+        if path is None:
+            self._handle.write(content)
+        else:
+            with open(path, 'rb') as chunk_file:
+                shutil.copyfileobj(chunk_file, self._handle)
+        if self.chrom_sep:
+            self._handle.write(self.chrom_sep.encode())
+        self._handle.flush()
@@ -9,9 +9,9 @@ then object.run(), object.combine().
 
 import abc
 import atexit
+from collections import namedtuple
 import itertools
 import logging
-import multiprocessing
 import os
 import shutil
 import tempfile
@@ -19,7 +19,26 @@ import tempfile
 from .exceptions import \
     CommandOrderException, IllegalChunkException, \
     MissingOutputFileException, UnknownChromosomeException
+from .execution import ChunkExecutor
+from .filters import ReadFilter
 from .logs import setup_logger
+from .namesorted import group_by_name
+from .partition import \
+    ChunkEstimate, ChromosomePartitioner, NamePartitioner, \
+    RegionPartitioner, CHUNKS_PER_CORE
+from .pipeline import \
+    ChunkOutput, OrderedWriter, Pipeline, DEFAULT_REORDER_BUFFER_SIZE
+from .columnar import \
+    combine_tables, read_table_records, write_table, ARROW_OUTPUT_TYPE, \
+    COLUMNAR_OUTPUT_TYPES
+from .records import read_records, write_records, RECORDS_OUTPUT_TYPE
+from .regions import RegionChunk
+from .tabix import \
+    compress_and_index, concatenate_indexed, INDEX_TYPES, TABIX_PRESETS
+from .shared import share
+from .tuning import \
+    available_cores, calibrate, choose_num_chunks, choose_workers, \
+    chunk_times, estimate_makespan, AUTO_CORES
 from .utils import *
 
 
@@ -35,36 +54,79 @@ and thus will not cause map to fail.
 """
 PARA_READ_FILES = {}
 READS_FILE_KEY = "readsfile"
-CHUNKS_PER_CORE = 5
+# Rough default for memory held per read while processing a chunk, in bytes.
+MEMORY_PER_READ = 1024
 CORES_PARAM_NAME = "cores"
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
+# What's needed to carry out processing, as determined by run() setup.
+_RunPlan = namedtuple("_RunPlan", field_names=[
+        "empties", "nonempties", "executor", "pipeline", "profile"])
+
+
+def _chromosome(chunk):
+    """ Determine the chromosome of a chunk of reads. """
+    return chunk.chrom if isinstance(chunk, RegionChunk) else chunk
+
+
+class _CompressAndIndex(object):
+    """
+    Process a chunk, then compress and index its output, in the worker.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, chunk):
+        result = self.processor(chunk)
+        if result is not None:
+            self.processor.compress_chunk_output(chunk)
+        return result
+
+
 class ParaReadProcessor(object):
     """
     Base class for parallel processing of sequencing reads.
     
     Implement __call__ to define work for each reads chunk, (e.g., chromosome).
     Unaligned reads are permitted, but the work then cannot rely on any sort 
-    of biologically meaningful chunking of the reads unless a partition() 
-    function is implemented. If unaligned reads are used and no partition() is 
-    implemented, reads will be arbitrarily split into chunks.
+    of biologically meaningful chunking of the reads unless a partitioner 
+    (see pararead.partition) is given. If unaligned reads are used and no 
+    partitioner is given, reads will be arbitrarily split into chunks.
     
     """
 
     __metaclass__ = abc.ABCMeta
 
+    # Declarative criteria for reads pulled by fetch_chunk(); see
+    # pararead.filters.ReadFilter. Chromosomes and regions of interest are
+    # set by limit and regions.
+    flag_required = 0
+    flag_excluded = 0
+    min_mapq = 0
+    tag_filters = None
+    # Whether run() writes the final output in order while processing,
+    # obviating combine(), unless told otherwise.
+    ordered_output = False
+
     def __init__(
             self, path_reads_file, cores, outfile=None, action=None,
             temp_folder_parent_path=None, limit=None, allow_unaligned=False,
             require_new_outfile=False, by_chromosome=True,
             intermediate_output_type="txt", output_type="txt",
-            retain_temp=False):
+            retain_temp=False, regions=None, window_size=None,
+            region_ownership="overlap", region_halo=0, read_filter=None,
+            by_name=False, partitioner=None, tabix=None, index_type="tbi"):
         """
         :param str path_reads_file: data location (aligned BAM/SAM file).
-        :param int | str cores: number of processors to use.
+        :param int | str cores: number of processors to use, or 'auto' to
+            choose for each run, from at most those available to this
+            process (per its CPU affinity and cgroup quota), the number of
+            cores, and of chunks, that minimize estimated time; see
+            pararead.tuning.
         :param str outfile: path to location for output file; either this
             or action is required.
         :param str action: name for what the child class is doing, used to
@@ -80,14 +142,76 @@ class ParaReadProcessor(object):
         :param bool by_chromosome: whether to chunk reads on a per-chromosome
             basis, implicitly imposing requirement for aligned reads.
         :param str intermediate_output_type: type of output file generated for
-            each chunk of reads processed.
+            each chunk of reads processed; RECORDS_OUTPUT_TYPE ('rec') for
+            binary records, or ARROW_OUTPUT_TYPE ('arrow') for Arrow tables
+            (see write_chunk_records()), formatted as text only by combine().
         :param str output_type: type of final output file generated; this is
             used by both intermediate files that are created and by the combine()
-            step that creates final output.
+            step that creates final output. For 'parquet' or 'arrow', combine()
+            assembles the chunks' Arrow tables into a columnar file, with one
+            row group per chunk, which requires pyarrow.
+        :param str | Iterable[(str, int, int)] regions: path to a BED file, or
+            chromosome, 0-based start, and exclusive end of each region, to
+            which to restrict processing. Overlapping regions are merged, and
+            nearby ones are grouped into chunks of about equal size, for which
+            fetch_chunk() pulls just the reads overlapping the regions.
+        :param int window_size: number of base pairs per chunk, to split
+            chromosomes (or regions) into fixed-size windows.
+        :param str region_ownership: rule for which region chunk a read that
+            spans chunks belongs to, so that fetch_chunk() pulls it for only
+            one chunk: the one with the first region the read overlaps
+            ('overlap'), or the one with the region that contains the read's
+            start ('start'); null for every chunk with a region it overlaps.
+        :param int region_halo: number of flanking base pairs around each
+            region from which fetch_chunk() also pulls reads, for processing
+            that requires context; the chunk's owns() tells which of the
+            reads belong to the chunk.
+        :param pararead.filters.ReadFilter read_filter: criteria for the reads
+            that fetch_chunk() pulls; by default, those declared by the
+            class attributes flag_required, flag_excluded, min_mapq, and
+            tag_filters.
+        :param bool by_name: whether to chunk reads by name rather than by
+            chromosome, for a BAM file in which records with the same name
+            are adjacent (e.g., queryname-sorted); no chunk splits the
+            records of a name, and fetch_templates() groups them.
+        :param pararead.partition.Partitioner partitioner: strategy for
+            splitting the reads into chunks, and for pulling the reads of a
+            chunk; by default, one of the built-in strategies, per the
+            chunking parameters above.
+        :param str | pararead.tabix.TabixFormat tabix: layout of the lines of
+            output, by the name of a preset ('bed', 'gff', or 'vcf') or in
+            full, to write the final output BGZF-compressed and indexed for
+            tabix; each chunk's output is compressed in its worker, and
+            combine() joins these and writes the index. The output of each
+            chunk must be sorted by position.
+        :param str index_type: type of index for output with a tabix layout:
+            'tbi', or 'csi' for positions beyond 2 ** 29.
         :raise ValueError: if given neither `outfile` path nor `action` action
-            name, or if output file already exists and a new one is required.
+            name, or if output file already exists and a new one is required,
+            or if chunking by name is combined with a restriction by
+            position, or if the tabix layout or index type is unknown, or
+            combined with binary or columnar output.
         """
 
+        if by_name and (limit or regions is not None or window_size):
+            raise ValueError("Chunking by name can't be combined with "
+                             "chromosomes, regions, or windows of interest")
+        if tabix is not None:
+            if not isinstance(tabix, tuple):
+                try:
+                    tabix = TABIX_PRESETS[tabix]
+                except KeyError:
+                    raise ValueError(
+                            "Unknown tabix preset: '{}'; choose from: {}".
+                            format(tabix, ", ".join(sorted(TABIX_PRESETS))))
+            if index_type not in INDEX_TYPES:
+                raise ValueError("Unknown index type: '{}'; choose from: {}".
+                                 format(index_type, ", ".join(INDEX_TYPES)))
+            if output_type in COLUMNAR_OUTPUT_TYPES or \
+                    intermediate_output_type in \
+                    (RECORDS_OUTPUT_TYPE, ARROW_OUTPUT_TYPE):
+                raise ValueError("Output for tabix must be text")
+
         # Establish root logger only if client application hasn't done so.
         # That is, create a root logger with a handler if one doesn't exist.
         if not logging.getLogger().handlers:
@@ -144,12 +268,27 @@ class ParaReadProcessor(object):
             atexit.register(clean)
 
         # Behavior/execution parameters.
-        self.cores = int(cores)
+        self.auto_cores = cores == AUTO_CORES
+        self._max_cores = available_cores() if self.auto_cores else int(cores)
+        self.cores = self._max_cores
+        self._num_chunks = None
         self.limit = limit
-        self.require_aligned = by_chromosome or not allow_unaligned
+        self.require_aligned = \
+            not by_name and (by_chromosome or not allow_unaligned)
         self.intermediate_output_type = intermediate_output_type
-        self.by_chromosome = by_chromosome
+        self.output_type = output_type
+        self.tabix = tabix
+        self.index_type = index_type
+        self.by_chromosome = by_chromosome and not by_name
+        self.by_name = by_name
+        self.regions = regions
+        self.window_size = window_size
+        self.region_ownership = region_ownership
+        self.region_halo = region_halo
+        self._read_filter = read_filter
+        self._partitioner = partitioner
         self._size_by_chromosome = None
+        self._shared = {}
 
     @abc.abstractmethod
     def __call__(self, chunk_id, reads_chunk):
@@ -174,6 +313,52 @@ class ParaReadProcessor(object):
         """
         pass
 
+    @property
+    def read_filter(self):
+        """
+        Criteria for the reads pulled by fetch_chunk().
+
+        :return pararead.filters.ReadFilter: criteria given at construction,
+            or else those declared by the class attributes.
+        """
+        if self._read_filter is None:
+            self._read_filter = ReadFilter(
+                    flag_required=self.flag_required,
+                    flag_excluded=self.flag_excluded,
+                    min_mapq=self.min_mapq, tags=self.tag_filters)
+        return self._read_filter
+
+    @property
+    def partitioner(self):
+        """
+        Strategy for splitting the reads into chunks.
+
+        :return pararead.partition.Partitioner | NoneType: partitioner given
+            at construction, or else the built-in one for chunks by name,
+            regions (or windows), or chromosome; null if reads are to be
+            split arbitrarily.
+        """
+        if self._partitioner is None:
+            if self.by_name:
+                self._partitioner = NamePartitioner()
+            elif self.by_regions:
+                self._partitioner = RegionPartitioner(
+                        regions=self.regions, window_size=self.window_size,
+                        ownership=self.region_ownership,
+                        halo=self.region_halo)
+            elif self.by_chromosome:
+                self._partitioner = ChromosomePartitioner()
+        return self._partitioner
+
+    @property
+    def by_regions(self):
+        """
+        Whether chunks of reads are defined by regions, or windows.
+
+        :return bool: whether chunks are pararead.regions.RegionChunk.
+        """
+        return self.regions is not None or bool(self.window_size)
+
     @property
     def files(self):
         """
@@ -206,6 +391,19 @@ class ParaReadProcessor(object):
         if read_chunk_key:
             _LOGGER.debug("Empty read chunk: {}".format(read_chunk_key))
 
+    def estimate_chunk_memory(self, chunk_key, num_reads):
+        """
+        Estimate memory used to process a chunk, for budgeted scheduling.
+
+        By default this is proportional to the chunk's read count; override
+        this if a processor's memory use depends on the chunk differently.
+
+        :param str chunk_key: identifier of the reads chunk, e.g. chromosome.
+        :param int num_reads: number of reads in the chunk, per the index.
+        :return int: estimated memory cost, in bytes.
+        """
+        return num_reads * MEMORY_PER_READ
+
     def fetch_file(self, file_key):
         """
         Retrieve one of the files registered with pararead.
@@ -274,10 +472,12 @@ class ParaReadProcessor(object):
                     chrom, known=self._size_by_chromosome.keys())
 
 
-    def register_files(self, **file_builder_kwargs):
+    def register_files(self, shared_data=None, **file_builder_kwargs):
         """
         Add to module map any large/unpicklable variables required by __call__.
 
+        :param Mapping[str, object] shared_data: read-only data for the
+            workers, by name; see register_shared().
         :raise pararead.exceptions.FileTypeException: if path to the reads file
             given doesn't appear to match one of the supported file types.
         """
@@ -309,21 +509,175 @@ class ParaReadProcessor(object):
                 readsfile.close()
         atexit.register(ensure_closed)
 
-    def run(self, chunksize=None, interleave_chunk_sizes=False):
+        for name, data in (shared_data or {}).items():
+            self.register_shared(name, data)
+
+    def register_shared(self, name, data):
+        """
+        Register read-only data for use by the workers, without copying.
+
+        The data are stored as compact arrays in the temporary folder, which
+        each worker maps into memory (see pararead.shared); the processor
+        carries only where to find them.
+
+        :param str name: name by which to get the data with shared().
+        :param object data: data as accepted by pararead.shared.share():
+            an array, positions by chromosome, or intervals, or data already
+            stored for sharing.
+        :return pararead.shared.SharedArray | pararead.shared.SharedIntervals
+            | pararead.shared.SharedPositions: the stored data.
+        """
+        self._shared[name] = share(data, folder=self.temp_folder)
+        _LOGGER.debug("Registered shared data '%s'", name)
+        return self._shared[name]
+
+    def shared(self, name):
+        """
+        Get read-only data registered for sharing with the workers.
+
+        :param str name: name with which the data were registered.
+        :return pararead.shared.SharedArray | pararead.shared.SharedIntervals
+            | pararead.shared.SharedPositions: the data.
+        :raise pararead.exceptions.CommandOrderException: if no data have
+            been registered with the given name.
+        """
+        try:
+            return self._shared[name]
+        except KeyError:
+            raise CommandOrderException(
+                "No shared data '{}' established; has {} been called?".format(
+                    name, ParaReadProcessor.register_shared.__name__))
+
+    def run(self, chunksize=None, interleave_chunk_sizes=False,
+            retries=0, retry_backoff=1.0, chunk_timeout=None,
+            memory_budget=None, chunk_cost=None, pipeline=None,
+            ordered_output=None,
+            reorder_buffer_size=DEFAULT_REORDER_BUFFER_SIZE, profile=None,
+            in_process=None, chrom_sep=None):
         """
         Do the processing defined partitioned across each unit (chromosome).
 
+        Chunks are processed in isolation from one another: if processing
+        of a chunk raises an exception, exceeds the time limit, or kills its
+        worker process, the chunk is retried as allowed and then treated as
+        a chunk with a null result, while processing of the others continues.
+
         :param int chunksize: number of reads per processing chunk; if
             unspecified, the default heuristic of size s.t. each core gets ~ 4
             chunks.
         :param bool interleave_chunk_sizes: whether to interleave reads chunk
             sizes. If off (default), just use the distribution that Python
             determines.
+        :param int retries: number of additional attempts to make for a chunk
+            of reads for which processing fails.
+        :param float retry_backoff: seconds to wait before retrying a failed
+            chunk; this doubles with each subsequent attempt.
+        :param float chunk_timeout: maximum number of seconds for processing
+            of a single chunk; this is enforced only with multiple cores.
+        :param int | str memory_budget: limit on the total estimated memory
+            cost, in bytes (or a size like '8G'), of the chunks processed at
+            once; expensive chunks wait while cheaper ones fill free cores.
+        :param callable chunk_cost: function of chunk key and number of reads
+            in the chunk that estimates memory cost of processing the chunk;
+            if unspecified, use the processor's estimate_chunk_memory(). A
+            chunk without an estimate of its reads, e.g. from a partitioner
+            that doesn't count them, isn't costed, so isn't held back.
+        :param pararead.pipeline.Pipeline | Iterable pipeline: stages through
+            which to stream each chunk's output (as a ChunkOutput with path
+            given by _tempf) as soon as processing of the chunk succeeds.
+            Stages run in this process, overlapping with the processing of
+            other chunks; when they fall behind, submission of chunks to
+            workers pauses until they catch up. A failed chunk is passed
+            along with null result.
+        :param bool ordered_output: whether to write the final output file
+            while processing, in header order of chromosomes: each chunk's
+            output is written once those of all preceding chunks have been.
+            This obviates combine(). By default, per the processor's
+            ordered_output attribute.
+        :param int | str reorder_buffer_size: with ordered output, maximum
+            size (in bytes, or e.g. '64M') of the chunk output held in memory
+            while awaiting output of a preceding chunk; beyond this, output
+            stays on disk until its turn.
+        :param str profile: path to which to write a profile of the run: each
+            chunk is processed under cProfile, and the chunks' profiles are
+            merged into this pstats file. The seconds each chunk spent
+            fetching reads, computing, and writing output are tabulated in
+            a file alongside it, with extension '.phases.tsv'; see
+            pararead.profiling.
+        :param bool in_process: whether to process chunks serially in this
+            process rather than in a pool of worker processes; by default,
+            only with a single core. A pool, even of one worker, enforces the
+            time limit and survives a chunk that kills its worker.
+        :param str chrom_sep: with ordered output, delimiter to write after
+            each chunk's output, as by combine(); none with a single chunk.
+            As it's written along with the chunk's output, it's kept even if
+            just one chunk ultimately succeeds, unlike by combine().
         :return Iterable[str]: names of chromosomes for which result is non-null.
         :raise pararead.exception.MissingHeaderException: if attempting to run
             with an unaligned reads file in the context of an aligned file
             requirement.
         """
+        plan = self._prepare_run(
+                chunksize=chunksize,
+                interleave_chunk_sizes=interleave_chunk_sizes,
+                retries=retries, retry_backoff=retry_backoff,
+                chunk_timeout=chunk_timeout, memory_budget=memory_budget,
+                chunk_cost=chunk_cost, pipeline=pipeline,
+                ordered_output=ordered_output,
+                reorder_buffer_size=reorder_buffer_size, profile=profile,
+                in_process=in_process, chrom_sep=chrom_sep)
+        result_by_nonempty = {}
+        if plan.pipeline is None:
+            result_by_nonempty.update(plan.executor.imap(plan.nonempties))
+        else:
+            with plan.pipeline:
+                for chunk, result in plan.executor.imap(plan.nonempties):
+                    result_by_nonempty[chunk] = result
+                    plan.pipeline.put(ChunkOutput(
+                            chunk, self._tempf(chunk), result))
+        return self._collect_results(plan, result_by_nonempty)
+
+    def arun(self, **run_kwargs):
+        """
+        Do the processing, as a coroutine to await from an asyncio event loop.
+
+        Workers are supervised from the event loop itself, without a thread
+        of its own, so many jobs may be run concurrently by one process. If
+        the awaiting task is cancelled, workers are stopped and temporary
+        files are removed. Use aiter_run() to monitor progress.
+
+        :param run_kwargs: arguments for run(); see its documentation.
+        :return coroutine: awaitable for the names of chromosomes for which
+            result is non-null.
+        """
+        return self.aiter_run(**run_kwargs).result()
+
+    def aiter_run(self, **run_kwargs):
+        """
+        Do the processing, asynchronously iterating over events as it goes.
+
+        :param run_kwargs: arguments for run(); see its documentation.
+        :return pararead.aio.AsyncRun: asynchronous iterable of events:
+            each chunk's completion, and progress after each; once iteration
+            is over, it holds the names of chromosomes with non-null result.
+        """
+        from .aio import AsyncRun
+        return AsyncRun(self, **run_kwargs)
+
+    def _prepare_run(self, chunksize=None, interleave_chunk_sizes=False,
+                     retries=0, retry_backoff=1.0, chunk_timeout=None,
+                     memory_budget=None, chunk_cost=None, pipeline=None,
+                     ordered_output=None,
+                     reorder_buffer_size=DEFAULT_REORDER_BUFFER_SIZE,
+                     profile=None, in_process=None, chrom_sep=None):
+        """
+        Determine the chunks to process and set up the processing machinery.
+
+        :param bool in_process: whether to process chunks in this process
+            rather than in a worker pool; by default, only with one core.
+        :return pararead.processor._RunPlan: empty and nonempty chunks, the
+            executor for the nonempty ones, and the pipeline for outputs.
+        """
         # Because this class is a function class (implements __call__), I can
         # call "self()" as a function, which is what runs the match function
         # on a single chromosome. By mapping self() across multiple chroms,
@@ -337,36 +691,29 @@ class ParaReadProcessor(object):
                     "before 'run'".format(READS_FILE_KEY))
             raise
 
-        if not self.by_chromosome:
-            read_chunk_keys = self.chunk_reads(readsfile, chunksize=chunksize)
+        if ordered_output is None:
+            ordered_output = self.ordered_output
+        if ordered_output and self.intermediate_output_type in \
+                (RECORDS_OUTPUT_TYPE, ARROW_OUTPUT_TYPE):
+            raise ValueError("Binary records can't be written in order "
+                             "while processing; use combine()")
+        if ordered_output and self.tabix is not None:
+            raise ValueError("Output for tabix is compressed and indexed by "
+                             "combine(), not written while processing")
+
+        if self.auto_cores:
+            self.cores, self._num_chunks = self._max_cores, None
+        partitioner = self.partitioner
+        if partitioner is None:
+            # Arbitrary chunks of contiguous reads, of unknown content.
+            partition = [ChunkEstimate(c, None) for c in
+                         self.chunk_reads(readsfile, chunksize=chunksize)]
         else:
-            size_by_chromosome = parse_bam_header(
-                readsfile=readsfile, chroms=self.limit,
-                require_aligned=self.require_aligned)
-            if self.cores == 1:
-                # TODO: handle case (unaligned input) of null return.
-                # TODO: pysam's fetch() may make this OK but not distribute.
-                read_chunk_keys = size_by_chromosome.keys()
-            else:
-                if size_by_chromosome is None:
-                    # Unaligned files lack any chrom header lines.
-                    # If so, we'll get back a null to disambiguate
-                    # empty filter case if permitting unaligned
-                    # input. If requiring aligned input, the call
-                    # will have already generated an exception to that effect.
-                    _LOGGER.warning(
-                            "Failed attempt to parse chromosomes as read "
-                            "chunk keys; arbitrarily chunking reads instead.")
-                    read_chunk_keys = self.chunk_reads(
-                            readsfile, chunksize=chunksize)
-                else:
-                    if interleave_chunk_sizes:
-                        # Interleave chromosomes by size so that if tasks are
-                        # pre-allocated to workers, we'll get about even bins.
-                        read_chunk_keys = interleave_chromosomes_by_size(
-                                size_by_chromosome.items())
-                    else:
-                        read_chunk_keys = size_by_chromosome.keys()
+            partition = partitioner.partition(self, readsfile)
+            if self.auto_cores:
+                partition = self._tune(partitioner, readsfile, partition)
+        _LOGGER.info("Partitioned reads into {} chunk(s) with {}".
+                     format(len(partition), partitioner))
 
         _LOGGER.info("Temporary files will be stored in: '{}'".
                      format(self.temp_folder))
@@ -380,14 +727,106 @@ class ParaReadProcessor(object):
         except AttributeError:
             pass
 
-        # TODO: handle non-chromosome-based case.
-        idxstats = readsfile.get_index_statistics()
-        reads_by_chrom = {istat.contig: istat.total for istat in idxstats}
-        empties, nonempties = [], []
-        for c in read_chunk_keys:
-            target = empties if 0 == reads_by_chrom[c] else nonempties
-            target.append(c)
+        empties = [e.chunk for e in partition if e.num_reads == 0]
+        nonempties = [e for e in partition if e.num_reads != 0]
+        if interleave_chunk_sizes and self.cores > 1 and \
+                all(e.num_reads is not None for e in nonempties):
+            # Interleave chunks by size so that if tasks are pre-allocated
+            # to workers, we'll get about even bins.
+            nonempties = interleave_chromosomes_by_size(nonempties)
+        else:
+            nonempties = [e.chunk for e in nonempties]
+        _LOGGER.debug("%d empty chunk(s): %s", len(empties), empties)
+
+        cost_by_chunk = None
+        if memory_budget is not None:
+            memory_budget = parse_memory_size(memory_budget)
+            chunk_cost = chunk_cost or self.estimate_chunk_memory
+            cost_by_chunk = {e.chunk: chunk_cost(e.chunk, e.num_reads)
+                             for e in partition if e.num_reads}
+            unestimated = [e.chunk for e in partition if e.num_reads is None]
+            if unestimated:
+                # Such a chunk is admitted as if it cost nothing.
+                _LOGGER.warning(
+                        "No estimate of reads for %d chunk(s), to which the "
+                        "memory budget doesn't apply", len(unestimated))
+            _LOGGER.info("Memory budget: %d bytes", memory_budget)
+
+        func = self if self.tabix is None else _CompressAndIndex(self)
+        if profile is not None:
+            from .profiling import ChunkProfiler
+            func = ChunkProfiler(func, self)
+            _LOGGER.info("Profiling processing of chunks: '%s'", profile)
+        executor = ChunkExecutor(
+                func, cores=self.cores, retries=retries,
+                retry_backoff=retry_backoff, timeout=chunk_timeout,
+                memory_budget=memory_budget, chunk_cost=cost_by_chunk,
+                in_process=in_process)
+        if pipeline is not None and not isinstance(pipeline, Pipeline):
+            pipeline = Pipeline(pipeline)
+        if ordered_output:
+            order = [e.chunk for e in partition if e.num_reads != 0]
+            if partitioner is not None:
+                order = partitioner.output_order(readsfile, order)
+            writer = OrderedWriter(
+                    self.outfile, order=order, chrom_sep=chrom_sep,
+                    max_buffer_size=parse_memory_size(reorder_buffer_size))
+            _LOGGER.info("Writing output in order: '%s'", self.outfile)
+            if pipeline is None:
+                pipeline = Pipeline([writer])
+            else:
+                pipeline = Pipeline(pipeline.stages + [writer],
+                                    queue_size=pipeline.queue_size)
+        return _RunPlan(empties, nonempties, executor, pipeline, profile)
+
+    def _tune(self, partitioner, readsfile, partition):
+        """
+        Choose the number of chunks and of cores, by calibration.
+
+        :param pararead.partition.Partitioner partitioner: strategy with
+            which the reads were split into chunks.
+        :param pysam.AlignmentFile readsfile: the registered reads file.
+        :param list[pararead.partition.ChunkEstimate] partition: chunks as
+            split for all available cores.
+        :return list[pararead.partition.ChunkEstimate]: chunks as split for
+            the number of chunks chosen.
+        """
+        nonempties = [e for e in partition if e.num_reads != 0]
+        if not nonempties or any(e.num_reads is None for e in nonempties):
+            _LOGGER.info("No counts of reads by which to tune; using %d "
+                         "core(s)", self.cores)
+            return partition
+        largest = max(nonempties, key=lambda e: e.num_reads)
+        smallest = min(nonempties, key=lambda e: e.num_reads)
+        calibration = calibrate(self, largest.chunk, smallest.chunk)
+        if calibration is None:
+            _LOGGER.info("Processing doesn't pull reads with fetch_chunk(), "
+                         "so can't be calibrated; using %d core(s)",
+                         self.cores)
+            return partition
+        _LOGGER.info("Calibrated with '%s': %.0f reads/s, %.4fs per chunk",
+                     largest.chunk, *calibration)
+        num_chunks = choose_num_chunks(
+                sum(e.num_reads for e in nonempties), calibration, self.cores)
+        if num_chunks != self.cores * CHUNKS_PER_CORE:
+            self._num_chunks = num_chunks
+            partition = partitioner.partition(self, readsfile)
+        times = chunk_times([e.num_reads for e in partition
+                             if e.num_reads != 0], calibration)
+        self.cores = choose_workers(times, self._max_cores)
+        _LOGGER.info("Chose %d of %d available core(s) for %d chunk(s); "
+                     "estimated time: %.2fs", self.cores, self._max_cores,
+                     len(times), estimate_makespan(times, self.cores))
+        return partition
+
+    def _collect_results(self, plan, result_by_nonempty):
+        """
+        Bin chunks by whether processing was successful, and log the outcome.
 
+        :param pararead.processor._RunPlan plan: the chunks processed.
+        :param Mapping result_by_nonempty: result for each nonempty chunk.
+        :return Iterable[str]: names of chunks for which result is non-null.
+        """
         # Maps for order preservation. This permits arbitrary result return,
         # i.e. something other than the chunk key itself, when the process
         # completes. It would be a bit simpler to filter on the results
@@ -395,18 +834,11 @@ class ParaReadProcessor(object):
         # has a result with meaning beyond a signal/flag that it succeeded
         # for a particular chunk ID. That is, it may produce a result with
         # downstream meaning, and not be used simply for effect on disk.
-        if self.cores == 1:
-            results = map(self, nonempties)
-        else:
-            workers = multiprocessing.Pool(self.cores)
-            # The typical call to map fails to acknowledge KeyboardInterrupts.
-            # This fix helps: http://stackoverflow.com/a/1408476/946721
-
-            results = workers.map_async(self, nonempties).get(9999999)
+        results = [result_by_nonempty.get(c) for c in plan.nonempties]
 
         # TODO: note the dependence on order here.
-        result_by_chunk = [(c, self.empty_action(c)) for c in empties] + \
-                           list(zip(nonempties, results))
+        result_by_chunk = [(c, self.empty_action(c)) for c in plan.empties] + \
+                           list(zip(plan.nonempties, results))
         bad_chunks, good_chunks = \
                 partition_chunks_by_null_result(result_by_chunk)
 
@@ -418,21 +850,88 @@ class ParaReadProcessor(object):
         else:
             _LOGGER.info("Using all reads")
 
+        if plan.profile is not None:
+            self._report_profile(plan.nonempties, plan.profile)
         return good_chunks
 
+    def _report_profile(self, chunks, path):
+        """
+        Merge the chunks' profiles, and tabulate the time in each phase.
+
+        :param Iterable[str] chunks: the chunks processed under profiling.
+        :param str path: path to which to write the merged profile; the time
+            in each phase is written alongside, with extension '.phases.tsv'.
+        """
+        from .profiling import \
+            merge_profiles, phase_times, PHASES, PHASES_EXTENSION, \
+            PROFILE_EXTENSION
+        stems = [self._tempf(c) for c in chunks]
+        if merge_profiles(["{}.{}".format(s, PROFILE_EXTENSION)
+                           for s in stems], path) is None:
+            _LOGGER.warning("No chunk's profile to merge")
+            return
+        timings = list(phase_times(
+                "{}.{}".format(s, PHASES_EXTENSION) for s in stems
+                if os.path.exists("{}.{}".format(s, PHASES_EXTENSION))))
+        with open("{}.phases.tsv".format(path), 'w') as f:
+            f.write("\t".join(("chunk", ) + PHASES + ("total", )) + "\n")
+            for timing in timings:
+                f.write("\t".join([timing[0]] + ["{:.6f}".format(t)
+                                                  for t in timing[1:]]))
+                f.write("\n")
+        totals = [sum(t[i] for t in timings) for i in range(1, 5)]
+        _LOGGER.info("Profile of %d chunk(s) written: '%s'; seconds "
+                     "fetching %.3f, computing %.3f, writing %.3f, of %.3f",
+                     len(timings), path, *totals)
+
     def fetch_chunk(self, chromosome):
         """
         Pull a chunk of sequencing reads from a file.
+
+        Only reads that meet the processor's read_filter criteria are pulled.
         
-        :param str chromosome: identifier for chunk of reads to select.
+        :param str | pararead.regions.RegionChunk |
+            pararead.namesorted.NameChunk chromosome: identifier for chunk of
+            reads to select, as made by the processor's partitioner.
         :return Iterable[pysam.AlignedSegment]: collection of aligned reads
         """
-        if not self.by_chromosome:
+        partitioner = self.partitioner
+        if partitioner is None:
             raise NotImplementedError(
-                    "Provide a fetch_chunk implementation "
+                    "Provide a partitioner or a fetch_chunk implementation "
                     "if not partitioning reads by chromosome.")
-        readsfile = PARA_READ_FILES[READS_FILE_KEY]
-        return readsfile.fetch(chromosome, multiple_iterators=True)
+        return self.read_filter.filter(partitioner.fetch(self, chromosome))
+
+    def fetch_templates(self, chunk):
+        """
+        Pull the reads of a chunk by name, grouped by name.
+
+        Reads that fail the processor's read_filter criteria are left out of
+        the groups, so a group may lack some of a template's records.
+
+        :param pararead.namesorted.NameChunk chunk: chunk of reads by name.
+        :return Iterable[list[pysam.AlignedSegment]]: records of each name
+            (e.g., mates of a pair), in file order.
+        """
+        return group_by_name(self.fetch_chunk(chunk))
+
+    def open_reads_file(self):
+        """
+        Open a handle on the reads file of one's own.
+
+        Reads file handles registered before a worker pool starts are shared
+        by the workers; iterating with one of them in several processes at
+        once corrupts the reading. A separate handle avoids this for work
+        that needs more than fetch() with multiple iterators.
+
+        :return pysam.AlignmentFile | pysam.VariantFile: newly opened reads
+            file; the caller is responsible for closing it.
+        """
+        reads_file_maker = create_reads_builder(self.path_reads_file)
+        kwargs = dict(reads_file_maker.kwargs)
+        if not self.require_aligned:
+            kwargs['check_sq'] = False
+        return reads_file_maker.ctor(self.path_reads_file, **kwargs)
 
     def combine(self, good_chromosomes, strict=False, chrom_sep=None):
         """
@@ -457,13 +956,12 @@ class ParaReadProcessor(object):
             _LOGGER.warning("No successful chromosomes, so no combining.")
             return
 
-        # Check that the combination request accords with the chunks
-        # declared to be of interest
-        if self.limit:
-            missing_chunks = set(good_chromosomes) - set(self.limit)
-            if missing_chunks:
-                raise IllegalChunkException(
-                        requested=missing_chunks, of_interest=self.limit)
+        self._check_chunks_of_interest(good_chromosomes)
+
+        if self.output_type in COLUMNAR_OUTPUT_TYPES:
+            return self._combine_tables(good_chromosomes, strict)
+        if self.tabix is not None:
+            return self._combine_indexed(good_chromosomes, strict)
 
         _LOGGER.info("Merging {} files into output file: '{}'".
                      format(len(good_chromosomes), self.outfile))
@@ -477,31 +975,186 @@ class ParaReadProcessor(object):
             chrom_sep = None
 
         with open(self.outfile, 'w') as outfile:
-            for chrom in good_chromosomes:
-                reads_chunk_output = self._tempf(chrom)
-
-                # Handle case in which chunk's output is missing.
-                if not os.path.exists(reads_chunk_output):
-                    if strict:
-                        raise MissingOutputFileException(
-                                reads_chunk_key=chrom,
-                                filepath=reads_chunk_output)
-                    else:
-                        _LOGGER.warning(
-                                "Missing output file for reads chunk '%s', "
-                                "skipping: '%s'", chrom, reads_chunk_output)
-                        continue
-
-                # Append lines from this chunk's output.
-                with open(reads_chunk_output, 'r') as tmpf:
-                    for line in tmpf:
-                        outfile.write(line)
+            for _, reads_chunk_output in \
+                    self._chunk_outputs(good_chromosomes, strict):
+                if self.intermediate_output_type in \
+                        (RECORDS_OUTPUT_TYPE, ARROW_OUTPUT_TYPE):
+                    # Binary records are formatted only now, as text.
+                    for record in self._read_chunk_records(
+                            reads_chunk_output):
+                        outfile.write(self.format_record(record))
+                else:
+                    # Append lines from this chunk's output.
+                    with open(reads_chunk_output, 'r') as tmpf:
+                        for line in tmpf:
+                            outfile.write(line)
                 if chrom_sep:
                     outfile.write(chrom_sep)
                 paths_combined_files.append(reads_chunk_output)
 
         return paths_combined_files
 
+    def write_chunk_records(self, chunk, field_types, records, columns=None):
+        """
+        Store a chunk's output as binary records rather than text.
+
+        This is for use in __call__(), by a processor constructed with
+        intermediate_output_type RECORDS_OUTPUT_TYPE, or ARROW_OUTPUT_TYPE
+        to store the records as a table; values are stored as they are, so
+        combine() needn't parse them back from text.
+
+        :param str | pararead.regions.RegionChunk chunk: chunk of reads.
+        :param Iterable[type] field_types: type of each field of a record;
+            see pararead.records.field_codes().
+        :param Iterable[Sequence] records: the chunk's output records.
+        :param Iterable[str] columns: name of each field; required for a
+            table.
+        :return str: path to the chunk's output.
+        :raise ValueError: if storing a table without column names.
+        """
+        path = self._tempf(chunk)
+        if self.intermediate_output_type != ARROW_OUTPUT_TYPE:
+            return write_records(path, field_types, records)
+        if columns is None:
+            raise ValueError("Column names are required to store a table")
+        return write_table(path, columns, field_types, records)
+
+    def chunk_records(self, chunks, strict=False):
+        """
+        Read the binary records stored as each chunk's output.
+
+        :param Iterable[str] chunks: identifiers of chunks of interest.
+        :param bool strict: whether a missing output file is exceptional,
+            rather than warned about and skipped.
+        :return Iterable[(str, Iterable[tuple])]: pairs of chunk and its
+            records, which are read as they're iterated.
+        """
+        for chunk, path in self._chunk_outputs(chunks, strict):
+            yield chunk, self._read_chunk_records(path)
+
+    def format_record(self, record):
+        """
+        Format a record of binary intermediate output for the final output.
+
+        :param tuple record: values of the record's fields.
+        :return str: line of output, tab-separated by default.
+        """
+        return "\t".join(str(field) for field in record) + "\n"
+
+    def _combine_tables(self, chunks, strict=False):
+        """
+        Assemble the chunks' tables into the columnar final output.
+
+        :param Iterable[str] chunks: identifiers of chunks to combine.
+        :param bool strict: whether a missing output file is exceptional,
+            rather than warned about and skipped.
+        :return list[str]: path to each file combined.
+        :raise ValueError: if the chunks' output isn't stored as tables.
+        """
+        if self.intermediate_output_type != ARROW_OUTPUT_TYPE:
+            raise ValueError(
+                    "Columnar output ('{}') requires chunks' output as "
+                    "tables, i.e. intermediate_output_type '{}'".format(
+                            self.output_type, ARROW_OUTPUT_TYPE))
+        outputs = list(self._chunk_outputs(chunks, strict))
+        _LOGGER.info("Assembling {} table(s) into {} output file: '{}'".
+                     format(len(outputs), self.output_type, self.outfile))
+        paths = [path for _, path in outputs]
+        combine_tables(paths, self.outfile, self.output_type,
+                       chunks=[chunk for chunk, _ in outputs])
+        return paths
+
+    def compress_chunk_output(self, chunk):
+        """
+        Compress a chunk's output into BGZF blocks, noting the offsets of its
+        lines for the index, as is done in the worker for output for tabix.
+
+        :param str | pararead.regions.RegionChunk chunk: chunk of reads.
+        :return int: number of lines indexed.
+        """
+        path = self._tempf(chunk)
+        compressed = path + ".bgz"
+        num_lines = compress_and_index(
+                path, compressed, self.tabix, self._index_entries_file(chunk))
+        os.rename(compressed, path)
+        return num_lines
+
+    def _combine_indexed(self, chunks, strict=False):
+        """
+        Join the chunks' compressed output into the final output, in order
+        of position, and write its tabix index.
+
+        :param Iterable[str] chunks: identifiers of chunks to combine.
+        :param bool strict: whether a missing output file is exceptional,
+            rather than warned about and skipped.
+        :return list[str]: path to each file combined.
+        """
+        if self.partitioner is not None:
+            chunks = self.partitioner.output_order(self.readsfile, chunks)
+        outputs = list(self._chunk_outputs(chunks, strict))
+        _LOGGER.info("Joining {} compressed file(s) into output file: '{}'".
+                     format(len(outputs), self.outfile))
+        index_path = concatenate_indexed(
+                [(path, self._index_entries_file(chunk))
+                 for chunk, path in outputs],
+                self.outfile, self.tabix, self.index_type)
+        _LOGGER.info("Wrote index: '{}'".format(index_path))
+        return [path for _, path in outputs]
+
+    def _index_entries_file(self, chunk):
+        """ Path to the index entries of a chunk's compressed output. """
+        return self._tempf(chunk) + ".idx"
+
+    def _read_chunk_records(self, path):
+        """ Read a chunk's binary records, or the records of its table. """
+        if self.intermediate_output_type == ARROW_OUTPUT_TYPE:
+            return read_table_records(path)
+        return read_records(path)
+
+    def _check_chunks_of_interest(self, chunks):
+        """
+        Check that a combination request accords with the chunks declared
+        to be of interest.
+
+        :param Iterable[str] chunks: identifiers of chunks to combine.
+        :raise pararead.exceptions.IllegalChunkException: if a chunk outside
+            of those declared to be of interest is requested.
+        """
+        if self.limit:
+            missing_chunks = {c for c in chunks
+                              if _chromosome(c) not in set(self.limit)}
+            if missing_chunks:
+                raise IllegalChunkException(
+                        requested=missing_chunks, of_interest=self.limit)
+
+    def _chunk_outputs(self, chunks, strict=False):
+        """
+        Pair each chunk with the path to its output, skipping missing ones.
+
+        :param Iterable[str] chunks: identifiers of chunks of interest.
+        :param bool strict: whether a missing output file is exceptional,
+            rather than warned about and skipped.
+        :return Iterable[(str, str)]: pairs of chunk and path to its output.
+        :raise pararead.exceptions.MissingOutputFileException: if executing in
+            strict mode, and there's a reads chunk key for which the derived
+            filepath does not exist.
+        """
+        for chrom in chunks:
+            reads_chunk_output = self._tempf(chrom)
+
+            # Handle case in which chunk's output is missing.
+            if not os.path.exists(reads_chunk_output):
+                if strict:
+                    raise MissingOutputFileException(
+                            reads_chunk_key=chrom,
+                            filepath=reads_chunk_output)
+                else:
+                    _LOGGER.warning(
+                            "Missing output file for reads chunk '%s', "
+                            "skipping: '%s'", chrom, reads_chunk_output)
+                    continue
+            yield chrom, reads_chunk_output
+
     @pending_feature
     def chunk_reads(self, readsfile, chunksize=None):
         """
@@ -0,0 +1,485 @@
+"""
+Ready-made processors for common summaries of sequencing reads.
+
+Each processor tallies counts for a chunk of reads (e.g., a chromosome) in
+its worker, writes the tally as the chunk's output, and sums the tallies
+in memory in combine() to produce the final output table.
+"""
+
+import abc
+from collections import Counter, namedtuple, OrderedDict
+import logging
+import os
+import shutil
+import tempfile
+
+from .columnar import combine_tables, write_table, COLUMNAR_OUTPUT_TYPES
+from .filters import \
+    FLAG_PROPER_PAIR, FLAG_READ1, FLAG_SECONDARY, FLAG_SUPPLEMENTARY
+from .processor import ParaReadProcessor, PARA_READ_FILES
+from .records import read_records, RECORDS_OUTPUT_TYPE
+from .regions import merge_intervals, parse_regions, RegionChunk
+from .shared import IntervalIndex
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["SummaryProcessor", "ReadCounter", "RegionReadCounter",
+           "BinnedCoverage", "InsertSizeHistogram", "MapqFlagSummary",
+           "StrandCounter", "FeatureReadCounter", "ReadCounts",
+           "count_reads"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of reads per lookup of overlapping features.
+DEFAULT_LOOKUP_BATCH_SIZE = 1000
+
+
+class SummaryProcessor(ParaReadProcessor):
+    """
+    Base for processors that tally counts per chunk and sum them in combine().
+
+    A concrete implementation defines tally(), which maps a tuple of key
+    fields to an integer count for one chunk. The chunk's tally is stored
+    as binary records of key fields and count, typed by key_types; combine()
+    reads these back, sums counts across chunks, and writes one row per key,
+    formatted by format_row(), as text or, with output_type 'parquet' or
+    'arrow', as a columnar table.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    # Column names for the final output, and types of the key fields.
+    columns = None
+    key_types = (str, )
+    # Whether to sort the final rows by key rather than keep chunk order.
+    sort_keys = False
+    # Format of floating-point fields in text output; columnar output keeps
+    # the values themselves.
+    float_format = "{}"
+
+    @abc.abstractmethod
+    def tally(self, chunk):
+        """
+        Count whatever's being summarized within one chunk of reads.
+
+        :param str chunk: identifier of the reads chunk, e.g. chromosome.
+        :return Mapping[tuple, int]: count for each key.
+        """
+        pass
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("intermediate_output_type", RECORDS_OUTPUT_TYPE)
+        super(SummaryProcessor, self).__init__(*args, **kwargs)
+
+    def __call__(self, chunk):
+        counts = self.tally(chunk)
+        self.write_chunk_records(
+                chunk, tuple(self.key_types) + (int, ),
+                (key + (count, ) for key, count in counts.items()))
+        return chunk
+
+    def format_row(self, key, count):
+        """
+        Determine the fields of the output row for one key.
+
+        :param tuple key: key fields.
+        :param int count: total count for the key.
+        :return Iterable: fields of the output row.
+        """
+        return key + (count, )
+
+    def read_tally(self, path):
+        """
+        Parse a chunk's stored tally.
+
+        :param str path: path to the chunk's output file.
+        :return Iterable[(tuple, int)]: pairs of key and count.
+        """
+        for record in read_records(path):
+            yield record[:-1], record[-1]
+
+    def combine(self, good_chromosomes, strict=False, chrom_sep=None):
+        """
+        Sum the chunks' tallies and write the final table.
+
+        :param Iterable[str] good_chromosomes: identifier (e.g., chromosome)
+            for each chunk of reads processed.
+        :param bool strict: whether to throw an exception upon encountering a
+            missing file rather than logging a warning and skipping it.
+        :param str chrom_sep: unused, as rows are written per key rather than
+            per chunk; accepted for compatibility.
+        :return Iterable[str]: path to each file successfully combined.
+        """
+        if not good_chromosomes:
+            _LOGGER.warning("No successful chromosomes, so no combining.")
+            return
+        self._check_chunks_of_interest(good_chromosomes)
+
+        totals = OrderedDict()
+        paths_combined_files = []
+        for _, path in self._chunk_outputs(good_chromosomes, strict):
+            for key, count in self.read_tally(path):
+                totals[key] = totals.get(key, 0) + count
+            paths_combined_files.append(path)
+
+        _LOGGER.info("Writing %d rows from %d chunk(s) to output file: '%s'",
+                     len(totals), len(paths_combined_files), self.outfile)
+        keys = sorted(totals) if self.sort_keys else totals.keys()
+        if self.output_type in COLUMNAR_OUTPUT_TYPES:
+            self._write_table([tuple(self.format_row(key, totals[key]))
+                               for key in keys])
+            return paths_combined_files
+        with open(self.outfile, 'w') as outfile:
+            if self.columns:
+                outfile.write("\t".join(self.columns) + "\n")
+            for key in keys:
+                row = self.format_row(key, totals[key])
+                outfile.write("\t".join(self._format_field(field)
+                                        for field in row) + "\n")
+        return paths_combined_files
+
+    def _format_field(self, field):
+        """ Text of one field of an output row. """
+        if isinstance(field, float):
+            return self.float_format.format(field)
+        return str(field)
+
+    def _write_table(self, rows):
+        """ Write the final rows as a columnar table, typed as the values. """
+        if not self.columns:
+            raise ValueError("Columnar output requires column names")
+        field_types = [type(v) for v in rows[0]] if rows \
+            else [str] * len(self.columns)
+        path = write_table(os.path.join(self.temp_folder, "final.arrow"),
+                           self.columns, field_types, rows)
+        combine_tables([path], self.outfile, self.output_type)
+
+
+class ReadCounter(SummaryProcessor):
+    """
+    Count reads per chromosome, optionally only those passing filters.
+
+    With use_index, the counts come straight from the index statistics, so
+    no reads are decoded; otherwise the reads are counted by iteration.
+    Filters on reads (see pararead.filters.ReadFilter) require iteration.
+    """
+
+    columns = ("chrom", "reads")
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param bool use_index: whether to take counts from the index.
+        :param int flag_required: count only reads with all of these flag
+            bits set.
+        :param int flag_excluded: count only reads with none of these flag
+            bits set.
+        :param int min_mapq: count only reads with at least this mapping
+            quality.
+        :raise ValueError: if asked to use the index and to filter reads.
+        """
+        self.use_index = kwargs.pop("use_index", False)
+        self.flag_required = kwargs.pop("flag_required", 0)
+        self.flag_excluded = kwargs.pop("flag_excluded", 0)
+        self.min_mapq = kwargs.pop("min_mapq", 0)
+        super(ReadCounter, self).__init__(*args, **kwargs)
+        if self.use_index and self.read_filter:
+            raise ValueError("Index statistics can't count filtered reads")
+
+    def tally(self, chunk):
+        if self.use_index:
+            for istat in self.readsfile.get_index_statistics():
+                if istat.contig == chunk:
+                    return {(chunk, ): istat.total}
+            return {(chunk, ): 0}
+        return {(chunk, ): sum(1 for _ in self.fetch_chunk(chunk))}
+
+
+class RegionReadCounter(ReadCounter):
+    """
+    Count reads overlapping each of a collection of genomic regions.
+
+    A read that overlaps more than one region is counted per the
+    processor's region_ownership rule: with 'overlap' (the default), in the
+    first region it overlaps; with 'start', in the region that contains its
+    start, if any; without a rule, in every region it overlaps. With a rule,
+    the counts of a chromosome's regions sum to its distinct reads.
+    """
+
+    columns = ("chrom", "start", "end", "reads")
+    key_types = (str, int, int)
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param str | Iterable[(str, int, int)] regions: path to a BED file,
+            or chromosome, 0-based start, and exclusive end of each region
+            of interest, as for ParaReadProcessor; overlapping or abutting
+            regions are merged. Chunks remain whole chromosomes, with a
+            count for each region.
+        """
+        regions = merge_intervals(parse_regions(kwargs.pop("regions")))
+        super(RegionReadCounter, self).__init__(*args, **kwargs)
+        self.regions_by_chromosome = OrderedDict()
+        for chrom, start, end in regions:
+            self.regions_by_chromosome.setdefault(chrom, []).\
+                append((start, end))
+        # There's no point in processing a chromosome without regions.
+        if not self.limit:
+            self.limit = list(self.regions_by_chromosome.keys())
+
+    def tally(self, chunk):
+        counts = OrderedDict()
+        # End of the regions so far; a read starting before it overlaps one.
+        preceding_end = None
+        for start, end in self.regions_by_chromosome.get(chunk, []):
+            # Workers share the file handle, so each needs its own iterator.
+            reads = self.read_filter.filter(self.readsfile.fetch(
+                    chunk, start, end, multiple_iterators=True))
+            if self.region_ownership is not None:
+                region = RegionChunk(chunk, [(start, end)],
+                                     preceding_end=preceding_end,
+                                     ownership=self.region_ownership)
+                reads = (r for r in reads if region.owns(r))
+            counts[(chunk, start, end)] = sum(1 for _ in reads)
+            preceding_end = end if preceding_end is None \
+                else max(preceding_end, end)
+        return counts
+
+
+class BinnedCoverage(SummaryProcessor):
+    """
+    Mean depth of coverage in fixed-size bins along each chromosome.
+
+    Aligned bases are tallied per bin from each read's aligned blocks, so
+    deletions and skipped regions (e.g., introns) don't count as covered.
+    """
+
+    columns = ("chrom", "start", "end", "mean_depth")
+    key_types = (str, int)
+    float_format = "{:.4f}"
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param int bin_size: number of base pairs per bin.
+        """
+        self.bin_size = int(kwargs.pop("bin_size", 10000))
+        super(BinnedCoverage, self).__init__(*args, **kwargs)
+
+    def tally(self, chunk):
+        bin_size = self.bin_size
+        aligned_bases = Counter()
+        for read in self.fetch_chunk(chunk):
+            for block_start, block_end in read.get_blocks():
+                first_bin = block_start // bin_size
+                last_bin = (block_end - 1) // bin_size
+                if first_bin == last_bin:
+                    aligned_bases[first_bin] += block_end - block_start
+                    continue
+                for b in range(first_bin, last_bin + 1):
+                    aligned_bases[b] += \
+                        min(block_end, (b + 1) * bin_size) - \
+                        max(block_start, b * bin_size)
+        return OrderedDict(((chunk, b * bin_size), aligned_bases[b])
+                           for b in sorted(aligned_bases))
+
+    def format_row(self, key, count):
+        chrom, start = key
+        end = min(start + self.bin_size, self.get_chrom_size(chrom))
+        return chrom, start, end, float(count) / (end - start)
+
+
+class InsertSizeHistogram(SummaryProcessor):
+    """
+    Histogram of fragment (insert) size among properly paired reads.
+
+    Each fragment is counted once, via its first read, and secondary and
+    supplementary alignments are ignored.
+    """
+
+    columns = ("insert_size", "fragments")
+    key_types = (int, )
+    sort_keys = True
+    # Proper pair and first in pair; neither secondary nor supplementary.
+    flag_required = FLAG_PROPER_PAIR | FLAG_READ1
+    flag_excluded = FLAG_SECONDARY | FLAG_SUPPLEMENTARY
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param int max_size: fragments longer than this are ignored.
+        """
+        self.max_size = kwargs.pop("max_size", None)
+        super(InsertSizeHistogram, self).__init__(*args, **kwargs)
+
+    def tally(self, chunk):
+        sizes = Counter(
+            abs(r.template_length) for r in self.fetch_chunk(chunk))
+        sizes.pop(0, None)
+        if self.max_size is not None:
+            sizes = {s: n for s, n in sizes.items() if s <= self.max_size}
+        return {(s, ): n for s, n in sizes.items()}
+
+
+class MapqFlagSummary(SummaryProcessor):
+    """ Distributions of mapping quality and of SAM flag value. """
+
+    columns = ("field", "value", "reads")
+    key_types = (str, int)
+    sort_keys = True
+
+    def tally(self, chunk):
+        mapqs, flags = Counter(), Counter()
+        for read in self.fetch_chunk(chunk):
+            mapqs[read.mapping_quality] += 1
+            flags[read.flag] += 1
+        counts = {("FLAG", f): n for f, n in flags.items()}
+        counts.update({("MAPQ", q): n for q, n in mapqs.items()})
+        return counts
+
+
+class StrandCounter(SummaryProcessor):
+    """ Count reads aligned to each strand of each chromosome. """
+
+    columns = ("chrom", "strand", "reads")
+    key_types = (str, str)
+
+    def tally(self, chunk):
+        reverse = Counter(r.is_reverse for r in self.fetch_chunk(chunk))
+        return OrderedDict([((chunk, "+"), reverse[False]),
+                            ((chunk, "-"), reverse[True])])
+
+
+class FeatureReadCounter(SummaryProcessor):
+    """
+    Count reads overlapping each of a collection of features (e.g., genes).
+
+    The features are indexed once, in an IntervalIndex shared with the
+    workers without copying, and each worker looks up its reads in batches.
+    A read overlapping several features with the same name (e.g., exons of
+    a gene) counts once for that name.
+    """
+
+    columns = ("feature", "reads")
+    key_types = (str, )
+    sort_keys = True
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param Iterable[(str, int, int, str)] features: chromosome, 0-based
+            start, exclusive end, and name of each feature.
+        :param int batch_size: number of reads per lookup; default
+            DEFAULT_LOOKUP_BATCH_SIZE.
+        """
+        features = kwargs.pop("features")
+        self.batch_size = kwargs.pop(
+                "batch_size", DEFAULT_LOOKUP_BATCH_SIZE)
+        super(FeatureReadCounter, self).__init__(*args, **kwargs)
+        index = self.register_shared("features", IntervalIndex.create(
+                features, folder=self.temp_folder))
+        # There's no point in processing a chromosome without features.
+        if not self.limit:
+            self.limit = index.chromosomes
+
+    def tally(self, chunk):
+        index = self.shared("features")
+        counts = Counter()
+        batch = []
+        for read in self.fetch_chunk(chunk):
+            batch.append(read)
+            if len(batch) == self.batch_size:
+                self._count_batch(index, batch, counts)
+                batch = []
+        self._count_batch(index, batch, counts)
+        return {(name, ): n for name, n in counts.items()}
+
+    @staticmethod
+    def _count_batch(index, reads, counts):
+        for found in index.overlapping_reads(reads):
+            counts.update({index.name(i) for i in found})
+
+
+class ReadCounts(namedtuple("ReadCounts", field_names=["by_contig", "unplaced"])):
+    """ Number of reads per contig, and of reads without a position. """
+
+    __slots__ = ()
+
+    @property
+    def total(self):
+        return sum(self.by_contig.values()) + self.unplaced
+
+
+def count_reads(path_reads_file, cores=1, chroms=None, regions=None,
+                flag_required=0, flag_excluded=0, min_mapq=0,
+                temp_folder_parent_path=None):
+    """
+    Count reads per contig, from the index alone when possible.
+
+    Without a filter on flag, mapping quality, or region, the counts are
+    the mapped and unmapped totals recorded in the index, so no reads are
+    decompressed. Otherwise, the contigs (or regions) are scanned in
+    parallel; in that case reads without a position aren't counted, and a
+    read overlapping several regions is counted once.
+
+    :param str path_reads_file: path to indexed, coordinate-sorted BAM/CRAM.
+    :param int cores: number of processes for a scan.
+    :param Iterable[str] chroms: contigs of interest; all by default.
+    :param str | Iterable[(str, int, int)] regions: path to a BED file, or
+        chromosome, 0-based start, and exclusive end of each region within
+        which to count reads.
+    :param int flag_required: count only reads with all of these flag bits.
+    :param int flag_excluded: count only reads with none of these flag bits.
+    :param int min_mapq: count only reads with at least this mapping quality.
+    :param str temp_folder_parent_path: where to create the temporary folder
+        for a scan; the system default location if unspecified.
+    :return pararead.processors.ReadCounts: number of reads on each contig
+        of interest, in header order, and number without a position.
+    """
+    # Deferred, as is pysam's import throughout the package's core.
+    from pysam import AlignmentFile
+    with AlignmentFile(path_reads_file, 'rb') as readsfile:
+        index_counts = OrderedDict(
+            (istat.contig, istat.total)
+            for istat in readsfile.get_index_statistics())
+        unplaced = readsfile.nocoordinate
+    if regions is not None:
+        regions = parse_regions(regions)
+        chroms = [c for c in chroms or index_counts
+                  if any(c == r[0] for r in regions)]
+    elif chroms is None:
+        chroms = list(index_counts.keys())
+    by_contig = OrderedDict((c, index_counts.get(c, 0)) for c in chroms)
+    if not (regions is not None or flag_required or flag_excluded or
+            min_mapq):
+        return ReadCounts(by_contig, unplaced)
+
+    _LOGGER.info("Scanning %d contig(s) to count filtered reads",
+                 len(by_contig))
+    tempfolder = tempfile.mkdtemp(dir=temp_folder_parent_path)
+    # Don't disturb files registered by a caller's own processor.
+    registered_files = dict(PARA_READ_FILES)
+    try:
+        kwargs = {"flag_required": flag_required,
+                  "flag_excluded": flag_excluded, "min_mapq": min_mapq,
+                  "limit": list(by_contig.keys()),
+                  "outfile": os.path.join(tempfolder, "counts.txt"),
+                  "temp_folder_parent_path": tempfolder}
+        if regions is None:
+            counter = ReadCounter(path_reads_file, cores, **kwargs)
+        else:
+            # Each read is counted once, in the first region it overlaps.
+            counter = RegionReadCounter(
+                    path_reads_file, cores, regions=regions,
+                    region_ownership="overlap", **kwargs)
+        counter.register_files()
+        for c in by_contig:
+            by_contig[c] = 0
+        for chunk in counter.run():
+            for key, n in counter.read_tally(counter._tempf(chunk)):
+                by_contig[key[0]] += n
+    finally:
+        PARA_READ_FILES.clear()
+        PARA_READ_FILES.update(registered_files)
+        shutil.rmtree(tempfolder)
+    return ReadCounts(by_contig, 0)
@@ -0,0 +1,158 @@
+"""
+Profiling of chunks' processing, to see where the time goes.
+
+When a processor is slow, it helps to know whether time goes to decoding
+reads, to the processor's own code, or to writing its output. With
+profiling, each chunk is processed under cProfile in its worker, which dumps
+the chunk's profile alongside its output, and also times three phases:
+fetching reads (iterating over fetch_chunk()), writing (file writes and
+compression), and computing (the rest). Once processing is done, the chunks'
+profiles are merged into one pstats report, and their phases into a table.
+
+Note that pysam's reading is compiled, so it's invisible to cProfile; it's
+the time in fetch_chunk() iteration that accounts for it. The profiler's
+overhead inflates each phase, so compare phases rather than absolute times.
+"""
+
+import cProfile
+import os
+import pstats
+import re
+from timeit import default_timer
+
+from .records import read_records, write_records
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["ChunkProfiler", "merge_profiles", "phase_times", "write_time",
+           "PHASES"]
+
+
+PHASES = ("fetch", "compute", "write")
+
+# Extensions of a chunk's profile, and of its record of time in each phase.
+PROFILE_EXTENSION = "prof"
+PHASES_EXTENSION = "phases"
+_PHASE_TYPES = (str, float, float, float, float)
+
+# Functions, as cProfile labels built-ins, that write output: writes to and
+# closing of files, and compression.
+_WRITE_FUNCTIONS = re.compile(
+        r"<method '(write|writelines|flush|close|__exit__)' of '_io\.|"
+        r"<(built-in )?method .*zlib\.")
+
+
+def write_time(stats):
+    """
+    Determine the time spent writing output, according to a profile.
+
+    :param pstats.Stats stats: profile of the processing.
+    :return float: seconds in functions that write to or close files, or
+        compress data.
+    """
+    return sum(timing[2] for (_, _, name), timing in stats.stats.items()
+               if _WRITE_FUNCTIONS.match(name))
+
+
+class _TimedFetch(object):
+    """ Stand-in for fetch_chunk() that accumulates time spent fetching. """
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.elapsed = 0.0
+
+    def __call__(self, *args, **kwargs):
+        start = default_timer()
+        reads = iter(self.fetch(*args, **kwargs))
+        self.elapsed += default_timer() - start
+        return self._timed(reads)
+
+    def _timed(self, reads):
+        while True:
+            start = default_timer()
+            try:
+                read = next(reads)
+            except StopIteration:
+                self.elapsed += default_timer() - start
+                return
+            self.elapsed += default_timer() - start
+            yield read
+
+
+class ChunkProfiler(object):
+    """
+    Process a chunk under cProfile, in the worker, timing its phases.
+
+    The chunk's profile is dumped, and the seconds in each phase are stored
+    as a record, next to the chunk's output; see phase_times().
+    """
+
+    def __init__(self, func, processor):
+        """
+        :param callable func: processing of a chunk.
+        :param pararead.ParaReadProcessor processor: the processor whose
+            fetch_chunk() to time, and whose temporary files to profile with.
+        """
+        self.func = func
+        self.processor = processor
+
+    def __call__(self, chunk):
+        processor = self.processor
+        original = vars(processor).get("fetch_chunk")
+        fetch = _TimedFetch(processor.fetch_chunk)
+        processor.fetch_chunk = fetch
+        profiler = cProfile.Profile()
+        start = default_timer()
+        try:
+            return profiler.runcall(self.func, chunk)
+        finally:
+            total = default_timer() - start
+            if original is None:
+                del processor.fetch_chunk
+            else:
+                processor.fetch_chunk = original
+            stem = processor._tempf(chunk)
+            profiler.dump_stats("{}.{}".format(stem, PROFILE_EXTENSION))
+            write = write_time(pstats.Stats(profiler))
+            write_records(
+                    "{}.{}".format(stem, PHASES_EXTENSION), _PHASE_TYPES,
+                    [(str(chunk), fetch.elapsed,
+                      max(total - fetch.elapsed - write, 0.0), write, total)])
+
+
+def phase_times(paths):
+    """
+    Read the time each chunk spent in each phase.
+
+    :param Iterable[str] paths: paths to the phase records of chunks, as
+        written by a ChunkProfiler.
+    :return Iterable[(str, float, float, float, float)]: for each chunk, its
+        name, then seconds fetching, computing, writing, and in total.
+    """
+    for path in paths:
+        for record in read_records(path):
+            yield record
+
+
+def merge_profiles(paths, outpath):
+    """
+    Merge profiles into one, e.g. the chunks' into a report for the run.
+
+    :param Iterable[str] paths: paths to profiles dumped by cProfile; those
+        that don't exist (e.g., of a chunk whose worker was killed) are
+        skipped.
+    :param str outpath: path to which to dump the merged profile.
+    :return pstats.Stats | NoneType: the merged profile, or null if there
+        were no profiles to merge.
+    """
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths:
+        return None
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    stats.dump_stats(outpath)
+    return stats
@@ -0,0 +1,225 @@
+"""
+Binary storage of records (rows of fields) for chunks' intermediate output.
+
+Rather than formatting each field of a chunk's results as text in a worker,
+only for combine() to parse it back, a worker can store its records in a
+compact binary form: a header declares the type of each field, and each
+record follows, prefixed by its length in bytes. Numbers are stored packed
+and text with its length, so reading records back is just unpacking them,
+and formatting as text is left to the final output, if it's wanted at all.
+"""
+
+import shutil
+import struct
+
+from .exceptions import RecordFormatException
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["RecordWriter", "concatenate_records", "field_codes",
+           "read_records", "write_records", "RECORDS_OUTPUT_TYPE"]
+
+
+# Extension for files of binary records.
+RECORDS_OUTPUT_TYPE = "rec"
+
+# Leads each file of records, followed by the number and codes of fields.
+_MAGIC = b"PRREC\x01"
+_HEADER_SIZE = struct.Struct("<H")
+_LENGTH = struct.Struct("<I")
+
+# Code (struct format character) under which each type of field is stored;
+# text and bytes are of variable length, so they're stored with theirs.
+FIELD_CODES = {bool: "?", int: "q", float: "d", str: "s", bytes: "y"}
+_VARIABLE_CODES = "sy"
+# Number of fixed-width records unpacked at a time.
+_RECORDS_PER_READ = 4096
+
+
+def field_codes(field_types):
+    """
+    Determine how each of a record's fields is stored.
+
+    :param Iterable[type | str] field_types: type of each field (bool, int,
+        float, str, or bytes), or its code.
+    :return str: code of each field.
+    :raise ValueError: if a field's type can't be stored.
+    """
+    codes = []
+    for t in field_types:
+        code = FIELD_CODES.get(t, t)
+        if code not in FIELD_CODES.values():
+            raise ValueError("Unsupported record field type: {}".format(t))
+        codes.append(code)
+    return "".join(codes)
+
+
+class RecordWriter(object):
+    """
+    Write records to a file, e.g. a chunk's output in a worker.
+
+    Use it as a context manager, or close() it when done.
+    """
+
+    def __init__(self, path, field_types):
+        """
+        :param str path: path to the file to write.
+        :param Iterable[type | str] field_types: type of each field of each
+            record; see field_codes().
+        """
+        self.path = path
+        self.codes = field_codes(field_types)
+        if any(c in _VARIABLE_CODES for c in self.codes):
+            self._fixed = None
+        else:
+            self._fixed = struct.Struct("<I" + self.codes)
+        self._handle = open(path, 'wb')
+        self._handle.write(_MAGIC + _HEADER_SIZE.pack(len(self.codes)) +
+                           self.codes.encode("ascii"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record):
+        """
+        Write a record.
+
+        :param Sequence record: value of each field.
+        """
+        if self._fixed is not None:
+            size = self._fixed.size - _LENGTH.size
+            self._handle.write(self._fixed.pack(size, *record))
+            return
+        fmt, values = ["<"], []
+        for code, value in zip(self.codes, record):
+            if code in _VARIABLE_CODES:
+                if code == "s":
+                    value = value.encode("utf-8")
+                fmt.append("I{}s".format(len(value)))
+                values.extend([len(value), value])
+            else:
+                fmt.append(code)
+                values.append(value)
+        payload = struct.pack("".join(fmt), *values)
+        self._handle.write(_LENGTH.pack(len(payload)) + payload)
+
+    def write_many(self, records):
+        """
+        Write records.
+
+        :param Iterable[Sequence] records: records to write.
+        """
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        """ Finish writing. """
+        self._handle.close()
+
+
+def write_records(path, field_types, records):
+    """
+    Write records to a file.
+
+    :param str path: path to the file to write.
+    :param Iterable[type | str] field_types: type of each field.
+    :param Iterable[Sequence] records: records to write.
+    :return str: path to the file written.
+    """
+    with RecordWriter(path, field_types) as writer:
+        writer.write_many(records)
+    return path
+
+
+def _read_header(handle, path):
+    """ Read the field codes of a file of records, leaving it at the body. """
+    if handle.read(len(_MAGIC)) != _MAGIC:
+        raise RecordFormatException(path, "not a file of records")
+    num_fields, = _HEADER_SIZE.unpack(handle.read(_HEADER_SIZE.size))
+    return handle.read(num_fields).decode("ascii")
+
+
+def read_records(path):
+    """
+    Read the records of a file.
+
+    :param str path: path to a file written by a RecordWriter.
+    :return Iterable[tuple]: each record, as a tuple of field values.
+    :raise pararead.exceptions.RecordFormatException: if the file isn't a
+        file of records, or is truncated.
+    """
+    with open(path, 'rb') as handle:
+        codes = _read_header(handle, path)
+        if not any(c in _VARIABLE_CODES for c in codes):
+            record = struct.Struct("<I" + codes)
+            while True:
+                data = handle.read(record.size * _RECORDS_PER_READ)
+                if len(data) % record.size:
+                    raise RecordFormatException(path, "truncated record")
+                for values in record.iter_unpack(data):
+                    yield values[1:]
+                if len(data) < record.size * _RECORDS_PER_READ:
+                    return
+        while True:
+            prefix = handle.read(_LENGTH.size)
+            if not prefix:
+                return
+            length, = _LENGTH.unpack(prefix)
+            payload = handle.read(length)
+            if len(payload) < length:
+                raise RecordFormatException(path, "truncated record")
+            yield _unpack(codes, payload)
+
+
+def _unpack(codes, payload):
+    """ Unpack the fields of a record with variable-width fields. """
+    values, offset = [], 0
+    for code in codes:
+        if code in _VARIABLE_CODES:
+            size, = _LENGTH.unpack_from(payload, offset)
+            offset += _LENGTH.size
+            value = payload[offset:offset + size]
+            offset += size
+            values.append(value.decode("utf-8") if code == "s" else value)
+        else:
+            value, = struct.unpack_from("<" + code, payload, offset)
+            offset += struct.calcsize("<" + code)
+            values.append(value)
+    return tuple(values)
+
+
+def concatenate_records(paths, outpath):
+    """
+    Concatenate files of records with the same fields, without decoding.
+
+    :param Iterable[str] paths: paths to files of records, in order.
+    :param str outpath: path to the file to write.
+    :return str: path to the file written.
+    :raise pararead.exceptions.RecordFormatException: if a file isn't a file
+        of records, or its fields differ from those of the first.
+    :raise ValueError: if there are no files to concatenate, so no fields.
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No files of records to concatenate")
+    codes = None
+    with open(outpath, 'wb') as outfile:
+        for path in paths:
+            with open(path, 'rb') as handle:
+                file_codes = _read_header(handle, path)
+                if codes is None:
+                    codes = file_codes
+                    outfile.write(_MAGIC + _HEADER_SIZE.pack(len(codes)) +
+                                  codes.encode("ascii"))
+                elif file_codes != codes:
+                    raise RecordFormatException(
+                            path, "fields '{}' differ from '{}'".format(
+                                    file_codes, codes))
+                shutil.copyfileobj(handle, outfile)
+    return outpath
@@ -0,0 +1,289 @@
+""" Restriction of processing to genomic regions, e.g. from a BED file. """
+
+import bisect
+from collections import namedtuple
+import gzip
+import logging
+import math
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["Interval", "RegionChunk", "OWNERSHIP_RULES", "fetch_regions",
+           "make_region_chunks", "merge_intervals", "parse_regions",
+           "read_bed", "whole_chromosomes"]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Leading words of BED lines that don't describe an interval.
+_BED_HEADER_PREFIXES = ("#", "track", "browser")
+
+# Rules for which chunk a read belongs to; see RegionChunk.
+OWNERSHIP_RULES = (None, "overlap", "start")
+
+
+Interval = namedtuple("Interval", field_names=["chrom", "start", "end"])
+
+
+class RegionChunk(namedtuple("RegionChunk", field_names=[
+        "chrom", "intervals", "preceding_end", "ownership"])):
+    """
+    Chunk of reads defined by intervals of one chromosome.
+
+    The intervals are sorted and don't overlap; preceding_end is the end of
+    the interval just before this chunk's first one on the same chromosome,
+    if any. The ownership rule determines the chunk to which a read that
+    overlaps intervals of more than one chunk belongs, so that each read is
+    processed exactly once: with 'overlap', a read belongs to the first
+    interval it overlaps; with 'start', it belongs to the interval that
+    contains its start position, if any. Without a rule, a read belongs to
+    every interval it overlaps. The text form of a chunk identifies it,
+    e.g. for naming the chunk's output file.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, chrom, intervals, preceding_end=None, ownership=None):
+        if ownership not in OWNERSHIP_RULES:
+            raise ValueError("Unknown read ownership rule: {}; choose from "
+                             "{}".format(ownership, OWNERSHIP_RULES))
+        return super(RegionChunk, cls).__new__(
+            cls, chrom, tuple(intervals), preceding_end, ownership)
+
+    def __str__(self):
+        return "{}_{}_{}".format(
+            self.chrom, self.intervals[0][0], self.intervals[-1][1])
+
+    @property
+    def size(self):
+        """ Number of base pairs covered by the chunk's intervals. """
+        return sum(end - start for start, end in self.intervals)
+
+    def contains(self, position):
+        """
+        Determine whether a position is within one of the chunk's intervals.
+
+        :param int position: 0-based position on the chunk's chromosome.
+        :return bool: whether the position is within an interval.
+        """
+        i = bisect.bisect_right(self.intervals, (position, float("inf")))
+        return i > 0 and position < self.intervals[i - 1][1]
+
+    def owns(self, read):
+        """
+        Determine whether a read belongs to this chunk, per ownership rule.
+
+        This is for a processor that fetches flanking reads for context
+        (a halo) but must count each read just once.
+
+        :param pysam.AlignedSegment read: read on the chunk's chromosome.
+        :return bool: whether the read belongs to this chunk.
+        """
+        start = read.reference_start
+        if self.ownership == "start":
+            return self.contains(start)
+        end = read.reference_end
+        if end is None or end == start:
+            # No aligned bases, e.g. unmapped read placed by its mate.
+            end = start + 1
+        if self.ownership == "overlap" and self.preceding_end is not None \
+                and start < self.preceding_end:
+            return False
+        i = bisect.bisect_right(self.intervals, (start, float("inf")))
+        if i > 0 and start < self.intervals[i - 1][1]:
+            return True
+        return i < len(self.intervals) and self.intervals[i][0] < end
+
+
+def read_bed(path):
+    """
+    Parse the intervals in a BED file (possibly gzipped).
+
+    :param str path: path to the BED file.
+    :return list[pararead.regions.Interval]: the intervals in the file, with
+        0-based start and exclusive end.
+    :raise ValueError: if a line doesn't describe an interval.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    intervals = []
+    with opener(path, 'rt') as bed:
+        for line_number, line in enumerate(bed, start=1):
+            if not line.strip() or line.startswith(_BED_HEADER_PREFIXES):
+                continue
+            fields = line.split()
+            try:
+                intervals.append(
+                    Interval(fields[0], int(fields[1]), int(fields[2])))
+            except (IndexError, ValueError):
+                raise ValueError("Invalid BED line {} in '{}': {}".format(
+                    line_number, path, line.rstrip("\n")))
+    return intervals
+
+
+def parse_regions(regions):
+    """
+    Interpret a specification of regions of interest.
+
+    :param str | Iterable[(str, int, int)] regions: path to a BED file, or
+        chromosome, 0-based start, and exclusive end of each region.
+    :return list[pararead.regions.Interval]: the regions.
+    """
+    if isinstance(regions, str):
+        return read_bed(regions)
+    return [Interval(c, int(s), int(e)) for c, s, e in regions]
+
+
+def merge_intervals(intervals, chrom_order=None):
+    """
+    Sort intervals and merge those that overlap or abut.
+
+    :param Iterable[(str, int, int)] intervals: chromosome, 0-based start,
+        and exclusive end of each interval.
+    :param Iterable[str] chrom_order: chromosomes in the order in which to
+        arrange the intervals, e.g. that of a reads file header; intervals
+        on a chromosome not in the order are dropped. By default, arrange
+        chromosomes in order of first appearance.
+    :return list[pararead.regions.Interval]: nonoverlapping intervals, in
+        order.
+    """
+    by_chrom = {}
+    for chrom, start, end in intervals:
+        if end > start:
+            by_chrom.setdefault(chrom, []).append((start, end))
+    if chrom_order is None:
+        chrom_order = []
+        for chrom, _, _ in intervals:
+            if chrom not in chrom_order:
+                chrom_order.append(chrom)
+    else:
+        chrom_order = list(chrom_order)
+        unknown = set(by_chrom) - set(chrom_order)
+        if unknown:
+            _LOGGER.warning("Ignoring intervals on %d unknown chromosome(s): "
+                            "%s", len(unknown), sorted(unknown))
+    merged = []
+    for chrom in chrom_order:
+        current = None
+        for start, end in sorted(by_chrom.get(chrom, [])):
+            if current is not None and start <= current[1]:
+                current[1] = max(current[1], end)
+                continue
+            if current is not None:
+                merged.append(Interval(chrom, *current))
+            current = [start, end]
+        if current is not None:
+            merged.append(Interval(chrom, *current))
+    return merged
+
+
+def make_region_chunks(intervals, num_chunks=None, chunk_size=None,
+                       ownership=None):
+    """
+    Group intervals into chunks that cover about equal numbers of bases.
+
+    Neighboring intervals of a chromosome are grouped together; an interval
+    larger than the target chunk size is split.
+
+    :param Iterable[pararead.regions.Interval] intervals: sorted,
+        nonoverlapping intervals, e.g. from merge_intervals().
+    :param int num_chunks: number of chunks to aim for.
+    :param int chunk_size: number of bases per chunk, e.g. for fixed-size
+        windows; this takes precedence over the number of chunks.
+    :param str ownership: rule for the chunk to which a read that overlaps
+        more than one chunk belongs; see RegionChunk.
+    :return list[pararead.regions.RegionChunk]: chunks, in the intervals'
+        order.
+    :raise ValueError: if given neither number of chunks nor chunk size.
+    """
+    intervals = list(intervals)
+    if not intervals:
+        return []
+    if chunk_size:
+        target = int(chunk_size)
+    elif num_chunks:
+        total = sum(i.end - i.start for i in intervals)
+        target = max(int(math.ceil(float(total) / num_chunks)), 1)
+    else:
+        raise ValueError("Number of chunks or chunk size is required")
+
+    chunks = []
+    chrom, members, bases, preceding_end = None, [], 0, None
+    last_end = None
+
+    def close_chunk():
+        if members:
+            chunks.append(
+                RegionChunk(chrom, members, preceding_end, ownership))
+
+    for interval in intervals:
+        if interval.chrom != chrom:
+            close_chunk()
+            chrom, members, bases = interval.chrom, [], 0
+            preceding_end = last_end = None
+        start = interval.start
+        while start < interval.end:
+            if bases >= target:
+                close_chunk()
+                members, bases, preceding_end = [], 0, last_end
+            end = min(interval.end, start + target - bases)
+            members.append((start, end))
+            bases += end - start
+            last_end, start = end, end
+    close_chunk()
+    return chunks
+
+
+def whole_chromosomes(size_by_chromosome, chrom_order):
+    """
+    Make an interval spanning each chromosome.
+
+    :param Mapping[str, int] size_by_chromosome: length of each chromosome.
+    :param Iterable[str] chrom_order: chromosomes of interest, in order.
+    :return list[pararead.regions.Interval]: interval for each chromosome.
+    """
+    return [Interval(c, 0, size_by_chromosome[c]) for c in chrom_order
+            if c in size_by_chromosome]
+
+
+def fetch_regions(readsfile, chunk, halo=0):
+    """
+    Pull the reads for a chunk's intervals, using the index.
+
+    Without a halo, these are the reads that belong to the chunk, per its
+    ownership rule. With a halo, they're all the reads overlapping the
+    intervals extended by the halo on each side, each read just once; use
+    the chunk's owns() to tell those belonging to it from the context.
+
+    :param pysam.AlignmentFile readsfile: indexed file of aligned reads.
+    :param pararead.regions.RegionChunk chunk: intervals of interest.
+    :param int halo: number of flanking bases to include on either side of
+        each interval.
+    :return Iterable[pysam.AlignedSegment]: reads for the chunk.
+    """
+    if halo:
+        extended = merge_intervals(
+            [(chunk.chrom, max(start - halo, 0), end + halo)
+             for start, end in chunk.intervals])
+        context = RegionChunk(
+            chunk.chrom, [(i.start, i.end) for i in extended],
+            ownership="overlap")
+        for read in fetch_regions(readsfile, context):
+            yield read
+        return
+    ownership = chunk.ownership
+    preceding_end = chunk.preceding_end
+    for start, end in chunk.intervals:
+        for read in readsfile.fetch(chunk.chrom, start, end):
+            read_start = read.reference_start
+            if ownership == "start":
+                if not start <= read_start < end:
+                    continue
+            # A read that starts before the preceding interval's end
+            # overlaps that interval, so it belongs to it.
+            elif ownership == "overlap" and preceding_end is not None and \
+                    read_start < preceding_end:
+                continue
+            yield read
+        preceding_end = end
@@ -0,0 +1,492 @@
+"""
+Read-only data shared by worker processes without copying.
+
+Large lookup structures (e.g., blacklist intervals, SNP positions, k-mer
+tables) are stored as compact arrays in files that each worker maps into
+memory, so the operating system shares the pages among the workers. Unlike
+Python objects inherited from the parent, these are never copied as the
+workers touch them, since reading them doesn't update reference counts of
+their elements. What's pickled to send one to a worker is just where to
+find the data.
+"""
+
+import array
+import bisect
+import mmap
+import os
+import sys
+import tempfile
+if sys.version_info < (3, 3):
+    from collections import Mapping
+else:
+    from collections.abc import Mapping
+
+from .regions import merge_intervals
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["IntervalIndex", "SharedArray", "SharedIntervals",
+           "SharedPositions", "share"]
+
+
+# Typecode of the arrays of positions: signed 64-bit integers.
+_POSITION_TYPE = "q"
+
+
+class SharedArray(object):
+    """
+    Array of numbers stored in a file and mapped into memory when used.
+
+    Indexing, slicing (without copying), iteration, and len() work as for
+    a sequence; as_numpy() gives a numpy view, if numpy is available.
+    """
+
+    def __init__(self, path, typecode, length):
+        """
+        :param str path: path to the file of the array's data.
+        :param str typecode: typecode of the elements, as for array.array.
+        :param int length: number of elements.
+        """
+        self.path = path
+        self.typecode = typecode
+        self.length = length
+        self._map = None
+        self._view = None
+
+    @classmethod
+    def create(cls, values, typecode=None, folder=None):
+        """
+        Store values as a shared array.
+
+        :param array.array | numpy.ndarray | Iterable[int | float] values:
+            values to store.
+        :param str typecode: typecode of the elements, as for array.array;
+            by default, that of the given array.
+        :param str folder: folder for the file of the data; by default, the
+            system's temporary folder.
+        :return pararead.shared.SharedArray: the stored values.
+        :raise ValueError: if the typecode can't be determined.
+        """
+        dtype = getattr(values, "dtype", None)
+        if typecode is None:
+            typecode = getattr(values, "typecode", None) or \
+                (dtype.char if dtype is not None else None)
+            if typecode is None:
+                raise ValueError("Typecode is required for values of type "
+                                 "{}".format(type(values).__name__))
+        if dtype is not None and dtype.char == typecode:
+            # A numpy array, written as is.
+            data, length = values.tobytes(), values.size
+        else:
+            if not isinstance(values, array.array) or \
+                    values.typecode != typecode:
+                values = array.array(typecode, values)
+            data, length = values.tobytes(), len(values)
+        fd, path = tempfile.mkstemp(suffix=".shared", dir=folder)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return cls(path, typecode, length)
+
+    def __getstate__(self):
+        return {"path": self.path, "typecode": self.typecode,
+                "length": self.length}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item):
+        return self.view[item]
+
+    def __iter__(self):
+        return iter(self.view)
+
+    @property
+    def view(self):
+        """
+        Memory view of the array's data, mapping the file on first access.
+
+        :return memoryview: view of the elements.
+        """
+        if self._view is None:
+            if not self.length:
+                # An empty file can't be mapped.
+                self._view = memoryview(array.array(self.typecode))
+            else:
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(
+                            f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._map).cast(self.typecode)
+        return self._view
+
+    def as_numpy(self):
+        """
+        View the array with numpy, without copying.
+
+        :return numpy.ndarray: read-only array of the elements.
+        :raise ImportError: if numpy isn't installed.
+        """
+        import numpy
+        return numpy.frombuffer(self.view, dtype=self.typecode)
+
+    def close(self):
+        """ Unmap the data, e.g. before removing the file. """
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def remove(self):
+        """ Unmap the data and remove its file. """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _ByChromosome(object):
+    """ Sorted values for each chromosome, in segments of shared arrays. """
+
+    def __init__(self, arrays, segments):
+        """
+        :param Mapping[str, pararead.shared.SharedArray] arrays: arrays of
+            values, by name.
+        :param Mapping[str, (int, int)] segments: start and end of each
+            chromosome's segment of the arrays.
+        """
+        self.arrays = arrays
+        self.segments = segments
+
+    @property
+    def chromosomes(self):
+        """
+        :return list[str]: chromosomes with values.
+        """
+        return list(self.segments.keys())
+
+    def _segment(self, name, chrom):
+        """ A chromosome's segment of one of the arrays, as a view. """
+        try:
+            start, end = self.segments[chrom]
+        except KeyError:
+            return self.arrays[name].view[0:0]
+        return self.arrays[name].view[start:end]
+
+    def close(self):
+        """ Unmap the data. """
+        for values in self.arrays.values():
+            values.close()
+
+    def remove(self):
+        """ Unmap the data and remove its files. """
+        for values in self.arrays.values():
+            values.remove()
+
+
+class SharedIntervals(_ByChromosome):
+    """
+    Nonoverlapping intervals (e.g., a blacklist or mask) of each chromosome,
+    as sorted arrays of starts and ends, for lookup by binary search.
+    """
+
+    @classmethod
+    def create(cls, intervals, folder=None):
+        """
+        Store intervals for sharing; overlapping ones are merged.
+
+        :param Iterable[(str, int, int)] intervals: chromosome, 0-based start,
+            and exclusive end of each interval.
+        :param str folder: folder for the files of the data.
+        :return pararead.shared.SharedIntervals: the stored intervals.
+        """
+        starts = array.array(_POSITION_TYPE)
+        ends = array.array(_POSITION_TYPE)
+        segments = {}
+        for i in merge_intervals(list(intervals)):
+            first, _ = segments.get(i.chrom, (len(starts), None))
+            starts.append(i.start)
+            ends.append(i.end)
+            segments[i.chrom] = (first, len(starts))
+        return cls({"starts": SharedArray.create(starts, folder=folder),
+                    "ends": SharedArray.create(ends, folder=folder)},
+                   segments)
+
+    def __len__(self):
+        return len(self.arrays["starts"])
+
+    def overlapping(self, chrom, start, end):
+        """
+        Find the intervals that overlap a region.
+
+        :param str chrom: chromosome of the region.
+        :param int start: 0-based start of the region.
+        :param int end: exclusive end of the region.
+        :return list[(int, int)]: start and end of each overlapping interval.
+        """
+        starts = self._segment("starts", chrom)
+        ends = self._segment("ends", chrom)
+        # First interval ending after the region's start.
+        i = bisect.bisect_right(ends, start)
+        found = []
+        while i < len(starts) and starts[i] < end:
+            found.append((starts[i], ends[i]))
+            i += 1
+        return found
+
+    def overlaps(self, chrom, start, end):
+        """
+        Determine whether a region overlaps any of the intervals.
+
+        :param str chrom: chromosome of the region.
+        :param int start: 0-based start of the region.
+        :param int end: exclusive end of the region.
+        :return bool: whether any interval overlaps the region.
+        """
+        starts = self._segment("starts", chrom)
+        i = bisect.bisect_right(self._segment("ends", chrom), start)
+        return i < len(starts) and starts[i] < end
+
+    def contains(self, chrom, pos):
+        """
+        Determine whether a position lies within any of the intervals.
+
+        :param str chrom: chromosome of the position.
+        :param int pos: 0-based position.
+        :return bool: whether an interval contains the position.
+        """
+        return self.overlaps(chrom, pos, pos + 1)
+
+
+class SharedPositions(_ByChromosome):
+    """
+    Sets of positions (e.g., of known SNPs) of each chromosome, as sorted
+    arrays, for lookup by binary search.
+    """
+
+    @classmethod
+    def create(cls, positions, folder=None):
+        """
+        Store positions for sharing.
+
+        :param Mapping[str, Iterable[int]] positions: 0-based positions on
+            each chromosome.
+        :param str folder: folder for the files of the data.
+        :return pararead.shared.SharedPositions: the stored positions.
+        """
+        values = array.array(_POSITION_TYPE)
+        segments = {}
+        for chrom, chrom_positions in positions.items():
+            first = len(values)
+            values.extend(sorted(set(chrom_positions)))
+            segments[chrom] = (first, len(values))
+        return cls({"positions": SharedArray.create(values, folder=folder)},
+                   segments)
+
+    def __len__(self):
+        return len(self.arrays["positions"])
+
+    def contains(self, chrom, pos):
+        """
+        Determine whether a position is in the set.
+
+        :param str chrom: chromosome of the position.
+        :param int pos: 0-based position.
+        :return bool: whether the position is in the set.
+        """
+        positions = self._segment("positions", chrom)
+        i = bisect.bisect_left(positions, pos)
+        return i < len(positions) and positions[i] == pos
+
+    def within(self, chrom, start, end):
+        """
+        Find the positions within a region.
+
+        :param str chrom: chromosome of the region.
+        :param int start: 0-based start of the region.
+        :param int end: exclusive end of the region.
+        :return memoryview: the positions, in order.
+        """
+        positions = self._segment("positions", chrom)
+        return positions[bisect.bisect_left(positions, start):
+                         bisect.bisect_left(positions, end)]
+
+
+class IntervalIndex(_ByChromosome):
+    """
+    Index of possibly overlapping features (e.g., genes) of each chromosome,
+    for finding the features that overlap reads.
+
+    The features of each chromosome are sorted by start, along with the
+    running maximum of their ends: the features overlapping a query are
+    among those starting before its end, and scanning back from the last of
+    those can stop once the running maximum end no longer reaches the
+    query's start. Each feature is identified by its position in the order
+    in which the features were given, and optionally has a name.
+    """
+
+    @classmethod
+    def create(cls, features, folder=None):
+        """
+        Index features for sharing.
+
+        :param Iterable[(str, int, int) | (str, int, int, str)] features:
+            chromosome, 0-based start, exclusive end, and optionally name, of
+            each feature.
+        :param str folder: folder for the files of the data.
+        :return pararead.shared.IntervalIndex: the indexed features.
+        """
+        by_chrom, names = {}, []
+        for feature_id, feature in enumerate(features):
+            chrom, start, end = feature[:3]
+            by_chrom.setdefault(chrom, []).append(
+                    (int(start), int(end), feature_id))
+            names.append(feature[3] if len(feature) > 3 else None)
+        starts, ends, max_ends, ids = \
+            [array.array(_POSITION_TYPE) for _ in range(4)]
+        segments = {}
+        for chrom, chrom_features in by_chrom.items():
+            first, max_end = len(starts), None
+            for start, end, feature_id in sorted(chrom_features):
+                max_end = end if max_end is None else max(max_end, end)
+                starts.append(start)
+                ends.append(end)
+                max_ends.append(max_end)
+                ids.append(feature_id)
+            segments[chrom] = (first, len(starts))
+        arrays = {"starts": starts, "ends": ends, "max_ends": max_ends,
+                  "ids": ids}
+        if any(n is not None for n in names):
+            encoded = [("" if n is None else n).encode("utf-8")
+                       for n in names]
+            name_ends = array.array(_POSITION_TYPE)
+            total = 0
+            for n in encoded:
+                total += len(n)
+                name_ends.append(total)
+            arrays["names"] = array.array("B", b"".join(encoded))
+            arrays["name_ends"] = name_ends
+        return cls({k: SharedArray.create(v, folder=folder)
+                    for k, v in arrays.items()}, segments)
+
+    def __len__(self):
+        return len(self.arrays["ids"])
+
+    def name(self, feature_id):
+        """
+        Get the name of a feature.
+
+        :param int feature_id: position of the feature in those indexed.
+        :return str | NoneType: name of the feature, or null if the features
+            weren't named.
+        """
+        if "names" not in self.arrays:
+            return None
+        name_ends = self.arrays["name_ends"]
+        start = name_ends[feature_id - 1] if feature_id else 0
+        return self.arrays["names"][start:name_ends[feature_id]].\
+            tobytes().decode("utf-8")
+
+    def overlapping(self, chrom, start, end):
+        """
+        Find the features that overlap a region.
+
+        :param str chrom: chromosome of the region.
+        :param int start: 0-based start of the region.
+        :param int end: exclusive end of the region.
+        :return list[int]: ID of each overlapping feature, in order of start.
+        """
+        return self.overlapping_batch(chrom, [start], [end])[0]
+
+    def overlapping_batch(self, chrom, starts, ends):
+        """
+        Find the features that overlap each of a batch of regions.
+
+        The chromosome's arrays are looked up once for the whole batch, so
+        the cost per region is just its binary search and scan.
+
+        :param str chrom: chromosome of the regions.
+        :param Sequence[int] starts: 0-based start of each region.
+        :param Sequence[int] ends: exclusive end of each region.
+        :return list[list[int]]: for each region, ID of each overlapping
+            feature, in order of start.
+        """
+        feature_starts = self._segment("starts", chrom)
+        feature_ends = self._segment("ends", chrom)
+        max_ends = self._segment("max_ends", chrom)
+        ids = self._segment("ids", chrom)
+        results = []
+        for start, end in zip(starts, ends):
+            found = []
+            # Features starting before the region's end, scanned backward.
+            i = bisect.bisect_left(feature_starts, end) - 1
+            while i >= 0 and max_ends[i] > start:
+                if feature_ends[i] > start:
+                    found.append(ids[i])
+                i -= 1
+            found.reverse()
+            results.append(found)
+        return results
+
+    def count_batch(self, chrom, starts, ends):
+        """
+        Count the features that overlap each of a batch of regions.
+
+        :param str chrom: chromosome of the regions.
+        :param Sequence[int] starts: 0-based start of each region.
+        :param Sequence[int] ends: exclusive end of each region.
+        :return array.array: number of overlapping features for each region.
+        """
+        return array.array(_POSITION_TYPE, (
+                len(found) for found in
+                self.overlapping_batch(chrom, starts, ends)))
+
+    def overlapping_reads(self, reads):
+        """
+        Find the features that overlap each of a batch of reads.
+
+        :param Sequence[pysam.AlignedSegment] reads: aligned reads.
+        :return list[list[int]]: for each read, ID of each feature that its
+            alignment span overlaps; none for an unmapped read.
+        """
+        positions_by_chrom = {}
+        for i, read in enumerate(reads):
+            if read.is_unmapped:
+                continue
+            positions_by_chrom.setdefault(read.reference_name, []).append(
+                    (i, read.reference_start, read.reference_end))
+        results = [[] for _ in reads]
+        for chrom, positions in positions_by_chrom.items():
+            indices, starts, ends = zip(*positions)
+            for i, found in zip(indices, self.overlapping_batch(
+                    chrom, starts, ends)):
+                results[i] = found
+        return results
+
+
+def share(data, folder=None):
+    """
+    Store data for sharing with workers, as appropriate for its type.
+
+    :param pararead.shared.SharedArray | pararead.shared.SharedIntervals |
+        pararead.shared.SharedPositions | array.array | numpy.ndarray |
+        Mapping[str, Iterable[int]] | Iterable[(str, int, int)] data: data
+        already stored, or an array to store as a SharedArray, positions by
+        chromosome to store as SharedPositions, or intervals to store as
+        SharedIntervals.
+    :param str folder: folder for the files of the data.
+    :return pararead.shared.SharedArray | pararead.shared.SharedIntervals |
+        pararead.shared.SharedPositions: the stored data.
+    """
+    if isinstance(data, (SharedArray, _ByChromosome)):
+        return data
+    if isinstance(data, array.array) or hasattr(data, "dtype"):
+        return SharedArray.create(data, folder=folder)
+    if isinstance(data, Mapping):
+        return SharedPositions.create(data, folder=folder)
+    return SharedIntervals.create(data, folder=folder)
@@ -0,0 +1,312 @@
+"""
+BGZF compression and tabix (TBI or CSI) indexing of position-sorted text.
+
+Rather than compressing and indexing the final output in a pass of its own,
+each chunk's output is compressed by its worker into BGZF blocks, noting
+where each line falls, in virtual offsets relative to the chunk's first
+block. Files of whole blocks can be joined as they are, so combine() just
+concatenates the chunks' compressed output, shifting the offsets of each
+chunk's lines by the compressed size of what precedes it, and builds the
+index from those entries.
+"""
+
+from collections import namedtuple
+import struct
+
+from .bgzf import BgzfWriter, EOF_BLOCK
+from .records import read_records, write_records
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["TabixFormat", "TabixIndex", "compress_and_index",
+           "concatenate_indexed", "TABIX_PRESETS"]
+
+
+TBI_INDEX_TYPE = "tbi"
+CSI_INDEX_TYPE = "csi"
+INDEX_TYPES = (TBI_INDEX_TYPE, CSI_INDEX_TYPE)
+
+# Binning scheme: the smallest bins span 2 ** MIN_SHIFT bases, each level up
+# spans 8 times as many, and a TBI index has a fixed depth of 5 levels.
+MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+# Fields of the entry recorded for each indexed line.
+_ENTRY_TYPES = (str, int, int, int, int)
+# Flag, with the format code, for 0-based, half-open coordinates.
+_ZERO_BASED = 0x10000
+_TBI_MAGIC = b"TBI\x01"
+_CSI_MAGIC = b"CSI\x01"
+
+
+class TabixFormat(namedtuple("TabixFormat", [
+        "code", "seq_col", "begin_col", "end_col", "zero_based",
+        "meta_char", "skip"])):
+    """
+    Layout of lines to index: 1-based column numbers of the sequence name,
+    start, and end (0 if there's none), whether the positions are 0-based
+    and half-open (rather than 1-based and closed), the character that
+    marks a header line, and the number of leading lines to skip. The code
+    is that of the tabix format: 0 for generic, 1 for SAM, 2 for VCF.
+    """
+
+    __slots__ = ()
+
+    def interval(self, fields):
+        """
+        Determine the interval of a line.
+
+        :param Sequence[str] fields: tab-separated fields of the line.
+        :return (str, int, int): sequence name, and 0-based start and
+            exclusive end of the line's interval.
+        """
+        begin = int(fields[self.begin_col - 1])
+        if not self.zero_based:
+            begin -= 1
+        if self.code == 2:
+            end = begin + len(fields[3])
+        elif self.end_col:
+            end = int(fields[self.end_col - 1])
+        else:
+            end = begin + 1
+        return fields[self.seq_col - 1], begin, max(end, begin + 1)
+
+
+TABIX_PRESETS = {
+    "bed": TabixFormat(0, 1, 2, 3, True, "#", 0),
+    "gff": TabixFormat(0, 1, 4, 5, False, "#", 0),
+    "vcf": TabixFormat(2, 1, 2, 0, False, "#", 0)
+}
+
+
+def compress_and_index(inpath, outpath, tabix_format, entries_path,
+                       compresslevel=6):
+    """
+    Compress a file of lines into BGZF blocks, noting the offsets of lines.
+
+    The compressed output has no end-of-file marker, so that it can be
+    concatenated with others, and the offsets are relative to its start.
+
+    :param str inpath: path to the file of lines, sorted by position within
+        each sequence.
+    :param str outpath: path to the compressed file to write.
+    :param pararead.tabix.TabixFormat tabix_format: layout of the lines.
+    :param str entries_path: path to the file of binary records to write,
+        with sequence name, 0-based start, exclusive end, and virtual offset
+        of the start and end of each indexed line.
+    :param int compresslevel: zlib compression level.
+    :return int: number of lines indexed.
+    """
+    meta = tabix_format.meta_char.encode("ascii")
+    entries = []
+    with open(inpath, 'rb') as infile, open(outpath, 'wb') as outfile:
+        writer = BgzfWriter(outfile, compresslevel)
+        for i, line in enumerate(infile):
+            start = writer.tell()
+            writer.write(line)
+            if i < tabix_format.skip or line.startswith(meta) or \
+                    not line.strip():
+                continue
+            fields = line.rstrip(b"\r\n").decode("utf-8").split("\t")
+            chrom, begin, end = tabix_format.interval(fields)
+            entries.append((chrom, begin, end, start, writer.tell()))
+        writer.close(eof=False)
+    write_records(entries_path, _ENTRY_TYPES, entries)
+    return len(entries)
+
+
+def concatenate_indexed(parts, outpath, tabix_format,
+                        index_type=TBI_INDEX_TYPE):
+    """
+    Join compressed parts into one BGZF file, and write its index.
+
+    :param Iterable[(str, str)] parts: path to each compressed part and to
+        its entries, as written by compress_and_index(), in output order.
+    :param str outpath: path to the compressed file to write; the index is
+        written alongside it, with the index type as extension.
+    :param pararead.tabix.TabixFormat tabix_format: layout of the lines.
+    :param str index_type: TBI_INDEX_TYPE or CSI_INDEX_TYPE.
+    :return str: path to the index.
+    :raise ValueError: if the parts' lines aren't sorted by position within
+        each sequence, or with each sequence's lines together, or if they're
+        beyond the positions a TBI index can cover.
+    """
+    parts = list(parts)
+    depth = TBI_DEPTH
+    if index_type == CSI_INDEX_TYPE:
+        # Deepen the bins as needed to cover the largest position.
+        max_end = max([end for _, entries_path in parts
+                       for _, _, end, _, _ in read_records(entries_path)]
+                      or [0])
+        while max_end > 1 << (MIN_SHIFT + 3 * depth):
+            depth += 1
+    index = TabixIndex(tabix_format, depth=depth)
+    with open(outpath, 'wb') as outfile:
+        for path, entries_path in parts:
+            shift = outfile.tell() << 16
+            for chrom, begin, end, start, stop in read_records(entries_path):
+                index.add(chrom, begin, end, start + shift, stop + shift)
+            with open(path, 'rb') as part:
+                while True:
+                    data = part.read(2 ** 20)
+                    if not data:
+                        break
+                    outfile.write(data)
+        outfile.write(EOF_BLOCK)
+    index_path = "{}.{}".format(outpath, index_type)
+    index.write(index_path, index_type)
+    return index_path
+
+
+def reg2bin(begin, end, min_shift=MIN_SHIFT, depth=TBI_DEPTH):
+    """
+    Determine the smallest bin that contains an interval.
+
+    :param int begin: 0-based start of the interval.
+    :param int end: exclusive end of the interval.
+    :param int min_shift: log2 of the size of the smallest bins.
+    :param int depth: number of levels of bins below the root.
+    :return int: number of the bin.
+    """
+    end -= 1
+    shift, offset = min_shift, ((1 << depth * 3) - 1) // 7
+    for level in range(depth, 0, -1):
+        if begin >> shift == end >> shift:
+            return offset + (begin >> shift)
+        shift += 3
+        offset -= 1 << (level - 1) * 3
+    return 0
+
+
+class TabixIndex(object):
+    """
+    Bins and linear index of lines of a BGZF file, written as TBI or CSI.
+
+    Lines are added in file order, which must be sorted by position within
+    each sequence, with each sequence's lines together.
+    """
+
+    def __init__(self, tabix_format, depth=TBI_DEPTH):
+        """
+        :param pararead.tabix.TabixFormat tabix_format: layout of the lines.
+        :param int depth: number of levels of bins below the root; only a
+            CSI index can have more than TBI_DEPTH, for positions beyond
+            2 ** (MIN_SHIFT + 3 * TBI_DEPTH).
+        """
+        self.tabix_format = tabix_format
+        self.depth = depth
+        self.names = []
+        self._bins = []
+        self._linear = []
+        self._last = None
+
+    def add(self, chrom, begin, end, start, stop):
+        """
+        Add a line to the index.
+
+        :param str chrom: sequence name of the line.
+        :param int begin: 0-based start of the line's interval.
+        :param int end: exclusive end of the line's interval.
+        :param int start: virtual offset of the start of the line.
+        :param int stop: virtual offset just past the end of the line.
+        :raise ValueError: if the line is out of order, or beyond the largest
+            position the bins cover.
+        """
+        if end > 1 << (MIN_SHIFT + 3 * self.depth):
+            raise ValueError("Line of '{}' ends beyond the bins: {}".format(
+                    chrom, end))
+        if self._last is None or chrom != self._last[0]:
+            if chrom in self.names:
+                raise ValueError("Lines of '{}' aren't together".format(chrom))
+            self.names.append(chrom)
+            self._bins.append({})
+            self._linear.append({})
+        elif begin < self._last[1]:
+            raise ValueError("Lines of '{}' aren't sorted: {} after {}".
+                             format(chrom, begin, self._last[1]))
+        self._last = (chrom, begin)
+        chunks = self._bins[-1].setdefault(
+                reg2bin(begin, end, depth=self.depth), [])
+        if chunks and chunks[-1][1] >> 16 == start >> 16:
+            # Merge with the previous chunk if it ends in this block.
+            chunks[-1][1] = stop
+        else:
+            chunks.append([start, stop])
+        linear = self._linear[-1]
+        for window in range(begin >> MIN_SHIFT, ((end - 1) >> MIN_SHIFT) + 1):
+            linear.setdefault(window, start)
+
+    def write(self, path, index_type=TBI_INDEX_TYPE):
+        """
+        Write the index, BGZF-compressed.
+
+        :param str path: path to the index to write.
+        :param str index_type: TBI_INDEX_TYPE or CSI_INDEX_TYPE.
+        :raise ValueError: if the index type is unknown, or if the bins are
+            too deep for a TBI index.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError("Unknown index type: '{}'; choose from: {}".
+                             format(index_type, INDEX_TYPES))
+        depth = self.depth
+        if index_type == TBI_INDEX_TYPE and depth != TBI_DEPTH:
+            raise ValueError("A TBI index has bins of depth {}".format(
+                    TBI_DEPTH))
+        header = self._header()
+        if index_type == CSI_INDEX_TYPE:
+            data = [_CSI_MAGIC,
+                    struct.pack("<iii", MIN_SHIFT, depth, len(header)),
+                    header, struct.pack("<i", len(self.names))]
+        else:
+            data = [_TBI_MAGIC, struct.pack("<i", len(self.names)), header]
+        for bins, linear in zip(self._bins, self._linear):
+            offsets = self._fill(linear)
+            data.append(struct.pack("<i", len(bins)))
+            for bin_number in sorted(bins):
+                chunks = bins[bin_number]
+                if index_type == CSI_INDEX_TYPE:
+                    window = _bin_start(bin_number, depth) >> MIN_SHIFT
+                    loffset = offsets[window] if window < len(offsets) else 0
+                    data.append(struct.pack("<IQi", bin_number, loffset,
+                                            len(chunks)))
+                else:
+                    data.append(struct.pack("<Ii", bin_number, len(chunks)))
+                data.extend(struct.pack("<QQ", *c) for c in chunks)
+            if index_type == TBI_INDEX_TYPE:
+                data.append(struct.pack("<i", len(offsets)))
+                data.extend(struct.pack("<Q", o) for o in offsets)
+        with open(path, 'wb') as f:
+            writer = BgzfWriter(f)
+            writer.write(b"".join(data))
+            writer.close()
+
+    def _header(self):
+        """ Tabix fields describing the layout of lines, and names. """
+        fmt = self.tabix_format
+        names = b"".join(n.encode("utf-8") + b"\x00" for n in self.names)
+        code = fmt.code | (_ZERO_BASED if fmt.zero_based else 0)
+        return struct.pack("<iiiiiii", code, fmt.seq_col, fmt.begin_col,
+                           fmt.end_col, ord(fmt.meta_char), fmt.skip,
+                           len(names)) + names
+
+    @staticmethod
+    def _fill(linear):
+        """ Linear index as a list, each empty window taking the last's. """
+        offsets = [0] * (max(linear) + 1 if linear else 0)
+        last = 0
+        for window in range(len(offsets)):
+            last = linear.get(window, last)
+            offsets[window] = last
+        return offsets
+
+
+def _bin_start(bin_number, depth):
+    """ Position at which a bin starts. """
+    offset, level = 0, 0
+    while level < depth and bin_number >= offset + (1 << level * 3):
+        offset += 1 << level * 3
+        level += 1
+    return (bin_number - offset) << (MIN_SHIFT + 3 * (depth - level))
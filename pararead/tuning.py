@@ -0,0 +1,252 @@
+"""
+Automatic choice of the number of cores and of chunks, for cores='auto'.
+
+The cores to use are at most those available to this process, which on a
+shared or containerized node may be far fewer than the machine has: the
+CPUs to which the process is pinned, and any CPU quota of its cgroup, limit
+them. Within that, a short calibration, processing a sample of reads from
+the largest chunk in a scratch folder, measures the processor's throughput
+and the overhead of a chunk, from which the time of each chunk is estimated
+from its number of reads (as counted by the index).
+
+With those times, the makespan (time until the last chunk is done) with a
+number of workers is estimated by scheduling the chunks as the executor
+does: in order, each to the first worker free, with the cost of starting
+each worker. The number of chunks, for partitioners that split into a
+number of them, trades the overhead of each chunk against the length of the
+last to finish, which is uncertain; the number of workers is then the one
+that minimizes the estimated makespan for the chunks, so that small or
+skewed jobs don't start more workers than pay off.
+"""
+
+from collections import namedtuple
+import heapq
+import itertools
+import math
+import os
+import shutil
+import tempfile
+from timeit import default_timer
+
+from .partition import CHUNKS_PER_CORE
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+__all__ = ["Calibration", "available_cores", "calibrate", "choose_num_chunks",
+           "choose_workers", "chunk_times", "estimate_makespan",
+           "AUTO_CORES"]
+
+
+# Value of cores by which to ask for automatic choice.
+AUTO_CORES = "auto"
+# Number of reads to process for calibration.
+CALIBRATION_READS = 2000
+# Rough cost of starting a worker process, in seconds.
+WORKER_STARTUP = 0.05
+
+_CGROUP_V2_MAX = "/sys/fs/cgroup/cpu.max"
+_CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+_CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+# Measured throughput of a processor, in reads per second, and the fixed
+# cost of processing a chunk, in seconds.
+Calibration = namedtuple("Calibration",
+                         field_names=["reads_per_second", "chunk_overhead"])
+
+
+def _read_first_line(path):
+    """ First line of a file, split on whitespace; null if it's absent. """
+    try:
+        with open(path) as f:
+            return f.readline().split()
+    except (IOError, OSError):
+        return None
+
+
+def _cgroup_cores(cgroup_v2_max=_CGROUP_V2_MAX,
+                  cgroup_v1_quota=_CGROUP_V1_QUOTA,
+                  cgroup_v1_period=_CGROUP_V1_PERIOD):
+    """ Cores allowed by the CPU quota of this process's cgroup, if any. """
+    fields = _read_first_line(cgroup_v2_max)
+    if fields and len(fields) == 2 and fields[0] != "max":
+        quota, period = fields
+    else:
+        quota = (_read_first_line(cgroup_v1_quota) or [None])[0]
+        period = (_read_first_line(cgroup_v1_period) or [None])[0]
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return max(int(math.ceil(float(quota) / period)), 1)
+
+
+def available_cores(**cgroup_files):
+    """
+    Determine the number of cores available to this process.
+
+    :param cgroup_files: paths to the cgroup files of the CPU quota, in place
+        of the usual ones.
+    :return int: number of CPUs to which the process may be scheduled,
+        limited by the CPU quota of its cgroup; at least 1.
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() if hasattr(os, "cpu_count") else None
+        if cores is None:
+            import multiprocessing
+            cores = multiprocessing.cpu_count()
+    quota = _cgroup_cores(**cgroup_files)
+    if quota is not None:
+        cores = min(cores, quota)
+    return max(cores, 1)
+
+
+class _LimitedFetch(object):
+    """ Stand-in for fetch_chunk() that stops after a number of reads. """
+
+    def __init__(self, fetch, limit):
+        self.fetch = fetch
+        self.limit = limit
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        for read in itertools.islice(self.fetch(*args, **kwargs), self.limit):
+            self.count += 1
+            yield read
+
+
+def calibrate(processor, chunk, probe_chunk=None,
+              sample_size=CALIBRATION_READS):
+    """
+    Measure a processor's throughput, by processing a sample of a chunk.
+
+    A chunk is processed in this process twice, with fetch_chunk() cut
+    short: first a probe, after one read, then the sample. The difference in
+    time gives the throughput, and the rest the fixed cost of a chunk. The
+    processing writes to a scratch folder, which is removed afterwards, so
+    none of its output, of whatever kind, is mixed with that of the run.
+    Processing that doesn't pull its reads with fetch_chunk() can't be cut
+    short, so it isn't calibrated; the probe, of the smallest chunk, tells.
+
+    :param pararead.ParaReadProcessor processor: processor to calibrate,
+        with its files registered.
+    :param object chunk: chunk of reads from which to sample, e.g. the
+        largest.
+    :param object probe_chunk: chunk of reads to probe, e.g. the smallest;
+        by default, the chunk from which to sample.
+    :param int sample_size: number of reads to process.
+    :return pararead.tuning.Calibration | NoneType: the processor's
+        throughput, and cost of a chunk; null if the processing doesn't pull
+        its reads with fetch_chunk().
+    """
+    original = vars(processor).get("fetch_chunk")
+    temp_folder = processor.temp_folder
+    scratch = tempfile.mkdtemp(prefix="calibration_", dir=temp_folder)
+    timings = []
+    try:
+        processor.temp_folder = scratch
+        for c, limit in [(probe_chunk or chunk, 1), (chunk, sample_size)]:
+            fetch = _LimitedFetch(processor.fetch_chunk, limit)
+            processor.fetch_chunk = fetch
+            start = default_timer()
+            processor(c)
+            timings.append((fetch.count, default_timer() - start))
+            if not fetch.count:
+                # The processing didn't take its reads from the sample.
+                return None
+    finally:
+        if original is None:
+            vars(processor).pop("fetch_chunk", None)
+        else:
+            processor.fetch_chunk = original
+        processor.temp_folder = temp_folder
+        shutil.rmtree(scratch, ignore_errors=True)
+    (few, few_time), (many, many_time) = timings
+    if many > few and many_time > few_time:
+        rate = (many - few) / (many_time - few_time)
+        return Calibration(rate, max(few_time - few / rate, 0.0))
+    # The chunk had no more reads than the probe, or timing was too coarse.
+    return Calibration(many / max(many_time, 1e-6), 0.0)
+
+
+def chunk_times(num_reads_by_chunk, calibration):
+    """
+    Estimate the seconds to process each of some chunks.
+
+    :param Iterable[int] num_reads_by_chunk: number of reads in each chunk.
+    :param pararead.tuning.Calibration calibration: throughput and cost of
+        a chunk.
+    :return list[float]: estimated seconds for each chunk.
+    """
+    return [calibration.chunk_overhead + n / calibration.reads_per_second
+            for n in num_reads_by_chunk]
+
+
+def estimate_makespan(times, workers, worker_startup=WORKER_STARTUP):
+    """
+    Estimate the time until processing of chunks is done.
+
+    :param Sequence[float] times: estimated seconds for each chunk.
+    :param int workers: number of workers; with one, chunks are processed
+        in this process, with no worker to start.
+    :param float worker_startup: seconds to start a worker.
+    :return float: time until the last chunk is done, with each chunk in
+        turn going to the first worker free, and the cost of starting the
+        workers.
+    """
+    if not times:
+        return 0.0
+    workers = min(workers, len(times))
+    loads = [0.0] * workers
+    for t in times:
+        heapq.heapreplace(loads, loads[0] + t)
+    return max(loads) + (worker_startup * workers if workers > 1 else 0.0)
+
+
+def choose_workers(times, max_workers, worker_startup=WORKER_STARTUP):
+    """
+    Choose the number of workers for which estimated makespan is least.
+
+    :param Sequence[float] times: estimated seconds for each chunk.
+    :param int max_workers: most workers to use.
+    :param float worker_startup: seconds to start a worker.
+    :return int: number of workers, the fewest of those that tie.
+    """
+    candidates = range(1, max(min(max_workers, len(times)), 1) + 1)
+    return min(candidates, key=lambda w: (
+            estimate_makespan(times, w, worker_startup), w))
+
+
+def choose_num_chunks(num_reads, calibration, workers):
+    """
+    Choose the number of chunks into which to split reads, for workers.
+
+    More chunks even out the workers' loads at the end, as the last chunk
+    to finish is shorter, but each adds its fixed cost. By the bound on
+    makespan for greedy scheduling (the work spread evenly, plus the part
+    of a chunk that can't be), which allows for error in the estimates of
+    chunks' times, makespan is least at the square root of the ratio of
+    the two.
+
+    :param int num_reads: total number of reads to process.
+    :param pararead.tuning.Calibration calibration: throughput and cost of
+        a chunk.
+    :param int workers: number of workers.
+    :return int: number of chunks, from one per worker to CHUNKS_PER_CORE
+        per worker.
+    """
+    if workers <= 1:
+        return 1
+    upper = workers * CHUNKS_PER_CORE
+    if calibration.chunk_overhead <= 0:
+        return upper
+    best = math.sqrt((workers - 1) * num_reads / (
+            calibration.reads_per_second * calibration.chunk_overhead))
+    return int(min(max(round(best), workers), upper))
@@ -9,7 +9,6 @@ if sys.version_info < (3, 3):
     from collections import Mapping, Sequence
 else:
     from collections.abc import Mapping, Sequence
-from pysam import AlignmentFile, VariantFile
 from .exceptions import FileTypeException, MissingHeaderException
 
 
@@ -19,20 +18,41 @@ __email__ = "vreuter@virginia.edu"
 
 __all__ = ["create_reads_builder",
            "interleave_chromosomes_by_size",
-           "make_outfile_name", "parse_bam_header",
+           "make_outfile_name", "parse_bam_header", "parse_memory_size",
            "partition_chunks_by_null_result",
            "pending_feature", "unbuffered_write"]
 
 
-ReadsFileMaker = namedtuple("ReadsFileMaker", field_names=["ctor", "kwargs"])
+MEMORY_UNITS = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+
+
+
+class ReadsFileMaker(namedtuple("ReadsFileMaker",
+                                field_names=["ctor_name", "kwargs"])):
+    """
+    Name of a pysam reads file constructor, with basic keyword arguments.
+
+    The constructor itself is looked up only when it's needed, as importing
+    pysam is a large share of the time it takes to import this package,
+    which each short job and each spawned worker would otherwise pay.
+    """
+
+    __slots__ = ()
+
+    @property
+    def ctor(self):
+        """ The pysam reads file constructor, importing pysam if needed. """
+        import pysam
+        return getattr(pysam, self.ctor_name)
+
 
 # TODO: pysam docs say 'u' for uncompressed BAM.
 READS_FILE_MAKER = {
-    "SAM": ReadsFileMaker(AlignmentFile, {"mode": 'r'}),
-    "BAM": ReadsFileMaker(AlignmentFile, {"mode": 'rb'}),
-    "CRAM": ReadsFileMaker(AlignmentFile, {"mode": 'rc'}),
-    "VCF": ReadsFileMaker(VariantFile, {"mode": 'r'}),
-    "BCF": ReadsFileMaker(VariantFile, {"mode": 'rb'})
+    "SAM": ReadsFileMaker("AlignmentFile", {"mode": 'r'}),
+    "BAM": ReadsFileMaker("AlignmentFile", {"mode": 'rb'}),
+    "CRAM": ReadsFileMaker("AlignmentFile", {"mode": 'rc'}),
+    "VCF": ReadsFileMaker("VariantFile", {"mode": 'r'}),
+    "BCF": ReadsFileMaker("VariantFile", {"mode": 'rb'})
 }
 
 
@@ -80,8 +100,8 @@ def interleave_chromosomes_by_size(size_by_chromosome):
     if isinstance(size_by_chromosome, Mapping):
         size_by_chromosome = size_by_chromosome.items()
 
-    ordered_chromosomes = zip(*sorted(size_by_chromosome,
-                                      key=op.itemgetter(1)))[0]
+    ordered_chromosomes = list(zip(*sorted(size_by_chromosome,
+                                           key=op.itemgetter(1))))[0]
     num_chromosomes = len(ordered_chromosomes)
     meridian = int(num_chromosomes / 2)
     first_half, second_half = \
@@ -160,6 +180,24 @@ def parse_bam_header(readsfile, chroms=None, require_aligned=False):
     return {c: s for c, s in all_sizes_by_chrom.items() if c in set(chroms)}
 
 
+def parse_memory_size(size):
+    """
+    Interpret a memory size, possibly written with a binary unit suffix.
+
+    :param int | str size: number of bytes, or text like '512M' or '8G'.
+    :return int: number of bytes.
+    :raise ValueError: if the given size can't be interpreted.
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    text = size.strip().upper().rstrip("B")
+    unit = text[-1:] if text[-1:] in MEMORY_UNITS else ""
+    try:
+        return int(float(text[:len(text) - len(unit)]) * MEMORY_UNITS[unit])
+    except ValueError:
+        raise ValueError("Invalid memory size: '{}'".format(size))
+
+
 def partition_chunks_by_null_result(result_by_chromosome):
     """
     Bin chromosome name by whether processing result was null.
@@ -59,6 +59,9 @@ setup(
     author=u"Nathan Sheffield, Vince Reuter",
     license="BSD2",
     install_requires=_DEPENDENCIES,
+    # Columnar (Parquet or Arrow IPC) output
+    extras_require={"columnar": ["pyarrow"]},
+    entry_points={"console_scripts": ["pararead = pararead.cli:main"]},
     test_suite="tests",
     tests_require=test_deps,
     setup_requires=(["pytest-runner"]
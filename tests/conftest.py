@@ -8,7 +8,8 @@ from pararead.logs import setup_logger, DEV_LOGGING_FMT
 from tests import \
     IS_ALIGNED_PARAM_NAME, NAME_TEST_LOGFILE, \
     PATH_ALIGNED_FILE, PATH_UNALIGNED_FILE
-from tests.helpers import IdentityProcessor, ReadsfileWrapper
+from tests.helpers import \
+    IdentityProcessor, ReadsfileWrapper, write_paired_reads_file
 
 
 __author__ = "Vince Reuter"
@@ -54,6 +55,22 @@ def unaligned_reads_file():
 
 
 
+@pytest.fixture(scope="session")
+def paired_reads_file(tmpdir_factory):
+    """
+    Create a small, indexed BAM of paired-end reads.
+
+    Returns
+    -------
+    str
+        Path to the BAM file, laid out per tests.helpers.PAIRED_FRAGMENTS.
+
+    """
+    folder = tmpdir_factory.mktemp("paired")
+    return write_paired_reads_file(folder.join("paired.bam").strpath)
+
+
+
 @pytest.fixture(scope="function")
 def identity_processor(request, num_cores, tmpdir):
     """
@@ -1,7 +1,10 @@
 """ Test helpers types and functions. """
 
+import time
+
 from pysam import AlignmentFile
 from pararead import ParaReadProcessor
+from pararead.groups import GroupedProcessor
 from pararead.processor import CORES_PARAM_NAME
 from tests import NUM_CORES_DEFAULT
 
@@ -9,6 +12,10 @@ __author__ = "Vince Reuter"
 __email__ = "vreuter@virginia.edu"
 
 
+# Fields stored by the ReadStartProcessor.
+READ_START_COLUMNS = ("name", "start", "mapq")
+
+
 
 class IdentityProcessor(ParaReadProcessor):
     """ Essentially a mock for test cases, simply echoing input. """
@@ -78,3 +85,311 @@ def loglines(logspath):
     """
     with open(logspath, 'r') as logfile:
         return logfile.readlines()
+
+
+
+class ChromosomeEchoProcessor(ParaReadProcessor):
+    """ Write each chromosome's name as its output, optionally failing. """
+
+    def __init__(self, *args, **kwargs):
+        self.fail_chunks = kwargs.pop("fail_chunks", ())
+        super(ChromosomeEchoProcessor, self).__init__(*args, **kwargs)
+
+    def __call__(self, chromosome):
+        """
+        Write chromosome name to the chunk's output file.
+
+        Parameters
+        ----------
+        chromosome : str
+            Name of the chromosome to process.
+
+        Returns
+        -------
+        str
+            Name of the chromosome processed.
+
+        """
+        if chromosome in self.fail_chunks:
+            raise ValueError("Failing on request: {}".format(chromosome))
+        with open(self._tempf(chromosome), 'w') as f:
+            f.write("{}\n".format(chromosome))
+        return chromosome
+
+
+
+class SlowEchoProcessor(ChromosomeEchoProcessor):
+    """ Echo chromosome name after a delay, for observing work underway. """
+
+    def __init__(self, *args, **kwargs):
+        self.delay = kwargs.pop("delay", 1)
+        super(SlowEchoProcessor, self).__init__(*args, **kwargs)
+
+    def __call__(self, chromosome):
+        time.sleep(self.delay)
+        return super(SlowEchoProcessor, self).__call__(chromosome)
+
+
+
+class ReadNameProcessor(ParaReadProcessor):
+    """ Write name of each read in the chunk, one per line. """
+
+    def __call__(self, chunk):
+        """
+        Write name of each read fetched for the chunk to its output file.
+
+        Parameters
+        ----------
+        chunk : str or pararead.regions.RegionChunk
+            Chromosome or regions whose reads to fetch.
+
+        Returns
+        -------
+        str or pararead.regions.RegionChunk
+            The chunk processed.
+
+        """
+        with open(self._tempf(chunk), 'w') as f:
+            for read in self.fetch_chunk(chunk):
+                f.write("{}\n".format(read.query_name))
+        return chunk
+
+
+
+class ReadStartProcessor(ParaReadProcessor):
+    """ Store each read's name, position, and mapping quality as records. """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("intermediate_output_type", "rec")
+        super(ReadStartProcessor, self).__init__(*args, **kwargs)
+
+    def __call__(self, chunk):
+        """
+        Store name, start, and mapping quality of each read of the chunk.
+
+        Parameters
+        ----------
+        chunk : str or pararead.regions.RegionChunk
+            Chromosome or regions whose reads to fetch.
+
+        Returns
+        -------
+        str or pararead.regions.RegionChunk
+            The chunk processed.
+
+        """
+        self.write_chunk_records(
+            chunk, (str, int, int),
+            ((r.query_name, r.reference_start, r.mapping_quality)
+             for r in self.fetch_chunk(chunk)),
+            columns=READ_START_COLUMNS)
+        return chunk
+
+
+
+class ReadIntervalProcessor(ParaReadProcessor):
+    """ Write a BED line for each read in the chunk, in order of position. """
+
+    def __call__(self, chunk):
+        """
+        Write chromosome, start, end, and name of each read of the chunk.
+
+        Parameters
+        ----------
+        chunk : str or pararead.regions.RegionChunk
+            Chromosome or regions whose reads to fetch.
+
+        Returns
+        -------
+        str or pararead.regions.RegionChunk
+            The chunk processed.
+
+        """
+        with open(self._tempf(chunk), 'w') as f:
+            for read in self.fetch_chunk(chunk):
+                f.write("{}\t{}\t{}\t{}\n".format(
+                    read.reference_name, read.reference_start,
+                    read.reference_end, read.query_name))
+        return chunk
+
+
+
+# Layout of the synthetic paired-end reads file: contig name and length,
+# and for each fragment, its name, contig and position of each mate, and
+# whether it's properly paired.
+PAIRED_CONTIGS = [("chrA", 2000), ("chrB", 1500)]
+PAIRED_READ_LENGTH = 50
+PAIRED_FRAGMENTS = \
+    [("fragA{}".format(i), "chrA", 100 + 20 * i, "chrA", 250 + 25 * i, True)
+     for i in range(20)] + \
+    [("fragB{}".format(i), "chrB", 300 + 40 * i, "chrB", 600 + 40 * i, True)
+     for i in range(10)] + \
+    [("split{}".format(i), "chrA", 1500 + 10 * i, "chrB", 50 + 10 * i, False)
+     for i in range(3)]
+
+
+def write_paired_reads_file(path):
+    """
+    Write and index a small coordinate-sorted BAM of paired-end reads.
+
+    Parameters
+    ----------
+    path : str
+        Path to the BAM file to create.
+
+    Returns
+    -------
+    str
+        Path to the BAM file created.
+
+    """
+    import pysam
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"},
+              "SQ": [{"SN": name, "LN": length}
+                     for name, length in PAIRED_CONTIGS]}
+    contig_ids = {name: i for i, (name, _) in enumerate(PAIRED_CONTIGS)}
+    reads = []
+    for name, contig1, pos1, contig2, pos2, proper in PAIRED_FRAGMENTS:
+        mates = [(contig1, pos1, contig2, pos2, 0x40, False),
+                 (contig2, pos2, contig1, pos1, 0x80, True)]
+        for contig, pos, mate_contig, mate_pos, which, reverse in mates:
+            read = pysam.AlignedSegment()
+            read.query_name = name
+            read.query_sequence = "A" * PAIRED_READ_LENGTH
+            read.query_qualities = \
+                pysam.qualitystring_to_array("I" * PAIRED_READ_LENGTH)
+            read.reference_id = contig_ids[contig]
+            read.reference_start = pos
+            read.next_reference_id = contig_ids[mate_contig]
+            read.next_reference_start = mate_pos
+            read.cigarstring = "{}M".format(PAIRED_READ_LENGTH)
+            read.mapping_quality = 60
+            read.flag = 0x1 | which | (0x2 if proper else 0) | \
+                (0x10 if reverse else 0x20)
+            if proper:
+                size = max(pos, mate_pos) + PAIRED_READ_LENGTH - \
+                       min(pos, mate_pos)
+                read.template_length = size if pos <= mate_pos else -size
+            reads.append(read)
+    reads.sort(key=lambda r: (r.reference_id, r.reference_start))
+    with pysam.AlignmentFile(path, 'wb', header=header) as bam:
+        for read in reads:
+            bam.write(read)
+    pysam.index(path)
+    return path
+
+
+
+class TemplateProcessor(ParaReadProcessor):
+    """ Write name and number of records of each template in the chunk. """
+
+    def __call__(self, chunk):
+        """
+        Write each name of the chunk's reads and its number of records.
+
+        Parameters
+        ----------
+        chunk : pararead.namesorted.NameChunk
+            Chunk of reads grouped by name.
+
+        Returns
+        -------
+        pararead.namesorted.NameChunk
+            The chunk processed.
+
+        """
+        with open(self._tempf(chunk), 'w') as f:
+            for records in self.fetch_templates(chunk):
+                f.write("{}\t{}\n".format(records[0].query_name, len(records)))
+        return chunk
+
+
+
+def write_name_sorted_reads_file(path, num_templates=3000, seed=7):
+    """
+    Write a queryname-sorted BAM of unaligned reads, spanning many blocks.
+
+    Parameters
+    ----------
+    path : str
+        Path to the BAM file to create.
+    num_templates : int
+        Number of distinct read names.
+    seed : int
+        Seed for the random sequences and numbers of records per name.
+
+    Returns
+    -------
+    dict of str to int
+        Number of records written for each name.
+
+    """
+    import random
+    import pysam
+    rng = random.Random(seed)
+    header = {"HD": {"VN": "1.6", "SO": "queryname"}}
+    records_by_name = {}
+    with pysam.AlignmentFile(path, 'wb', header=header) as bam:
+        for i in range(num_templates):
+            name = "template{:06d}".format(i)
+            records_by_name[name] = rng.randint(1, 3)
+            for j in range(records_by_name[name]):
+                read = pysam.AlignedSegment()
+                read.query_name = name
+                read.query_sequence = \
+                    "".join(rng.choice("ACGT") for _ in range(150))
+                read.query_qualities = pysam.qualitystring_to_array(
+                    "".join(rng.choice("#+5?I") for _ in range(150)))
+                read.flag = 0x4 | (0x1 | (0x40 if j == 0 else 0x80)
+                                   if records_by_name[name] > 1 else 0)
+                bam.write(read)
+    return records_by_name
+
+
+
+class GroupedNames(GroupedProcessor):
+    """ Write the name of each read to its group's output. """
+
+    def process_read(self, read):
+        yield (read.query_name, )
+
+
+
+# Read groups of the synthetic multiplexed reads file, assigned to the reads
+# of the aligned test file in turn.
+READ_GROUPS = ["sampleA", "sampleB", "sampleC"]
+
+
+def write_read_groups_file(path_reads_file, path):
+    """
+    Write and index a copy of a BAM with reads assigned to read groups.
+
+    Parameters
+    ----------
+    path_reads_file : str
+        Path to the coordinate-sorted BAM whose reads to copy.
+    path : str
+        Path to the BAM file to create.
+
+    Returns
+    -------
+    dict of str to list of str
+        Names of the reads assigned to each read group, with those of every
+        fifth read left without a read group under null.
+
+    """
+    import pysam
+    names_by_group = {}
+    with pysam.AlignmentFile(path_reads_file, 'rb') as readsfile:
+        header = readsfile.header.to_dict()
+        header["RG"] = [{"ID": g, "SM": g} for g in READ_GROUPS]
+        with pysam.AlignmentFile(path, 'wb', header=header) as bam:
+            for i, read in enumerate(readsfile):
+                group = None if i % 5 == 4 else \
+                    READ_GROUPS[i % len(READ_GROUPS)]
+                if group is not None:
+                    read.set_tag("RG", group)
+                names_by_group.setdefault(group, []).append(read.query_name)
+                bam.write(read)
+    pysam.index(path)
+    return names_by_group
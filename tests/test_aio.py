@@ -0,0 +1,121 @@
+""" Tests for driving processing from an asyncio event loop """
+
+import asyncio
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from pararead.aio import AsyncRun, ChunkCompleted, Progress
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ChromosomeEchoProcessor, SlowEchoProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+CHROMOSOMES = {"K1_unmethylated", "K3_methylated"}
+
+
+@pytest.fixture(scope="function")
+def echo_processor(tmpdir, num_cores, remove_reads_file):
+    """ Provide a processor with its reads file registered. """
+    processor = ChromosomeEchoProcessor(
+            PATH_ALIGNED_FILE, cores=num_cores,
+            outfile=tmpdir.join("echo.txt").strpath)
+    processor.register_files()
+    return processor
+
+
+class AsyncRunTests:
+    """ Processing can be awaited and monitored asynchronously. """
+
+    def test_arun(self, echo_processor):
+        good = asyncio.run(echo_processor.arun())
+        assert CHROMOSOMES == set(good)
+
+    def test_events(self, echo_processor):
+        """ Each chunk's completion is followed by a progress update. """
+        async def collect():
+            run = echo_processor.aiter_run()
+            events = [e async for e in run]
+            return run, events
+
+        run, events = asyncio.run(collect())
+        assert CHROMOSOMES == set(run.good_chunks)
+        assert Progress == type(events[0]) and 0 == events[0].completed
+        completions = [e for e in events if isinstance(e, ChunkCompleted)]
+        assert CHROMOSOMES == {e.chunk for e in completions}
+        assert CHROMOSOMES == {e.result for e in completions}
+        final = events[-1]
+        assert isinstance(final, Progress)
+        assert final.completed == final.total == 2
+
+    def test_concurrent_runs(self, tmpdir, remove_reads_file):
+        """ Multiple jobs can be supervised by one event loop. """
+        processors = []
+        for i in range(3):
+            processor = ChromosomeEchoProcessor(
+                    PATH_ALIGNED_FILE, cores=2,
+                    outfile=tmpdir.join("echo{}.txt".format(i)).strpath)
+            processor.register_files()
+            processors.append(processor)
+
+        async def run_all():
+            return await asyncio.gather(*[p.arun() for p in processors])
+
+        for good in asyncio.run(run_all()):
+            assert CHROMOSOMES == set(good)
+
+    def test_cancellation(self, tmpdir, remove_reads_file):
+        """ Cancelled run stops its workers and removes temporary files. """
+        processor = SlowEchoProcessor(
+                PATH_ALIGNED_FILE, cores=2, delay=30,
+                outfile=tmpdir.join("echo.txt").strpath)
+        processor.register_files()
+        assert os.path.isdir(processor.temp_folder)
+
+        async def cancel_soon():
+            task = asyncio.ensure_future(processor.arun())
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_soon())
+        assert not os.path.exists(processor.temp_folder)
+        assert [] == multiprocessing.active_children()
+
+    def test_loop_not_blocked(self, echo_processor, monkeypatch):
+        """ Setup and teardown, which may be slow, run off the loop. """
+        prepare, finish = echo_processor._prepare_run, AsyncRun._finish
+
+        def slow_prepare(**kwargs):
+            time.sleep(0.5)
+            return prepare(**kwargs)
+
+        def slow_finish(self, *args):
+            time.sleep(0.5)
+            return finish(self, *args)
+
+        monkeypatch.setattr(echo_processor, "_prepare_run", slow_prepare)
+        monkeypatch.setattr(AsyncRun, "_finish", slow_finish)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.time())
+                await asyncio.sleep(0.05)
+
+        async def run_with_ticker():
+            ticker = asyncio.ensure_future(tick())
+            try:
+                return await echo_processor.arun()
+            finally:
+                ticker.cancel()
+
+        assert CHROMOSOMES == set(asyncio.run(run_with_ticker()))
+        # The ticker kept going through a second of sleeping.
+        assert len(ticks) > 10
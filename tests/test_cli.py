@@ -0,0 +1,149 @@
+""" Tests for the command-line runner of processor classes """
+
+import os
+
+import pytest
+
+from pararead.cli import \
+    build_parser, load_processor_class, main, parse_params, summarize
+from pararead.pileup import AlleleCounter
+from pararead.processors import ReadCounter
+from tests import PATH_ALIGNED_FILE, NUM_READS_BY_FILE
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+COUNTER_PATH = "pararead.processors.ReadCounter"
+PILEUP_PATH = "pararead.pileup.AlleleCounter"
+
+
+
+def _read_counts(path):
+    """ Read the count of reads by chromosome, from output of a counter. """
+    with open(path) as f:
+        next(f)
+        return {chrom: int(n) for chrom, n in
+                (l.rstrip("\n").split("\t") for l in f)}
+
+
+
+class CliTests:
+    """ A processor class is run per command-line arguments. """
+
+    def test_run(self, tmpdir, num_cores, capsys):
+        outfile = tmpdir.join("counts.txt").strpath
+        assert 0 == main([COUNTER_PATH, PATH_ALIGNED_FILE, "-O", outfile,
+                          "-C", str(num_cores), "--silent"])
+        counts = _read_counts(outfile)
+        assert NUM_READS_BY_FILE[PATH_ALIGNED_FILE] == sum(counts.values())
+        summary = capsys.readouterr().out.splitlines()
+        assert summary[0].startswith("Processed 2 chunk(s)")
+        assert ["setup", "run", "combine"] == \
+            [l.split(":")[0].strip() for l in summary[1:4]]
+        assert summary[-1].startswith("Throughput:")
+        assert "reads/s" in summary[-1]
+
+    def test_knobs(self, tmpdir):
+        outfile = tmpdir.join("counts.txt").strpath
+        profile = tmpdir.join("counts.prof").strpath
+        assert 0 == main([COUNTER_PATH, PATH_ALIGNED_FILE, "-O", outfile,
+                          "--limit", "K3_methylated", "--retries", "1",
+                          "--profile", profile, "--silent"])
+        assert {"K3_methylated": 95} == _read_counts(outfile)
+        assert os.path.isfile(profile)
+
+    def test_param(self, tmpdir):
+        outfile = tmpdir.join("counts.txt").strpath
+        assert 0 == main([COUNTER_PATH, PATH_ALIGNED_FILE, "-O", outfile,
+                          "-P", 'limit=["K1_unmethylated"]', "--silent"])
+        assert {"K1_unmethylated": 28} == _read_counts(outfile)
+
+    def test_resume(self, tmpdir, capsys):
+        outfile = tmpdir.join("counts.txt")
+        outfile.write("done\n")
+        assert 0 == main([COUNTER_PATH, PATH_ALIGNED_FILE, "-O",
+                          outfile.strpath, "--resume", "--silent"])
+        assert "done\n" == outfile.read()
+        assert "" == capsys.readouterr().out
+
+    @pytest.mark.parametrize(argnames="executor", argvalues=["pool", "serial"])
+    def test_executor(self, tmpdir, executor):
+        outfile = tmpdir.join("counts.txt").strpath
+        assert 0 == main([COUNTER_PATH, PATH_ALIGNED_FILE, "-O", outfile,
+                          "--executor", executor, "--silent"])
+        assert NUM_READS_BY_FILE[PATH_ALIGNED_FILE] == \
+            sum(_read_counts(outfile).values())
+
+    @pytest.mark.parametrize(argnames="ordering",
+                             argvalues=[[], ["--no-ordered-output"]])
+    def test_processor_defaults(self, tmpdir, capsys, ordering):
+        """ A pileup keeps its windows, and its output in order or not. """
+        expected = tmpdir.join("expected.txt").strpath
+        processor = AlleleCounter(PATH_ALIGNED_FILE, cores=1,
+                                  outfile=expected)
+        processor.register_files()
+        processor.run()
+        outfile = tmpdir.join("alleles.txt").strpath
+        assert 0 == main([PILEUP_PATH, PATH_ALIGNED_FILE, "-O", outfile,
+                          "--silent"] + ordering)
+        with open(expected) as f:
+            rows = f.read()
+        assert rows
+        with open(outfile) as f:
+            assert rows == f.read()
+        steps = [l.split(":")[0].strip() for l in
+                 capsys.readouterr().out.splitlines()[1:]]
+        assert ("combine" in steps) == bool(ordering)
+
+    @pytest.mark.parametrize(argnames="path", argvalues=[
+        "ReadCounter", "pararead.processors.Nope", "pararead.nope:X",
+        "pararead.processors.count_reads", "pararead.cli.main"])
+    def test_bad_processor(self, tmpdir, path):
+        with pytest.raises(SystemExit):
+            main([path, PATH_ALIGNED_FILE, "-O",
+                  tmpdir.join("x.txt").strpath, "--silent"])
+
+
+
+class CliHelpersTests:
+    """ Loading of processor classes, arguments, and summary. """
+
+    @pytest.mark.parametrize(argnames="path", argvalues=[
+        COUNTER_PATH, "pararead.processors:ReadCounter"])
+    def test_load(self, path):
+        assert ReadCounter is load_processor_class(path)
+
+    def test_params(self):
+        assert {"window_size": 100, "regions": "a.bed", "flag": True,
+                "limit": ["chr1"]} == parse_params(
+            ["window_size=100", "regions=a.bed", "flag=true",
+             'limit=["chr1"]'])
+
+    def test_unset_options(self):
+        """ Options not given are left to the processor. """
+        opts = vars(build_parser().parse_args(
+                [COUNTER_PATH, PATH_ALIGNED_FILE, "-O", "x.txt"]))
+        for name in ["window_size", "regions", "ordered_output", "retries",
+                     "region_ownership", "executor", "chunking"]:
+            assert name not in opts
+
+    @pytest.mark.parametrize(argnames=["flags", "expected"], argvalues=[
+        (["--ordered-output"], True), (["--no-ordered-output"], False)])
+    def test_ordered_output(self, flags, expected):
+        opts = build_parser().parse_args(
+                [COUNTER_PATH, PATH_ALIGNED_FILE, "-O", "x.txt"] + flags)
+        assert expected is opts.ordered_output
+
+    def test_bad_param(self):
+        with pytest.raises(ValueError):
+            parse_params(["window_size"])
+
+    def test_summary(self):
+        lines = summarize(PATH_ALIGNED_FILE, 2, 1000,
+                          [("run", 1.5), ("combine", 0.5)])
+        assert ["Processed 2 chunk(s) of '{}' in 2.00s".format(
+                PATH_ALIGNED_FILE), "  run: 1.50s", "  combine: 0.50s"] == \
+            lines[:3]
+        assert lines[3].startswith("Throughput: 500 reads/s")
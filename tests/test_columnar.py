@@ -0,0 +1,138 @@
+""" Tests for columnar (Parquet or Arrow IPC) final output """
+
+import json
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.columnar import \
+    combine_tables, read_table, write_table, CHUNKS_METADATA_KEY
+from pararead.processors import BinnedCoverage, ReadCounter
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadStartProcessor, READ_START_COLUMNS
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+
+def _expected_by_chrom():
+    with AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+        return {c: [(r.query_name, r.reference_start, r.mapping_quality)
+                    for r in readsfile.fetch(c)]
+                for c in readsfile.references}
+
+
+
+class TablesTests:
+    """ Tables of chunks are assembled with a row group per chunk. """
+
+    @pytest.mark.parametrize(argnames="output_type",
+                             argvalues=["parquet", "arrow"])
+    def test_combine(self, tmpdir, output_type):
+        chunks = [("a", [(u"x", 1, 0.5)] * 3), ("empty", []),
+                  ("b", [(u"y", 2, 1.5), (u"z", 3, 2.5)])]
+        paths = [write_table(tmpdir.join("{}.arrow".format(c)).strpath,
+                             READ_START_COLUMNS, (str, int, float), records)
+                 for c, records in chunks]
+        outpath = combine_tables(
+            paths, tmpdir.join("all").strpath, output_type,
+            chunks=[c for c, _ in chunks])
+        if output_type == "parquet":
+            metadata = pq.ParquetFile(outpath).metadata
+            assert [3, 2] == [metadata.row_group(i).num_rows
+                              for i in range(metadata.num_row_groups)]
+            table = pq.read_table(outpath)
+        else:
+            table = read_table(outpath)
+        assert ["a", "b"] == json.loads(
+            table.schema.metadata[CHUNKS_METADATA_KEY])
+        assert [r for _, rs in chunks for r in rs] == \
+            list(zip(*(c.to_pylist() for c in table.columns)))
+
+    def test_schema_mismatch(self, tmpdir):
+        paths = [write_table(tmpdir.join("a.arrow").strpath, ["x"], [int],
+                             [(1, )]),
+                 write_table(tmpdir.join("b.arrow").strpath, ["x"], [str],
+                             [("1", )])]
+        with pytest.raises(ValueError):
+            combine_tables(paths, tmpdir.join("all").strpath)
+
+
+
+class ProcessorColumnarTests:
+    """ Processors write columnar final output from chunks' tables. """
+
+    def test_parquet(self, tmpdir, num_cores):
+        outfile = tmpdir.join("starts.parquet").strpath
+        processor = ReadStartProcessor(
+            PATH_ALIGNED_FILE, cores=num_cores, outfile=outfile,
+            intermediate_output_type="arrow", output_type="parquet")
+        processor.register_files()
+        chunks = processor.run()
+        processor.combine(chunks, strict=True)
+        parquet = pq.ParquetFile(outfile)
+        assert list(READ_START_COLUMNS) == parquet.schema_arrow.names
+        expected = _expected_by_chrom()
+        assert len(expected) == parquet.metadata.num_row_groups
+        chunk_order = json.loads(
+            parquet.schema_arrow.metadata[CHUNKS_METADATA_KEY])
+        for i, chrom in enumerate(chunk_order):
+            group = parquet.read_row_group(i)
+            assert expected[chrom] == list(zip(
+                *(c.to_pylist() for c in group.columns)))
+
+    def test_text_from_tables(self, tmpdir):
+        outfile = tmpdir.join("starts.txt").strpath
+        processor = ReadStartProcessor(
+            PATH_ALIGNED_FILE, cores=1, outfile=outfile,
+            intermediate_output_type="arrow")
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            lines = f.read().splitlines()
+        assert sorted("\t".join(str(v) for v in r)
+                      for rs in _expected_by_chrom().values()
+                      for r in rs) == sorted(lines)
+
+    def test_requires_tables(self, tmpdir):
+        processor = ReadStartProcessor(
+            PATH_ALIGNED_FILE, cores=1, output_type="parquet",
+            outfile=tmpdir.join("starts.parquet").strpath)
+        processor.register_files()
+        chunks = processor.run()
+        with pytest.raises(ValueError):
+            processor.combine(chunks)
+
+    @pytest.mark.parametrize(argnames="output_type",
+                             argvalues=["parquet", "arrow"])
+    def test_summary(self, tmpdir, output_type):
+        outfile = tmpdir.join("counts.{}".format(output_type)).strpath
+        processor = ReadCounter(PATH_ALIGNED_FILE, cores=2, outfile=outfile,
+                                output_type=output_type)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        table = pq.read_table(outfile) if output_type == "parquet" \
+            else read_table(outfile)
+        assert {c: len(reads) for c, reads in _expected_by_chrom().items()} \
+            == dict(zip(*(c.to_pylist() for c in table.columns)))
+
+    @pytest.mark.parametrize(argnames="output_type",
+                             argvalues=["parquet", "arrow"])
+    def test_summary_types(self, tmpdir, output_type):
+        """ Columns are typed as the values, not as their text. """
+        outfile = tmpdir.join("coverage.{}".format(output_type)).strpath
+        processor = BinnedCoverage(PATH_ALIGNED_FILE, cores=1, bin_size=50,
+                                   outfile=outfile, output_type=output_type)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        table = pq.read_table(outfile) if output_type == "parquet" \
+            else read_table(outfile)
+        assert [pa.string(), pa.int64(), pa.int64(), pa.float64()] == \
+            table.schema.types
+        assert all(d > 0 for d in table.column("mean_depth").to_pylist())
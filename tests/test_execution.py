@@ -0,0 +1,149 @@
+""" Tests for fault-tolerant execution of chunk processing """
+
+import os
+import time
+
+import pytest
+
+from pararead.execution import ChunkExecutor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+BAD_CHUNK = "bad"
+
+
+def _square(x):
+    return x * x
+
+
+def _raise_for_bad(chunk):
+    if chunk == BAD_CHUNK:
+        raise ValueError(chunk)
+    return chunk
+
+
+def _die_for_bad(chunk):
+    if chunk == BAD_CHUNK:
+        os._exit(1)
+    return chunk
+
+
+def _hang_for_bad(chunk):
+    if chunk == BAD_CHUNK:
+        time.sleep(60)
+    return chunk
+
+
+def _fail_first_attempt(path):
+    """ Fail unless a marker file from a previous attempt exists. """
+    if os.path.exists(path):
+        return path
+    open(path, 'w').close()
+    raise IOError("first attempt")
+
+
+def _record_span(path):
+    """ Write start and end time of (slow) processing to the given path. """
+    start = time.time()
+    time.sleep(0.3)
+    with open(path, 'w') as f:
+        f.write("{}\t{}".format(start, time.time()))
+    return path
+
+
+class _PickleCounter(object):
+    """ Per-chunk function that counts its pickling, in this process. """
+
+    pickles = 0
+
+    def __getstate__(self):
+        _PickleCounter.pickles += 1
+        return {"payload": self.payload}
+
+    def __init__(self):
+        # Sizable state, as a processor with an annotation table may have.
+        self.payload = list(range(10 ** 5))
+
+    def __call__(self, chunk):
+        return len(self.payload) + chunk
+
+
+def _read_span(path):
+    with open(path, 'r') as f:
+        return tuple(float(t) for t in f.read().split("\t"))
+
+
+class ChunkExecutorTests:
+    """ Chunks are processed independently of one another's failures. """
+
+    def test_all_results_yielded(self, num_cores):
+        """ Each chunk's result is paired with the chunk itself. """
+        executor = ChunkExecutor(_square, cores=num_cores)
+        observed = dict(executor.imap(range(10)))
+        assert {i: i * i for i in range(10)} == observed
+        assert {} == executor.failures
+
+    def test_function_sent_once_per_worker(self):
+        """ Tasks carry only the chunk, not the function with its state. """
+        _PickleCounter.pickles = 0
+        executor = ChunkExecutor(_PickleCounter(), cores=2)
+        observed = dict(executor.imap(range(50)))
+        assert {i: 10 ** 5 + i for i in range(50)} == observed
+        assert _PickleCounter.pickles <= 2
+
+    @pytest.mark.parametrize(
+            argnames="func", argvalues=[_raise_for_bad, _die_for_bad])
+    def test_failure_is_isolated(self, func):
+        """ Failed chunk gets null result, and others are unaffected. """
+        executor = ChunkExecutor(func, cores=2, retries=1, retry_backoff=0)
+        observed = dict(executor.imap(["a", BAD_CHUNK, "b"]))
+        assert {"a": "a", BAD_CHUNK: None, "b": "b"} == observed
+        assert [BAD_CHUNK] == list(executor.failures.keys())
+        assert 2 == executor.failures[BAD_CHUNK].attempts
+
+    def test_serial_exception_is_isolated(self):
+        """ Exception isolation applies to single-core execution, too. """
+        executor = ChunkExecutor(_raise_for_bad, cores=1, retry_backoff=0)
+        observed = dict(executor.imap([BAD_CHUNK, "a"]))
+        assert {"a": "a", BAD_CHUNK: None} == observed
+        assert "ValueError" in executor.failures[BAD_CHUNK].error
+
+    def test_timeout(self):
+        """ Chunk exceeding time limit is abandoned. """
+        executor = ChunkExecutor(_hang_for_bad, cores=2, timeout=0.5)
+        start = time.time()
+        observed = dict(executor.imap([BAD_CHUNK, "a"]))
+        assert time.time() - start < 30
+        assert {"a": "a", BAD_CHUNK: None} == observed
+        assert "timed out" in executor.failures[BAD_CHUNK].error
+
+    def test_retry_recovers(self, tmpdir, num_cores):
+        """ Transient failure is overcome by a retry. """
+        path = tmpdir.join("marker").strpath
+        executor = ChunkExecutor(_fail_first_attempt, cores=num_cores,
+                                 retries=1, retry_backoff=0)
+        assert [(path, path)] == list(executor.imap([path]))
+        assert {} == executor.failures
+
+    def test_memory_budget_separates_heavy_chunks(self, tmpdir):
+        """ Chunks that together exceed the budget don't run together. """
+        heavy = [tmpdir.join("heavy{}".format(i)).strpath for i in range(2)]
+        light = [tmpdir.join("light{}".format(i)).strpath for i in range(3)]
+        cost_by_chunk = {c: 6 for c in heavy}
+        cost_by_chunk.update({c: 1 for c in light})
+        executor = ChunkExecutor(
+                _record_span, cores=3, memory_budget=10,
+                chunk_cost=cost_by_chunk)
+        assert set(heavy + light) == \
+               {c for c, _ in executor.imap(heavy + light)}
+        (start1, end1), (start2, end2) = [_read_span(c) for c in heavy]
+        assert end1 <= start2 or end2 <= start1
+
+    def test_chunk_over_budget_still_runs(self, num_cores):
+        """ A chunk estimated to exceed the whole budget runs alone. """
+        executor = ChunkExecutor(_square, cores=num_cores, memory_budget=1,
+                                 chunk_cost=lambda c: 10)
+        assert {2: 4, 3: 9} == dict(executor.imap([2, 3]))
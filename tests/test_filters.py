@@ -0,0 +1,109 @@
+""" Tests for declarative filtering of reads """
+
+import pickle
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.filters import \
+    ReadFilter, DEFAULT_EXCLUDED_FLAGS, FLAG_DUPLICATE, FLAG_SECONDARY
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadNameProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+def _few_mismatches(edit_distance):
+    """ Tag predicate, at module level so that it can be pickled. """
+    return edit_distance <= 5
+
+
+def _reads():
+    with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+        return list(readsfile.fetch())
+
+
+class ReverseStrandNames(ReadNameProcessor):
+    """ Declare criteria as class attributes. """
+    flag_required = 0x10
+    tag_filters = {"XG": "GA"}
+
+
+class ReadFilterTests:
+    """ Criteria compile to a predicate equivalent to naive checks. """
+
+    @pytest.mark.parametrize(
+        argnames=["criteria", "naive"],
+        argvalues=[
+            ({}, lambda r: True),
+            ({"flag_excluded": 0x10}, lambda r: not r.is_reverse),
+            ({"flag_required": 0x10}, lambda r: r.is_reverse),
+            ({"min_mapq": 256}, lambda r: False),
+            ({"flag_excluded": DEFAULT_EXCLUDED_FLAGS, "min_mapq": 30},
+             lambda r: not (r.is_unmapped or r.is_secondary or
+                            r.is_qcfail or r.is_duplicate)),
+            ({"tags": {"XG": "CT"}}, lambda r: r.get_tag("XG") == "CT"),
+            ({"tags": {"NM": _few_mismatches}},
+             lambda r: r.get_tag("NM") <= 5),
+            ({"tags": {"ZZ": 1}}, lambda r: False),
+            ({"flag_required": 0x10, "tags": {"NM": _few_mismatches}},
+             lambda r: r.is_reverse and r.get_tag("NM") <= 5)])
+    def test_matches_naive_checks(self, criteria, naive):
+        reads = _reads()
+        read_filter = ReadFilter(**criteria)
+        expected = [r.query_name for r in reads if naive(r)]
+        assert expected == [r.query_name for r in read_filter.filter(reads)]
+        assert expected == [r.query_name for r in reads if read_filter(r)]
+
+    def test_no_criteria_passes_reads_through(self):
+        reads = _reads()
+        read_filter = ReadFilter()
+        assert not read_filter
+        assert read_filter.filter(reads) is reads
+
+    def test_conflicting_flags(self):
+        with pytest.raises(ValueError):
+            ReadFilter(flag_required=FLAG_DUPLICATE | FLAG_SECONDARY,
+                       flag_excluded=FLAG_DUPLICATE)
+
+    def test_pickle(self):
+        """ A filter survives the trip to a worker process. """
+        read_filter = ReadFilter(flag_excluded=0x10, min_mapq=1,
+                                 tags={"NM": _few_mismatches})
+        copied = pickle.loads(pickle.dumps(read_filter))
+        reads = _reads()
+        assert [r.query_name for r in read_filter.filter(reads)] == \
+            [r.query_name for r in copied.filter(reads)]
+
+
+class ProcessorFilterTests:
+    """ A processor's criteria apply to the reads fetch_chunk() pulls. """
+
+    def _names(self, processor_type, tmpdir, cores, **kwargs):
+        outfile = tmpdir.join("names.txt").strpath
+        processor = processor_type(PATH_ALIGNED_FILE, cores=cores,
+                                   outfile=outfile, **kwargs)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            return f.read().split()
+
+    def test_declared_criteria(self, tmpdir, num_cores):
+        """ Criteria declared by class attributes are applied. """
+        names = self._names(ReverseStrandNames, tmpdir, num_cores)
+        assert 83 == len(names)
+
+    def test_given_filter(self, tmpdir, num_cores):
+        """ A filter given at construction overrides declared criteria. """
+        names = self._names(
+            ReverseStrandNames, tmpdir, num_cores,
+            read_filter=ReadFilter(tags={"NM": _few_mismatches}))
+        assert 97 == len(names)
+
+    def test_filter_region_chunks(self, tmpdir):
+        """ Criteria apply to reads of region chunks as well. """
+        names = self._names(ReadNameProcessor, tmpdir, 2, window_size=50,
+                            read_filter=ReadFilter(flag_excluded=0x10))
+        assert 40 == len(names) == len(set(names))
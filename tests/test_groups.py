@@ -0,0 +1,139 @@
+""" Tests for processing of reads by group """
+
+import os
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.groups import ReadGroupSplitter
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import GroupedNames, READ_GROUPS, write_read_groups_file
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+
+class FlakyGroupedNames(GroupedNames):
+    """ Fail partway through the first attempt at a chunk with many reads. """
+
+    # Number of reads of a chunk after which the first attempt fails.
+    fail_after = 50
+
+    def __init__(self, *args, **kwargs):
+        self.marker = kwargs.pop("marker")
+        self._num_reads = 0
+        super(FlakyGroupedNames, self).__init__(*args, **kwargs)
+
+    def __call__(self, chunk):
+        self._num_reads = 0
+        return super(FlakyGroupedNames, self).__call__(chunk)
+
+    def process_read(self, read):
+        self._num_reads += 1
+        if self._num_reads > self.fail_after and \
+                not os.path.exists(self.marker):
+            open(self.marker, 'w').close()
+            raise RuntimeError("Failing partway through a chunk")
+        return super(FlakyGroupedNames, self).process_read(read)
+
+
+
+@pytest.fixture(scope="module")
+def read_groups_file(tmpdir_factory):
+    """ Path to a BAM with read groups, and names of reads by group. """
+    path = tmpdir_factory.mktemp("groups").join("groups.bam").strpath
+    return path, write_read_groups_file(PATH_ALIGNED_FILE, path)
+
+
+
+def _run(processor):
+    processor.register_files()
+    processor.combine(processor.run(), strict=True)
+    with open(processor.outfile) as index:
+        return [l.split("\t") for l in index.read().splitlines()]
+
+
+
+class GroupedProcessorTests:
+    """ One pass produces output for each group. """
+
+    def test_read_groups(self, read_groups_file, tmpdir, num_cores):
+        path, names_by_group = read_groups_file
+        processor = GroupedNames(path, cores=num_cores,
+                                 outfile=tmpdir.join("names.txt").strpath)
+        index = _run(processor)
+        assert READ_GROUPS == [group for group, _ in index]
+        for group, outpath in index:
+            assert outpath == processor.group_outfile(group)
+            with open(outpath) as f:
+                assert sorted(names_by_group[group]) == sorted(f.read().split())
+
+    def test_untagged_group(self, read_groups_file, tmpdir):
+        path, names_by_group = read_groups_file
+        processor = GroupedNames(path, cores=2,
+                                 outfile=tmpdir.join("names.txt").strpath)
+        processor.untagged_group = "unassigned"
+        index = dict(_run(processor))
+        assert READ_GROUPS + ["unassigned"] == list(index)
+        with open(index["unassigned"]) as f:
+            assert sorted(names_by_group[None]) == sorted(f.read().split())
+
+    @pytest.mark.parametrize("buffer_size", [1, 7, 10000])
+    def test_other_tag(self, tmpdir, buffer_size):
+        """ Any tag can define the groups, with output buffered or not. """
+        processor = GroupedNames(
+            PATH_ALIGNED_FILE, cores=2, group_tag="XG", window_size=60,
+            buffer_size=buffer_size, outfile=tmpdir.join("names.txt").strpath)
+        index = dict(_run(processor))
+        counts = {}
+        for group, outpath in index.items():
+            with open(outpath) as f:
+                counts[group] = len(f.read().split())
+        assert {"CT": 40, "GA": 83} == counts
+
+    def test_retry(self, tmpdir, num_cores):
+        """ A retried chunk's group files hold none of the failed attempt. """
+        marker = tmpdir.join("failed").strpath
+        processor = FlakyGroupedNames(
+            PATH_ALIGNED_FILE, cores=num_cores, group_tag="XG", buffer_size=1,
+            marker=marker, outfile=tmpdir.join("names.txt").strpath)
+        processor.register_files()
+        chunks = processor.run(retries=1, retry_backoff=0)
+        processor.combine(chunks, strict=True)
+        assert os.path.exists(marker)
+        counts = {}
+        with open(processor.outfile) as index:
+            for group, outpath in (l.split("\t") for l in
+                                   index.read().splitlines()):
+                with open(outpath) as f:
+                    counts[group] = len(f.read().split())
+        assert {"CT": 40, "GA": 83} == counts
+
+    def test_ordered_output(self, read_groups_file, tmpdir):
+        path, _ = read_groups_file
+        processor = GroupedNames(path, cores=2,
+                                 outfile=tmpdir.join("names.txt").strpath)
+        processor.register_files()
+        with pytest.raises(ValueError):
+            processor.run(ordered_output=True)
+
+
+
+class ReadGroupSplitterTests:
+    """ Reads are split into a SAM file per read group. """
+
+    def test_split(self, read_groups_file, tmpdir, num_cores):
+        path, names_by_group = read_groups_file
+        processor = ReadGroupSplitter(
+            path, cores=num_cores, outfile=tmpdir.join("split.sam").strpath)
+        for group, outpath in _run(processor):
+            assert os.path.basename(outpath) == "split.{}.sam".format(group)
+            with AlignmentFile(outpath, 'r') as split:
+                assert [group] == [rg["ID"] for rg in
+                                   split.header.to_dict()["RG"]]
+                reads = list(split)
+            assert {group} == {r.get_tag("RG") for r in reads}
+            assert sorted(names_by_group[group]) == \
+                sorted(r.query_name for r in reads)
@@ -0,0 +1,92 @@
+""" Tests for processing of paired-end reads by fragment """
+
+import pytest
+
+from pararead.mates import FragmentWriter, MateBuffer
+from pararead.pipeline import PipelineStage
+from tests.helpers import PAIRED_FRAGMENTS, PAIRED_READ_LENGTH
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+def _expected_fragments():
+    rows = set()
+    for name, chrom1, pos1, chrom2, pos2, _ in PAIRED_FRAGMENTS:
+        if chrom1 == chrom2:
+            orientation = "FR" if pos1 <= pos2 else "RF"
+        else:
+            orientation = "FR"
+        rows.add((chrom1, str(pos1), str(pos1 + PAIRED_READ_LENGTH),
+                  chrom2, str(pos2), str(pos2 + PAIRED_READ_LENGTH),
+                  name, orientation))
+    return rows
+
+
+class RecordingStage(PipelineStage):
+    def __init__(self):
+        self.chunks = []
+
+    def process(self, output):
+        self.chunks.append(output.chunk)
+        return output
+
+
+class MateBufferTests:
+
+    def test_pairs_in_mate_order(self, paired_reads_file):
+        """ Pairs come out first mate first, whichever arrives first. """
+        from pysam import AlignmentFile
+        mates = MateBuffer()
+        pairs = []
+        with AlignmentFile(paired_reads_file, 'rb') as readsfile:
+            for read in readsfile.fetch("chrB"):
+                pair = mates.add(read)
+                if pair:
+                    pairs.append(pair)
+        assert 10 == len(pairs)
+        assert all(r1.is_read1 and r2.is_read2 for r1, r2 in pairs)
+        leftovers = mates.drain()
+        assert {"split0", "split1", "split2"} == \
+            {r.query_name for r in leftovers}
+        assert 0 == len(mates)
+
+
+class FragmentProcessorTests:
+    """ Each fragment is processed exactly once, with both mates. """
+
+    @pytest.mark.parametrize(argnames="window_size",
+                             argvalues=[None, 100, 1000])
+    def test_all_fragments_once(self, tmpdir, paired_reads_file, num_cores,
+                                window_size):
+        """ Mates split between chunks are paired by reconciliation. """
+        outfile = tmpdir.join("fragments.tsv").strpath
+        processor = FragmentWriter(paired_reads_file, cores=num_cores,
+                                   outfile=outfile, window_size=window_size)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            rows = [tuple(l.rstrip("\n").split("\t")) for l in f]
+        assert len(PAIRED_FRAGMENTS) == len(rows)
+        assert _expected_fragments() == set(rows)
+        assert not list(tmpdir.visit("*.mates.sam"))
+
+    def test_no_ordered_output(self, tmpdir, paired_reads_file):
+        """ Reconciled fragments can't be dropped by writing in order. """
+        processor = FragmentWriter(
+            paired_reads_file, cores=2, window_size=500,
+            outfile=tmpdir.join("fragments.tsv").strpath)
+        processor.register_files()
+        with pytest.raises(ValueError):
+            processor.run(ordered_output=True)
+
+    def test_user_pipeline_still_runs(self, tmpdir, paired_reads_file):
+        """ Reconciliation goes ahead of the stages given for the run. """
+        recorder = RecordingStage()
+        processor = FragmentWriter(
+            paired_reads_file, cores=2, window_size=500,
+            outfile=tmpdir.join("fragments.tsv").strpath)
+        processor.register_files()
+        good_chunks = processor.run(pipeline=[recorder])
+        assert set(good_chunks) == set(recorder.chunks)
@@ -0,0 +1,115 @@
+""" Tests for processing of reads grouped by name """
+
+import os
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.bgzf import find_block_start, read_block
+from pararead.namesorted import fetch_name_chunk, make_name_chunks
+from tests import PATH_ALIGNED_FILE, PATH_UNALIGNED_FILE
+from tests.helpers import \
+    ReadNameProcessor, TemplateProcessor, write_name_sorted_reads_file
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+
+@pytest.fixture(scope="module")
+def name_sorted_file(tmpdir_factory):
+    """ Path to a queryname-sorted BAM, and records written per name. """
+    path = tmpdir_factory.mktemp("names").join("names.bam").strpath
+    return path, write_name_sorted_reads_file(path)
+
+
+
+class BgzfTests:
+    """ Blocks are found from arbitrary offsets. """
+
+    def test_blocks_tile_file(self, name_sorted_file):
+        """ Stepping by block size lands on each found block. """
+        path, _ = name_sorted_file
+        size = os.path.getsize(path)
+        with open(path, 'rb') as handle:
+            offset, stepped = 0, []
+            while offset < size:
+                stepped.append(offset)
+                _, block_size = read_block(handle, offset)
+                offset += block_size
+            found = sorted({find_block_start(handle, o)
+                            for o in range(0, size, 997)} - {None})
+        assert len(stepped) > 10
+        assert set(found) <= set(stepped)
+        assert found[-1] == stepped[-1]
+
+
+
+class NameChunkTests:
+    """ Chunks cover the file without splitting records of a name. """
+
+    @pytest.mark.parametrize("num_chunks", [1, 2, 5, 20])
+    def test_chunks_partition_records(self, name_sorted_file, num_chunks):
+        path, records_by_name = name_sorted_file
+        with AlignmentFile(path, check_sq=False) as readsfile:
+            chunks = make_name_chunks(readsfile, num_chunks)
+            names = [[r.query_name for r in fetch_name_chunk(readsfile, c)]
+                     for c in chunks]
+        assert min(num_chunks, 2) <= len(chunks) <= num_chunks
+        assert chunks[-1].end is None
+        assert sum(records_by_name.values()) == sum(len(n) for n in names)
+        for before, after in zip(names[:-1], names[1:]):
+            assert before[-1] != after[0]
+
+    def test_small_file(self):
+        """ A file of a few blocks still covers every read once. """
+        with AlignmentFile(PATH_UNALIGNED_FILE, check_sq=False) as readsfile:
+            expected = [r.query_name for r in readsfile]
+            chunks = make_name_chunks(readsfile, 4)
+            names = [r.query_name for c in chunks
+                     for r in fetch_name_chunk(readsfile, c)]
+        assert expected == names
+
+
+
+class ProcessByNameTests:
+    """ A processor chunks reads by name. """
+
+    def test_templates_intact(self, name_sorted_file, tmpdir, num_cores):
+        path, records_by_name = name_sorted_file
+        outfile = tmpdir.join("templates.txt").strpath
+        processor = TemplateProcessor(path, cores=num_cores, outfile=outfile,
+                                      by_name=True)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            rows = [l.split("\t") for l in f.read().splitlines()]
+        assert records_by_name == {name: int(n) for name, n in rows}
+        assert len(rows) == len(records_by_name)
+
+    def test_ordered_output(self, tmpdir):
+        """ Output by name can be written in file order. """
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(PATH_UNALIGNED_FILE, cores=2,
+                                      outfile=outfile, by_name=True)
+        processor.register_files()
+        processor.run(ordered_output=True)
+        with AlignmentFile(PATH_UNALIGNED_FILE, check_sq=False) as readsfile:
+            expected = [r.query_name for r in readsfile]
+        with open(outfile) as f:
+            assert expected == f.read().split()
+
+    def test_coordinate_sorted(self, tmpdir):
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=2, by_name=True,
+            outfile=tmpdir.join("names.txt").strpath)
+        processor.register_files()
+        with pytest.raises(ValueError):
+            processor.run()
+
+    def test_position_restriction(self, tmpdir):
+        with pytest.raises(ValueError):
+            ReadNameProcessor(PATH_ALIGNED_FILE, cores=2, by_name=True,
+                              window_size=50,
+                              outfile=tmpdir.join("names.txt").strpath)
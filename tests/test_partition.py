@@ -0,0 +1,148 @@
+""" Tests for partitioning of reads into chunks """
+
+from collections import Counter
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.partition import \
+    ChromosomePartitioner, Partitioner, ReadBalancedPartitioner, \
+    WindowPartitioner, ChunkEstimate
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadNameProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+
+class StrandPartitioner(Partitioner):
+    """ Custom partitioner: one chunk per chromosome and strand. """
+
+    def partition(self, processor, readsfile):
+        counts = Counter((r.reference_name, r.is_reverse)
+                         for r in readsfile.fetch(multiple_iterators=True))
+        return [ChunkEstimate("{}_{}".format(c, s), counts[(c, s == "-")])
+                for c in readsfile.references for s in "+-"]
+
+    def fetch(self, processor, chunk):
+        chrom, strand = chunk.rsplit("_", 1)
+        for read in processor.readsfile.fetch(chrom, multiple_iterators=True):
+            if read.is_reverse == (strand == "-"):
+                yield read
+
+
+
+class UncountedPartitioner(StrandPartitioner):
+    """ Custom partitioner without estimates of the chunks' reads. """
+
+    def partition(self, processor, readsfile):
+        return [ChunkEstimate(e.chunk, None) for e in super(
+                UncountedPartitioner, self).partition(processor, readsfile)]
+
+
+
+def _names(tmpdir, cores, **kwargs):
+    outfile = tmpdir.join("names.txt").strpath
+    processor = ReadNameProcessor(PATH_ALIGNED_FILE, cores=cores,
+                                  outfile=outfile, **kwargs)
+    processor.register_files()
+    chunks = processor.run(ordered_output=True)
+    with open(outfile) as f:
+        return chunks, f.read().split()
+
+
+
+def _all_names():
+    with AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+        return [r.query_name for r in readsfile]
+
+
+
+class PartitionerTests:
+    """ Partitioners plug into the processor's run. """
+
+    def test_custom(self, tmpdir, num_cores):
+        chunks, names = _names(tmpdir, num_cores,
+                               partitioner=StrandPartitioner())
+        assert 4 == len(chunks)
+        assert sorted(_all_names()) == sorted(names)
+
+    def test_custom_with_memory_budget(self, tmpdir):
+        """ A partitioner's estimates drive memory budgeting. """
+        costs = {}
+
+        def cost(chunk, num_reads):
+            costs[chunk] = num_reads
+            return num_reads
+
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(PATH_ALIGNED_FILE, cores=2,
+                                      outfile=outfile,
+                                      partitioner=StrandPartitioner())
+        processor.register_files()
+        processor.run(memory_budget=100, chunk_cost=cost)
+        assert 123 == sum(costs.values())
+        assert 4 == len(costs)
+
+    @pytest.mark.parametrize(argnames="custom_cost", argvalues=[False, True])
+    def test_memory_budget_without_estimates(self, tmpdir, custom_cost):
+        """ Chunks without estimated reads aren't held back, or costed. """
+        costs = {}
+
+        def cost(chunk, num_reads):
+            costs[chunk] = num_reads
+            return num_reads
+
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(PATH_ALIGNED_FILE, cores=2,
+                                      outfile=outfile,
+                                      partitioner=UncountedPartitioner())
+        processor.register_files()
+        chunks = processor.run(memory_budget=100,
+                               chunk_cost=cost if custom_cost else None)
+        assert 4 == len(chunks)
+        assert {} == costs
+        processor.combine(chunks, strict=True)
+        with open(outfile) as f:
+            assert sorted(_all_names()) == sorted(f.read().split())
+
+    def test_interleaved_chromosomes(self, tmpdir):
+        chunks, names = _names(tmpdir, 2, partitioner=ChromosomePartitioner())
+        assert sorted(_all_names()) == sorted(names)
+
+    def test_windows(self, tmpdir, num_cores):
+        chunks, names = _names(tmpdir, num_cores,
+                               partitioner=WindowPartitioner(50))
+        assert 10 == len(chunks)
+        assert _all_names() == names
+
+
+
+class ReadBalancedPartitionerTests:
+    """ Windows are cut to hold about equal numbers of reads. """
+
+    @pytest.mark.parametrize("num_chunks", [1, 4, 8])
+    def test_reads_once(self, tmpdir, num_chunks):
+        chunks, names = _names(
+            tmpdir, 2, partitioner=ReadBalancedPartitioner(num_chunks))
+        assert _all_names() == names
+
+    def test_balance(self, tmpdir):
+        partitioner = ReadBalancedPartitioner(8)
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=2, partitioner=partitioner,
+            outfile=tmpdir.join("n.txt").strpath)
+        processor.register_files()
+        partition = partitioner.partition(processor, processor.readsfile)
+        chunks_by_chrom = Counter(e.chunk.chrom for e in partition)
+        assert chunks_by_chrom["K3_methylated"] > \
+            chunks_by_chrom["K1_unmethylated"]
+        actual = [sum(1 for _ in processor.fetch_chunk(e.chunk))
+                  for e in partition]
+        assert 123 == sum(actual)
+        # Estimates are closer to actual counts than even windows would be.
+        even = [float(123) / len(partition)] * len(partition)
+        error = sum(abs(e.num_reads - a) for e, a in zip(partition, actual))
+        assert error < sum(abs(e - a) for e, a in zip(even, actual))
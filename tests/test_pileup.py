@@ -0,0 +1,113 @@
+""" Tests for pileup processing by windows """
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.filters import ReadFilter
+from pararead.pileup import AlleleCounter, PileupProcessor
+from tests import PATH_ALIGNED_FILE
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+class DepthProcessor(PileupProcessor):
+    """ Depth at each position the chunk owns, from pileup columns. """
+
+    def process_batch(self, chunk, batch):
+        for column in batch:
+            if chunk.contains(column.pos):
+                yield chunk.chrom, column.pos, len(column.bases)
+
+
+def _whole_chromosome_counts(**pileup_kwargs):
+    """ Base counts from a single count_coverage per chromosome. """
+    rows = []
+    with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+        for chrom, size in zip(readsfile.references, readsfile.lengths):
+            counts = readsfile.count_coverage(
+                chrom, 0, size,
+                quality_threshold=PileupProcessor.min_base_quality,
+                **pileup_kwargs)
+            for pos, n in enumerate(zip(*counts)):
+                if any(n):
+                    rows.append([chrom, str(pos)] + [str(x) for x in n])
+    return rows
+
+
+def _whole_chromosome_depths():
+    rows = []
+    with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+        for chrom in readsfile.references:
+            for column in readsfile.pileup(chrom):
+                rows.append([chrom, str(column.reference_pos),
+                             str(column.get_num_aligned())])
+    return rows
+
+
+def _run(processor_type, tmpdir, **kwargs):
+    outfile = tmpdir.join("pileup.tsv").strpath
+    processor = processor_type(PATH_ALIGNED_FILE, outfile=outfile, **kwargs)
+    processor.register_files()
+    good_chunks = processor.run()
+    with open(outfile) as f:
+        return good_chunks, [l.rstrip("\n").split("\t") for l in f]
+
+
+class PileupProcessorTests:
+    """ Windowed pileup matches pileup of whole chromosomes. """
+
+    @pytest.mark.parametrize(argnames="window_size", argvalues=[17, 100, 500])
+    @pytest.mark.parametrize(argnames="batch_size", argvalues=[5, 1000])
+    def test_allele_counts(self, tmpdir, num_cores, window_size, batch_size):
+        """ Each position is counted once, in order, across windows. """
+        good_chunks, rows = _run(AlleleCounter, tmpdir, cores=num_cores,
+                                 window_size=window_size,
+                                 batch_size=batch_size)
+        assert all(c.size <= window_size for c in good_chunks)
+        assert _whole_chromosome_counts() == rows
+
+    @pytest.mark.parametrize(argnames="ordered_output",
+                             argvalues=[True, False])
+    def test_whole_chromosomes(self, tmpdir, num_cores, ordered_output):
+        """ With windows turned off, each chromosome is one chunk. """
+        outfile = tmpdir.join("pileup.tsv").strpath
+        processor = AlleleCounter(PATH_ALIGNED_FILE, cores=num_cores,
+                                  outfile=outfile, window_size=None)
+        processor.register_files()
+        good_chunks = processor.run(ordered_output=ordered_output)
+        assert {"K1_unmethylated", "K3_methylated"} == set(good_chunks)
+        if not ordered_output:
+            processor.combine(good_chunks, strict=True)
+        with open(outfile) as f:
+            rows = [l.rstrip("\n").split("\t") for l in f]
+        assert _whole_chromosome_counts() == rows
+
+    @pytest.mark.parametrize(argnames="halo", argvalues=[0, 10])
+    def test_columns(self, tmpdir, num_cores, halo):
+        """ Columns of each window have all reads covering them. """
+        _, rows = _run(DepthProcessor, tmpdir, cores=num_cores,
+                       window_size=30, batch_size=7, region_halo=halo)
+        assert _whole_chromosome_depths() == rows
+
+    def test_read_filter_counts(self, tmpdir):
+        """ Base counts come from the reads meeting the criteria. """
+        read_filter = ReadFilter(flag_excluded=0x10)
+        _, rows = _run(AlleleCounter, tmpdir, cores=2, window_size=50,
+                       read_filter=read_filter)
+        assert _whole_chromosome_counts(read_callback=read_filter) == rows
+
+    def test_read_filter_columns(self, tmpdir):
+        _, rows = _run(DepthProcessor, tmpdir, cores=2, window_size=50,
+                       read_filter=ReadFilter(flag_required=0x10))
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            expected = sum(c.get_num_aligned() for c in
+                           readsfile.pileup(flag_require=0x10, flag_filter=0))
+        assert expected == sum(int(n) for _, _, n in rows)
+
+    def test_tag_filter_needs_counts(self, tmpdir):
+        with pytest.raises(ValueError):
+            DepthProcessor(PATH_ALIGNED_FILE, cores=1,
+                           outfile=tmpdir.join("depth.tsv").strpath,
+                           read_filter=ReadFilter(tags={"XG": "CT"}))
@@ -0,0 +1,250 @@
+""" Tests for streaming of chunk outputs through pipeline stages """
+
+import gzip
+import os
+import threading
+
+import pytest
+
+from pararead.exceptions import \
+    CommandOrderException, PipelineStageException
+from pararead.pipeline import \
+    ChunkOutput, ConcatenatingWriter, GzipCompressor, \
+    ObjectStoreUploader, OrderedWriter, Pipeline, PipelineStage
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ChromosomeEchoProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+class RecordingStage(PipelineStage):
+    """ Remember the chunks seen and whether the stage was closed. """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def process(self, output):
+        self.chunks.append(output.chunk)
+        return output
+
+    def close(self):
+        self.closed = True
+
+
+def _chunk_outputs(tmpdir, chunks):
+    """ Write a one-line file for each chunk and describe the outputs. """
+    outputs = []
+    for c in chunks:
+        path = tmpdir.join("{}.txt".format(c))
+        path.write("{}\n".format(c))
+        outputs.append(ChunkOutput(c, path.strpath, c))
+    return outputs
+
+
+class PipelineTests:
+    """ Behavior of stages connected by bounded queues. """
+
+    def test_stages_see_each_output_in_order(self, tmpdir):
+        """ Every stage gets every output, and each stage is closed. """
+        first, second = RecordingStage(), RecordingStage()
+        chunks = ["c{}".format(i) for i in range(10)]
+        with Pipeline([first, second]) as pipeline:
+            for output in _chunk_outputs(tmpdir, chunks):
+                pipeline.put(output)
+        assert chunks == first.chunks == second.chunks
+        assert first.closed and second.closed
+
+    def test_null_drops_output(self, tmpdir):
+        """ A stage's null return keeps the output from later stages. """
+        last = RecordingStage()
+        keep_even = lambda o: o if int(o.chunk[1:]) % 2 == 0 else None
+        with Pipeline([keep_even, last]) as pipeline:
+            for output in _chunk_outputs(tmpdir, ["c0", "c1", "c2"]):
+                pipeline.put(output)
+        assert ["c0", "c2"] == last.chunks
+
+    def test_backpressure(self, tmpdir):
+        """ Producer blocks once a stalled stage's queue is full. """
+        release = threading.Event()
+
+        def stall(output):
+            release.wait()
+            return output
+
+        outputs = _chunk_outputs(tmpdir, ["c{}".format(i) for i in range(5)])
+        pipeline = Pipeline([stall], queue_size=1)
+        pipeline.start()
+        num_put = []
+
+        def produce():
+            for output in outputs:
+                pipeline.put(output)
+                num_put.append(output)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        producer.join(0.5)
+        # One output is being held by the stage and one fills the queue.
+        assert producer.is_alive()
+        assert len(num_put) <= 3
+        release.set()
+        producer.join()
+        pipeline.close()
+        assert len(outputs) == len(num_put)
+
+    def test_stage_failure(self, tmpdir):
+        """ A failed stage doesn't hang the producer but is reported. """
+        def fail(output):
+            raise ValueError(output.chunk)
+        pipeline = Pipeline([fail], queue_size=1)
+        pipeline.start()
+        with pytest.raises(PipelineStageException):
+            for output in _chunk_outputs(tmpdir, ["a", "b", "c"]):
+                pipeline.put(output)
+            pipeline.close()
+
+    def test_put_requires_start(self, tmpdir):
+        output, = _chunk_outputs(tmpdir, ["a"])
+        with pytest.raises(CommandOrderException):
+            Pipeline([RecordingStage()]).put(output)
+
+
+class BuiltinStagesTests:
+    """ Tests for the stages provided with the package. """
+
+    def test_concatenating_writer(self, tmpdir):
+        outfile = tmpdir.join("combined.txt").strpath
+        with Pipeline([ConcatenatingWriter(outfile)]) as pipeline:
+            for output in _chunk_outputs(tmpdir, ["b", "a"]):
+                pipeline.put(output)
+        with open(outfile, 'r') as f:
+            assert "b\na\n" == f.read()
+
+    def test_compress_then_upload(self, tmpdir):
+        store = tmpdir.join("store").strpath
+        uploader = ObjectStoreUploader(store, prefix="run1/")
+        with Pipeline([GzipCompressor(), uploader]) as pipeline:
+            for output in _chunk_outputs(tmpdir, ["a", "b"]):
+                pipeline.put(output)
+        assert ["run1/a.txt.gz", "run1/b.txt.gz"] == uploader.uploaded
+        with gzip.open(os.path.join(store, "run1", "a.txt.gz"), 'rt') as f:
+            assert "a\n" == f.read()
+        assert not os.path.exists(tmpdir.join("a.txt").strpath)
+
+
+class RunWithPipelineTests:
+    """ Chunk outputs are streamed through a pipeline during run(). """
+
+    def test_streamed_output(self, tmpdir, num_cores, remove_reads_file):
+        processor = ChromosomeEchoProcessor(
+                PATH_ALIGNED_FILE, cores=num_cores,
+                outfile=tmpdir.join("echo.txt").strpath)
+        processor.register_files()
+        recorder = RecordingStage()
+        streamed = tmpdir.join("streamed.txt").strpath
+        good = processor.run(
+                pipeline=[recorder, ConcatenatingWriter(streamed)])
+        assert set(good) == set(recorder.chunks)
+        with open(streamed, 'r') as f:
+            assert set(good) == set(f.read().split())
+
+
+class OrderedWriterTests:
+    """ Output is written in the given order, whatever the arrival order. """
+
+    CHUNKS = ["c{}".format(i) for i in range(6)]
+
+    @pytest.mark.parametrize(
+            argnames="max_buffer_size", argvalues=[0, 3, 2 ** 20])
+    def test_order_restored(self, tmpdir, max_buffer_size):
+        """ Reordering works whether outputs are held in memory or not. """
+        outputs = _chunk_outputs(tmpdir, self.CHUNKS)
+        outfile = tmpdir.join("ordered.txt").strpath
+        writer = OrderedWriter(outfile, order=self.CHUNKS,
+                               max_buffer_size=max_buffer_size)
+        for i in [3, 1, 5, 0, 4, 2]:
+            writer.process(outputs[i])
+        writer.close()
+        with open(outfile, 'r') as f:
+            assert self.CHUNKS == f.read().split()
+        if max_buffer_size == 0:
+            assert writer.num_spilled > 0
+        elif max_buffer_size > 100:
+            assert 0 == writer.num_spilled
+        assert 0 == writer.buffered_size
+
+    def test_writes_as_soon_as_possible(self, tmpdir):
+        """ Leading chunks are written before later ones arrive. """
+        outputs = _chunk_outputs(tmpdir, self.CHUNKS)
+        outfile = tmpdir.join("ordered.txt").strpath
+        writer = OrderedWriter(outfile, order=self.CHUNKS)
+        writer.process(outputs[1])
+        writer.process(outputs[0])
+        with open(outfile, 'r') as f:
+            assert ["c0", "c1"] == f.read().split()
+        writer.close()
+
+    def test_discarded_chunk_is_skipped(self, tmpdir):
+        outputs = _chunk_outputs(tmpdir, self.CHUNKS)
+        outfile = tmpdir.join("ordered.txt").strpath
+        with Pipeline([OrderedWriter(outfile, order=self.CHUNKS)]) as pipe:
+            for output in reversed(outputs):
+                if output.chunk == "c2":
+                    output = output._replace(result=None)
+                pipe.put(output)
+        with open(outfile, 'r') as f:
+            assert [c for c in self.CHUNKS if c != "c2"] == f.read().split()
+
+    def test_unknown_chunk(self, tmpdir):
+        output, = _chunk_outputs(tmpdir, ["not-a-chunk"])
+        writer = OrderedWriter(tmpdir.join("ordered.txt").strpath,
+                               order=self.CHUNKS)
+        with pytest.raises(ValueError):
+            writer.process(output)
+
+
+class RunOrderedOutputTests:
+    """ With ordered output, run() writes final output in header order. """
+
+    def test_header_order(self, tmpdir, num_cores, remove_reads_file):
+        outfile = tmpdir.join("echo.txt").strpath
+        processor = ChromosomeEchoProcessor(
+                PATH_ALIGNED_FILE, cores=num_cores, outfile=outfile,
+                fail_chunks=["not-a-chunk"])
+        processor.register_files()
+        processor.run(ordered_output=True, reorder_buffer_size=0)
+        with open(outfile, 'r') as f:
+            assert ["K1_unmethylated", "K3_methylated"] == f.read().split()
+
+    @pytest.mark.parametrize(argnames="limit", argvalues=[
+        None, ["K3_methylated"]])
+    def test_chrom_sep(self, tmpdir, num_cores, remove_reads_file, limit):
+        """ Chunks are delimited as they are by combine(). """
+        outputs = []
+        for ordered in [True, False]:
+            outfile = tmpdir.join("echo_{}.txt".format(ordered)).strpath
+            processor = ChromosomeEchoProcessor(
+                    PATH_ALIGNED_FILE, cores=num_cores, outfile=outfile,
+                    limit=limit)
+            processor.register_files()
+            if ordered:
+                processor.run(ordered_output=True, chrom_sep="#\n")
+            else:
+                processor.combine(processor.run(), chrom_sep="#\n")
+            with open(outfile, 'r') as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+        assert ("#" in outputs[0]) == (limit is None)
+
+    def test_failed_chunk_omitted(self, tmpdir, remove_reads_file):
+        outfile = tmpdir.join("echo.txt").strpath
+        processor = ChromosomeEchoProcessor(
+                PATH_ALIGNED_FILE, cores=2, outfile=outfile,
+                fail_chunks=["K1_unmethylated"])
+        processor.register_files()
+        processor.run(ordered_output=True, retry_backoff=0)
+        with open(outfile, 'r') as f:
+            assert ["K3_methylated"] == f.read().split()
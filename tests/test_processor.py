@@ -13,7 +13,8 @@ from pararead.processor import ParaReadProcessor
 from tests import \
     NUM_CORES_DEFAULT, NUM_READS_BY_FILE, \
     PATH_ALIGNED_FILE, PATH_UNALIGNED_FILE
-from tests.helpers import IdentityProcessor, loglines
+from tests.helpers import \
+    ChromosomeEchoProcessor, IdentityProcessor, loglines
 
 
 __author__ = "Vince Reuter"
@@ -319,6 +320,50 @@ class CombinerTests:
             return self.CHROM_NAMES
 
 
+class RunFaultToleranceTests:
+    """ A chunk for which processing fails doesn't sink the others. """
+
+    def test_failed_chunk_is_bad_chunk(
+            self, tmpdir, num_cores, remove_reads_file):
+        """ Processing failure is reported like a null chunk result. """
+        processor = ChromosomeEchoProcessor(
+                PATH_ALIGNED_FILE, cores=num_cores,
+                outfile=tmpdir.join("echo.txt").strpath,
+                fail_chunks=["K1_unmethylated"])
+        processor.register_files()
+        assert ["K3_methylated"] == list(processor.run(retry_backoff=0))
+
+
+class RunSchedulingTests:
+    """ Scheduling of chunks subject to a memory budget. """
+
+    @pytest.mark.parametrize(argnames="budget", argvalues=[1, "64K", 10 ** 9])
+    def test_budget_retains_all_chunks(
+            self, tmpdir, num_cores, budget, remove_reads_file):
+        """ A memory budget affects scheduling but not results. """
+        processor = ChromosomeEchoProcessor(
+                PATH_ALIGNED_FILE, cores=num_cores,
+                outfile=tmpdir.join("echo.txt").strpath)
+        processor.register_files()
+        observed = processor.run(memory_budget=budget)
+        assert {"K1_unmethylated", "K3_methylated"} == set(observed)
+
+    def test_custom_cost_function(self, tmpdir, remove_reads_file):
+        """ User-provided cost function is consulted for each chunk. """
+        processor = ChromosomeEchoProcessor(
+                PATH_ALIGNED_FILE, cores=2,
+                outfile=tmpdir.join("echo.txt").strpath)
+        processor.register_files()
+        costed = {}
+
+        def cost(chunk, num_reads):
+            costed[chunk] = num_reads
+            return num_reads
+
+        processor.run(memory_budget=100, chunk_cost=cost)
+        assert {"K1_unmethylated": 28, "K3_methylated": 95} == costed
+
+
 @pytest.mark.skip("Not implemented")
 class IntegrationTests:
     """ A couple of sample end-to-end tests through a simple processor. """
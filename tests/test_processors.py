@@ -0,0 +1,196 @@
+""" Tests for the ready-made summary processors """
+
+import pytest
+
+from pararead.processor import PARA_READ_FILES
+from pararead.processors import \
+    BinnedCoverage, InsertSizeHistogram, MapqFlagSummary, \
+    ReadCounter, RegionReadCounter, StrandCounter, count_reads
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import PAIRED_FRAGMENTS, PAIRED_READ_LENGTH
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+READS_BY_CHROMOSOME = {"K1_unmethylated": 28, "K3_methylated": 95}
+
+
+def _run(processor_type, tmpdir, path_reads_file=PATH_ALIGNED_FILE,
+         cores=1, **kwargs):
+    """ Run a summary processor and parse its output table. """
+    outfile = tmpdir.join("summary.tsv").strpath
+    processor = processor_type(path_reads_file, cores=cores,
+                               outfile=outfile, **kwargs)
+    processor.register_files()
+    good_chunks = processor.run()
+    processor.combine(good_chunks, strict=True)
+    with open(outfile, 'r') as f:
+        lines = [l.rstrip("\n").split("\t") for l in f]
+    return lines[0], lines[1:]
+
+
+class SummaryProcessorTests:
+    """ Per-chunk tallies are summed into one table. """
+
+    @pytest.mark.parametrize(argnames="use_index", argvalues=[False, True])
+    def test_read_counter(self, tmpdir, num_cores, use_index):
+        """ Reads per chromosome are the same with or without the index. """
+        header, rows = _run(ReadCounter, tmpdir, cores=num_cores,
+                            use_index=use_index)
+        assert ["chrom", "reads"] == header
+        assert READS_BY_CHROMOSOME == {c: int(n) for c, n in rows}
+
+    def test_region_read_counter(self, tmpdir):
+        """ Only chromosomes with regions are processed. """
+        regions = [("K3_methylated", 0, 236), ("K3_methylated", 300, 400)]
+        header, rows = _run(RegionReadCounter, tmpdir, regions=regions)
+        assert ["chrom", "start", "end", "reads"] == header
+        assert [["K3_methylated", "0", "236", "95"],
+                ["K3_methylated", "300", "400", "0"]] == rows
+
+    @pytest.mark.parametrize(argnames=["ownership", "expected"], argvalues=[
+        ("overlap", [27, 68]), ("start", [27, 61]), (None, [27, 79])])
+    def test_region_boundary(self, tmpdir, ownership, expected):
+        """ A read spanning nearby regions is counted per ownership. """
+        regions = [("K3_methylated", 0, 119), ("K3_methylated", 121, 236)]
+        _, rows = _run(RegionReadCounter, tmpdir, regions=regions,
+                       region_ownership=ownership)
+        assert expected == [int(n) for _, _, _, n in rows]
+
+    def test_region_merge(self, tmpdir):
+        """ Overlapping or abutting regions are merged, as elsewhere. """
+        regions = [("K3_methylated", 100, 236), ("K3_methylated", 0, 120),
+                   ("K3_methylated", 236, 300)]
+        _, rows = _run(RegionReadCounter, tmpdir, regions=regions)
+        assert [["K3_methylated", "0", "300", "95"]] == rows
+
+    def test_region_bed(self, tmpdir):
+        bed = tmpdir.join("regions.bed")
+        bed.write("K3_methylated\t0\t236\nK3_methylated\t300\t400\n")
+        _, rows = _run(RegionReadCounter, tmpdir, regions=bed.strpath)
+        assert [["K3_methylated", "0", "236", "95"],
+                ["K3_methylated", "300", "400", "0"]] == rows
+
+    def test_strand_counter(self, tmpdir, num_cores):
+        """ Strand counts partition the reads of each chromosome. """
+        _, rows = _run(StrandCounter, tmpdir, cores=num_cores)
+        observed = {(c, s): int(n) for c, s, n in rows}
+        assert {("K1_unmethylated", "+"): 17, ("K1_unmethylated", "-"): 11,
+                ("K3_methylated", "+"): 23, ("K3_methylated", "-"): 72} \
+            == observed
+
+    def test_mapq_flag_summary(self, tmpdir):
+        """ Each distribution accounts for all reads, summed over chunks. """
+        _, rows = _run(MapqFlagSummary, tmpdir, cores=2)
+        assert [["FLAG", "0", "40"], ["FLAG", "16", "83"],
+                ["MAPQ", "255", "123"]] == rows
+
+    @pytest.mark.parametrize(argnames="bin_size", argvalues=[50, 236, 1000])
+    def test_binned_coverage(self, tmpdir, bin_size):
+        """ Bins span each chromosome, and depth reflects aligned bases. """
+        _, rows = _run(BinnedCoverage, tmpdir, bin_size=bin_size)
+        from pysam import AlignmentFile
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            expected = {}
+            for read in readsfile.fetch():
+                expected[read.reference_name] = \
+                    expected.get(read.reference_name, 0) + \
+                    sum(e - s for s, e in read.get_blocks())
+        observed = {}
+        for chrom, start, end, depth in rows:
+            start, end = int(start), int(end)
+            assert 0 < end - start <= bin_size
+            assert end <= 236
+            assert 4 == len(depth.split(".")[1])
+            observed[chrom] = observed.get(chrom, 0) + \
+                float(depth) * (end - start)
+        assert set(expected) == set(observed)
+        for chrom, bases in expected.items():
+            assert bases == pytest.approx(observed[chrom], abs=0.01 * 236)
+
+    def test_insert_size_histogram(self, tmpdir, paired_reads_file):
+        """ Each properly paired fragment counts once, by its size. """
+        header, rows = _run(InsertSizeHistogram, tmpdir,
+                            path_reads_file=paired_reads_file, cores=2)
+        assert ["insert_size", "fragments"] == header
+        expected = {}
+        for _, _, pos1, _, pos2, proper in PAIRED_FRAGMENTS:
+            if proper:
+                size = abs(pos2 - pos1) + PAIRED_READ_LENGTH
+                expected[size] = expected.get(size, 0) + 1
+        assert expected == {int(s): int(n) for s, n in rows}
+        assert sorted(expected) == [int(s) for s, _ in rows]
+
+    def test_insert_size_maximum(self, tmpdir, paired_reads_file):
+        """ Fragments beyond the maximum size are ignored. """
+        _, rows = _run(InsertSizeHistogram, tmpdir,
+                       path_reads_file=paired_reads_file, max_size=400)
+        assert rows
+        assert all(int(s) <= 400 for s, _ in rows)
+
+
+class CountReadsTests:
+    """ Counting from the index, or by a scan when filtering. """
+
+    def test_index_counts(self):
+        """ Without filters, counts come from the index. """
+        counts = count_reads(PATH_ALIGNED_FILE)
+        assert READS_BY_CHROMOSOME == dict(counts.by_contig)
+        assert ["K1_unmethylated", "K3_methylated"] == \
+            list(counts.by_contig.keys())
+        assert 0 == counts.unplaced
+        assert 123 == counts.total
+
+    def test_index_counts_chromosomes_of_interest(self):
+        """ Restriction to certain contigs doesn't require a scan. """
+        counts = count_reads(PATH_ALIGNED_FILE, chroms=["K3_methylated"])
+        assert {"K3_methylated": 95} == dict(counts.by_contig)
+
+    @pytest.mark.parametrize(
+        argnames=["filters", "expected"],
+        argvalues=[({"flag_excluded": 16},
+                    {"K1_unmethylated": 17, "K3_methylated": 23}),
+                   ({"flag_required": 16},
+                    {"K1_unmethylated": 11, "K3_methylated": 72}),
+                   ({"min_mapq": 255}, READS_BY_CHROMOSOME),
+                   ({"min_mapq": 256},
+                    {"K1_unmethylated": 0, "K3_methylated": 0})])
+    def test_filtered_scan(self, tmpdir, num_cores, filters, expected):
+        """ Flag and mapping quality filters are applied by a scan. """
+        counts = count_reads(PATH_ALIGNED_FILE, cores=num_cores,
+                             temp_folder_parent_path=tmpdir.strpath,
+                             **filters)
+        assert expected == dict(counts.by_contig)
+        assert not tmpdir.listdir()
+
+    def test_region_scan(self, tmpdir):
+        """ Only contigs with regions are counted, within the regions. """
+        counts = count_reads(
+            PATH_ALIGNED_FILE, temp_folder_parent_path=tmpdir.strpath,
+            regions=[("K3_methylated", 0, 236), ("K3_methylated", 300, 400)])
+        assert {"K3_methylated": 95} == dict(counts.by_contig)
+
+    def test_region_scan_boundary(self, tmpdir):
+        """ A read spanning nearby regions is counted once. """
+        counts = count_reads(
+            PATH_ALIGNED_FILE, temp_folder_parent_path=tmpdir.strpath,
+            regions=[("K3_methylated", 0, 119), ("K3_methylated", 121, 236)])
+        assert {"K3_methylated": 95} == dict(counts.by_contig)
+
+    def test_scan_keeps_registered_file(self, tmpdir):
+        """ A scan doesn't replace a reads file registered by a caller. """
+        PARA_READ_FILES["readsfile"] = "registered"
+        try:
+            count_reads(PATH_ALIGNED_FILE, min_mapq=1,
+                        temp_folder_parent_path=tmpdir.strpath)
+            assert {"readsfile": "registered"} == PARA_READ_FILES
+        finally:
+            PARA_READ_FILES.clear()
+
+    def test_index_and_filter_conflict(self, tmpdir):
+        """ Index statistics can't answer a filtered count. """
+        with pytest.raises(ValueError):
+            ReadCounter(PATH_ALIGNED_FILE, cores=1, use_index=True,
+                        min_mapq=30, outfile=tmpdir.join("n.txt").strpath)
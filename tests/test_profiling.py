@@ -0,0 +1,90 @@
+""" Tests for profiling of chunks' processing """
+
+import cProfile
+import os
+import pstats
+
+from pararead.profiling import merge_profiles, write_time, PHASES
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadStartProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+
+def _read_phases(path):
+    """ Read a table of phase timings, as header and rows. """
+    with open(path) as f:
+        lines = [l.rstrip("\n").split("\t") for l in f]
+    return lines[0], lines[1:]
+
+
+
+class ProfilingTests:
+    """ Chunks' profiles and phase timings are merged for the run. """
+
+    def test_profile(self, tmpdir, num_cores):
+        profile = tmpdir.join("run.prof").strpath
+        processor = ReadStartProcessor(
+                PATH_ALIGNED_FILE, cores=num_cores,
+                outfile=tmpdir.join("starts.txt").strpath)
+        processor.register_files()
+        chunks = processor.run(profile=profile)
+        stats = pstats.Stats(profile)
+        assert any(name == "__call__" and path.endswith("helpers.py")
+                   for path, _, name in stats.stats)
+        header, rows = _read_phases(profile + ".phases.tsv")
+        assert ["chunk"] + list(PHASES) + ["total"] == header
+        assert sorted(str(c) for c in chunks) == sorted(r[0] for r in rows)
+        for row in rows:
+            fetch, compute, write, total = [float(t) for t in row[1:]]
+            assert fetch > 0
+            assert abs(fetch + compute + write - total) < 1e-5
+
+    def test_no_profile(self, tmpdir):
+        processor = ReadStartProcessor(
+                PATH_ALIGNED_FILE, cores=1,
+                outfile=tmpdir.join("starts.txt").strpath)
+        processor.register_files()
+        processor.run()
+        assert "fetch_chunk" not in vars(processor)
+        assert not [f for f in os.listdir(processor.temp_folder)
+                    if f.endswith(".prof")]
+
+    def test_fetch_restored(self, tmpdir):
+        processor = ReadStartProcessor(
+                PATH_ALIGNED_FILE, cores=1,
+                outfile=tmpdir.join("starts.txt").strpath)
+        processor.register_files()
+        processor.run(profile=tmpdir.join("run.prof").strpath)
+        assert "fetch_chunk" not in vars(processor)
+
+    def test_write_time(self, tmpdir):
+        path = tmpdir.join("x.txt").strpath
+        profiler = cProfile.Profile()
+
+        def write():
+            with open(path, 'w') as f:
+                for i in range(1000):
+                    f.write("{}\n".format(i))
+
+        profiler.runcall(write)
+        assert write_time(pstats.Stats(profiler)) > 0
+
+    def test_merge(self, tmpdir):
+        paths = []
+        for i in range(2):
+            profiler = cProfile.Profile()
+            profiler.runcall(sum, range(10))
+            paths.append(tmpdir.join("{}.prof".format(i)).strpath)
+            profiler.dump_stats(paths[-1])
+        outpath = tmpdir.join("all.prof").strpath
+        stats = merge_profiles(
+                paths + [tmpdir.join("missing.prof").strpath], outpath)
+        calls = [timing[1] for (_, _, name), timing in stats.stats.items()
+                 if "sum" in name]
+        assert [2] == calls
+        assert os.path.isfile(outpath)
+        assert merge_profiles([], outpath) is None
@@ -0,0 +1,102 @@
+""" Tests for binary records as chunks' intermediate output """
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.exceptions import RecordFormatException
+from pararead.records import concatenate_records, read_records, write_records
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadStartProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+MIXED_RECORDS = [("chr1", 10, 0.5, True, b"\x00\xff"),
+                 (u"été", -2 ** 40, -1.25, False, b""),
+                 ("", 0, 0.0, True, b"x" * 300)]
+FIXED_RECORDS = [(i, i * 0.5, i % 2 == 0) for i in range(10000)]
+
+
+
+class RecordsTests:
+    """ Records are read back as written. """
+
+    @pytest.mark.parametrize(argnames=["field_types", "records"], argvalues=[
+        ((str, int, float, bool, bytes), MIXED_RECORDS),
+        ((int, float, bool), FIXED_RECORDS),
+        ((int, ), [])])
+    def test_round_trip(self, tmpdir, field_types, records):
+        path = write_records(tmpdir.join("x.rec").strpath, field_types,
+                             records)
+        assert records == list(read_records(path))
+
+    def test_concatenate(self, tmpdir):
+        paths = [write_records(tmpdir.join("{}.rec".format(i)).strpath,
+                               (int, float, bool), FIXED_RECORDS[i::3])
+                 for i in range(3)]
+        path = concatenate_records(paths, tmpdir.join("all.rec").strpath)
+        expected = FIXED_RECORDS[0::3] + FIXED_RECORDS[1::3] + \
+            FIXED_RECORDS[2::3]
+        assert expected == list(read_records(path))
+
+    def test_concatenate_mismatch(self, tmpdir):
+        paths = [
+            write_records(tmpdir.join("a.rec").strpath, (int, ), [(1, )]),
+            write_records(tmpdir.join("b.rec").strpath, (str, ), [("1", )])]
+        with pytest.raises(RecordFormatException):
+            concatenate_records(paths, tmpdir.join("all.rec").strpath)
+
+    @pytest.mark.parametrize(argnames="field_types",
+                             argvalues=[(int, float), (str, int)])
+    def test_truncated(self, tmpdir, field_types):
+        path = tmpdir.join("x.rec").strpath
+        write_records(path, field_types, [(1, 2)] if str not in field_types
+                      else [("one", 2)])
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-3])
+        with pytest.raises(RecordFormatException):
+            list(read_records(path))
+
+    def test_not_records(self, tmpdir):
+        path = tmpdir.join("x.txt")
+        path.write("chr1\t10\n")
+        with pytest.raises(RecordFormatException):
+            list(read_records(path.strpath))
+
+    def test_unsupported_type(self, tmpdir):
+        with pytest.raises(ValueError):
+            write_records(tmpdir.join("x.rec").strpath, (list, ), [])
+
+
+
+class ProcessorRecordsTests:
+    """ Chunks' binary output is read back, and formatted only at the end. """
+
+    def test_combine_formats_text(self, tmpdir, num_cores):
+        outfile = tmpdir.join("starts.txt").strpath
+        processor = ReadStartProcessor(PATH_ALIGNED_FILE, cores=num_cores,
+                                       outfile=outfile)
+        processor.register_files()
+        chunks = processor.run()
+        records = [r for _, rs in processor.chunk_records(chunks, strict=True)
+                   for r in rs]
+        processor.combine(chunks, strict=True)
+        with AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+            expected = [(r.query_name, r.reference_start, r.mapping_quality)
+                        for r in readsfile]
+        assert sorted(expected) == sorted(records)
+        with open(outfile) as f:
+            lines = f.read().splitlines()
+        assert sorted("\t".join(str(v) for v in r) for r in expected) == \
+            sorted(lines)
+
+    def test_ordered_output(self, tmpdir):
+        processor = ReadStartProcessor(PATH_ALIGNED_FILE, cores=1,
+                                       outfile=tmpdir.join("x.txt").strpath)
+        processor.register_files()
+        with pytest.raises(ValueError):
+            processor.run(ordered_output=True)
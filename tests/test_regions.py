@@ -0,0 +1,225 @@
+""" Tests for restriction of processing to genomic regions """
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead.exceptions import IllegalChunkException
+from pararead.regions import \
+    Interval, RegionChunk, fetch_regions, make_region_chunks, \
+    merge_intervals, parse_regions, read_bed
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadNameProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+PANEL = [("K3_methylated", 100, 130), ("K1_unmethylated", 0, 20),
+         ("K3_methylated", 120, 150), ("K3_methylated", 200, 220),
+         ("K1_unmethylated", 150, 160), ("K1_unmethylated", 190, 200)]
+
+
+def _overlapping_reads(regions):
+    """ Names of reads overlapping any of the regions, by brute force. """
+    with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+        return {r.query_name for r in readsfile.fetch()
+                if any(c == r.reference_name and r.reference_start < e and
+                       r.reference_end > s for c, s, e in regions)}
+
+
+class IntervalsTests:
+    """ Parsing, merging, and grouping of intervals. """
+
+    def test_read_bed(self, tmpdir):
+        """ Header lines are skipped and extra columns ignored. """
+        bed = tmpdir.join("panel.bed")
+        bed.write("track name=panel\n# comment\n"
+                  "chr1\t10\t20\tgeneA\t0\t+\n\nchr2\t5\t6\n")
+        assert [Interval("chr1", 10, 20), Interval("chr2", 5, 6)] == \
+            read_bed(bed.strpath)
+        assert read_bed(bed.strpath) == parse_regions(bed.strpath)
+
+    def test_read_bed_invalid_line(self, tmpdir):
+        bed = tmpdir.join("bad.bed")
+        bed.write("chr1\t10\n")
+        with pytest.raises(ValueError):
+            read_bed(bed.strpath)
+
+    def test_merge(self):
+        """ Overlapping and abutting intervals merge, in header order. """
+        merged = merge_intervals(
+            PANEL + [("K1_unmethylated", 20, 25), ("chrUn", 0, 10)],
+            chrom_order=["K1_unmethylated", "K3_methylated"])
+        assert [Interval("K1_unmethylated", 0, 25),
+                Interval("K1_unmethylated", 150, 160),
+                Interval("K1_unmethylated", 190, 200),
+                Interval("K3_methylated", 100, 150),
+                Interval("K3_methylated", 200, 220)] == merged
+
+    @pytest.mark.parametrize(argnames="num_chunks", argvalues=[1, 2, 3, 7])
+    def test_chunks_cover_intervals(self, num_chunks):
+        """ Chunks stay within a chromosome and cover each base once. """
+        chroms = ["K1_unmethylated", "K3_methylated"]
+        intervals = merge_intervals(PANEL, chrom_order=chroms)
+        chunks = make_region_chunks(intervals, num_chunks)
+        covered = [(c.chrom, s, e) for c in chunks for s, e in c.intervals]
+        assert sum(e - s for _, s, e in covered) == \
+            sum(i.end - i.start for i in intervals)
+        assert covered == sorted(
+            covered, key=lambda i: (chroms.index(i[0]), i[1]))
+        assert len(chunks) >= min(num_chunks, len(intervals))
+        assert len(set(str(c) for c in chunks)) == len(chunks)
+
+    def test_large_interval_split(self):
+        """ An interval larger than the target size is split. """
+        chunks = make_region_chunks([Interval("chr1", 0, 100)], 4)
+        assert [((0, 25), ), ((25, 50), ), ((50, 75), ), ((75, 100), )] == \
+            [c.intervals for c in chunks]
+        assert [None, 25, 50, 75] == [c.preceding_end for c in chunks]
+
+
+class FetchRegionsTests:
+    """ Reads of a chunk come from its intervals alone. """
+
+    def test_deduplicated_reads_counted_once(self):
+        """ Across chunks, each overlapping read is fetched exactly once. """
+        regions = [("K3_methylated", 0, 118), ("K3_methylated", 118, 236)]
+        chunks = make_region_chunks(
+            merge_intervals(regions), 8, ownership="overlap")
+        assert len(chunks) > 1
+        names = []
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            for chunk in chunks:
+                names.extend(r.query_name
+                             for r in fetch_regions(readsfile, chunk))
+        assert 95 == len(names) == len(set(names))
+
+    def test_without_deduplication(self):
+        """ A read spanning intervals is fetched for each of them. """
+        chunk = RegionChunk("K3_methylated", ((0, 50), (60, 100)))
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            names = [r.query_name for r in fetch_regions(readsfile, chunk)]
+            unique = [r.query_name for r in fetch_regions(
+                readsfile, chunk._replace(ownership="overlap"))]
+        assert len(names) > len(unique) == len(set(names))
+
+
+class RunRegionsTests:
+    """ Processing restricted to regions of interest. """
+
+    @pytest.mark.parametrize(argnames="from_bed", argvalues=[False, True])
+    def test_only_region_reads(self, tmpdir, num_cores, from_bed):
+        """ Reads processed are exactly those overlapping the regions. """
+        regions = PANEL
+        if from_bed:
+            bed = tmpdir.join("panel.bed")
+            bed.write("".join("{}\t{}\t{}\n".format(*r) for r in PANEL))
+            regions = bed.strpath
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=num_cores, outfile=outfile,
+            regions=regions)
+        processor.register_files()
+        good_chunks = processor.run()
+        assert all(isinstance(c, RegionChunk) for c in good_chunks)
+        processor.combine(good_chunks, strict=True)
+        with open(outfile) as f:
+            names = f.read().split()
+        assert len(names) == len(set(names))
+        assert _overlapping_reads(PANEL) == set(names)
+
+    def test_limit_applies_to_regions(self, tmpdir):
+        """ Regions on chromosomes outside the limit are ignored. """
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=2, regions=PANEL,
+            outfile=tmpdir.join("names.txt").strpath,
+            limit=["K1_unmethylated"])
+        processor.register_files()
+        good_chunks = processor.run()
+        assert {"K1_unmethylated"} == {c.chrom for c in good_chunks}
+        processor.combine(good_chunks)
+        with pytest.raises(IllegalChunkException):
+            processor.combine(
+                [RegionChunk("K3_methylated", ((0, 10), ))])
+
+    def test_ordered_output(self, tmpdir):
+        """ Region chunks' output is written in genomic order. """
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=2, outfile=outfile, regions=PANEL)
+        processor.register_files()
+        processor.run(ordered_output=True, memory_budget="1G")
+        with open(outfile) as f:
+            names = f.read().split()
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            expected = [r.query_name for r in readsfile.fetch()
+                        if r.query_name in _overlapping_reads(PANEL)]
+        assert expected == names
+
+
+class OwnershipTests:
+    """ Each read belongs to exactly one chunk when contigs are windowed. """
+
+    @pytest.mark.parametrize(argnames="ownership",
+                             argvalues=["overlap", "start"])
+    @pytest.mark.parametrize(argnames="window_size", argvalues=[7, 30, 100])
+    def test_windows_fetch_each_read_once(self, tmpdir, ownership,
+                                          window_size):
+        """ Reads from windows tiling the contigs are all reads, once. """
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=2, outfile=outfile,
+            window_size=window_size, region_ownership=ownership)
+        processor.register_files()
+        good_chunks = processor.run()
+        assert all(c.size <= window_size for c in good_chunks)
+        processor.combine(good_chunks, strict=True)
+        with open(outfile) as f:
+            names = f.read().split()
+        assert 123 == len(names) == len(set(names))
+
+    def test_windows_without_ownership_double_count(self, tmpdir):
+        """ Without a rule, reads overlapping a window edge repeat. """
+        outfile = tmpdir.join("names.txt").strpath
+        processor = ReadNameProcessor(
+            PATH_ALIGNED_FILE, cores=1, outfile=outfile, window_size=30,
+            region_ownership=None)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            names = f.read().split()
+        assert len(names) > len(set(names)) == 123
+
+    @pytest.mark.parametrize(argnames="ownership",
+                             argvalues=["overlap", "start"])
+    def test_owns_matches_fetch(self, ownership):
+        """ A chunk owns exactly the reads it fetches without a halo. """
+        chunks = make_region_chunks(
+            merge_intervals(PANEL), chunk_size=15, ownership=ownership)
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            for chunk in chunks:
+                fetched = {r.query_name
+                           for r in fetch_regions(readsfile, chunk)}
+                owned = {r.query_name
+                         for r in fetch_regions(readsfile, chunk, halo=50)
+                         if chunk.owns(r)}
+                assert fetched == owned
+
+    def test_halo_adds_context(self):
+        """ A halo brings in reads near but not overlapping the chunk. """
+        chunk = RegionChunk("K1_unmethylated", [(150, 160)],
+                            ownership="start")
+        with AlignmentFile(PATH_ALIGNED_FILE, 'rb') as readsfile:
+            own = [r.query_name for r in fetch_regions(readsfile, chunk)]
+            context = [r for r in fetch_regions(readsfile, chunk, halo=60)]
+        names = [r.query_name for r in context]
+        assert len(names) == len(set(names))
+        assert set(own) < set(names)
+        assert set(own) == {r.query_name for r in context if chunk.owns(r)}
+        assert _overlapping_reads([("K1_unmethylated", 90, 220)]) == \
+            set(names)
+
+    def test_unknown_ownership_rule(self):
+        with pytest.raises(ValueError):
+            RegionChunk("K1_unmethylated", [(0, 10)], ownership="middle")
@@ -0,0 +1,216 @@
+""" Tests for read-only data shared with workers, and the interval index """
+
+import array
+import os
+import pickle
+import random
+
+import pytest
+from pysam import AlignmentFile
+
+from pararead import ParaReadProcessor
+from pararead.exceptions import CommandOrderException
+from pararead.processors import FeatureReadCounter
+from pararead.shared import \
+    IntervalIndex, SharedArray, SharedIntervals, SharedPositions, share
+from tests import PATH_ALIGNED_FILE
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+MASK = [("K1_unmethylated", 10, 40), ("K1_unmethylated", 35, 60),
+        ("K3_methylated", 100, 120), ("K3_methylated", 200, 210)]
+
+
+
+class MaskedReadCounter(ParaReadProcessor):
+    """ Count reads of each chromosome that overlap the shared mask. """
+
+    def __call__(self, chunk):
+        mask = self.shared("mask")
+        count = sum(1 for r in self.fetch_chunk(chunk) if mask.overlaps(
+            r.reference_name, r.reference_start, r.reference_end))
+        with open(self._tempf(chunk), 'w') as f:
+            f.write("{}\t{}\n".format(chunk, count))
+        return chunk
+
+
+
+def _naive_overlaps(intervals, chrom, start, end):
+    return any(c == chrom and s < end and start < e for c, s, e in intervals)
+
+
+
+class SharedDataTests:
+    """ Shared data behave like the data stored, in any process. """
+
+    def test_array(self, tmpdir):
+        values = array.array("d", [0.5 * i for i in range(100)])
+        shared = SharedArray.create(values, folder=tmpdir.strpath)
+        assert 100 == len(shared)
+        assert list(values) == list(shared)
+        assert list(values[10:20]) == list(shared[10:20])
+        copied = pickle.loads(pickle.dumps(shared))
+        assert list(values) == list(copied)
+        shared.remove()
+        assert not os.path.exists(shared.path)
+
+    def test_empty_array(self, tmpdir):
+        shared = SharedArray.create([], typecode="q", folder=tmpdir.strpath)
+        assert [] == list(shared)
+
+    def test_numpy(self, tmpdir):
+        numpy = pytest.importorskip("numpy")
+        values = numpy.arange(50, dtype=numpy.int32)
+        shared = share(values, folder=tmpdir.strpath)
+        assert (values == shared.as_numpy()).all()
+
+    def test_intervals(self, tmpdir):
+        rng = random.Random(3)
+        intervals = [("chr{}".format(rng.randint(1, 3)), s,
+                      s + rng.randint(1, 50))
+                     for s in (rng.randint(0, 1000) for _ in range(100))]
+        shared = pickle.loads(pickle.dumps(
+            SharedIntervals.create(intervals, folder=tmpdir.strpath)))
+        for _ in range(500):
+            chrom = "chr{}".format(rng.randint(1, 4))
+            start = rng.randint(0, 1100)
+            end = start + rng.randint(1, 30)
+            assert _naive_overlaps(intervals, chrom, start, end) == \
+                shared.overlaps(chrom, start, end)
+            assert _naive_overlaps(intervals, chrom, start, start + 1) == \
+                shared.contains(chrom, start)
+            assert all(s < end and start < e for s, e in
+                       shared.overlapping(chrom, start, end))
+
+    def test_positions(self, tmpdir):
+        positions = {"chr1": [5, 1, 9, 5], "chr2": [100]}
+        shared = share(positions, folder=tmpdir.strpath)
+        assert isinstance(shared, SharedPositions)
+        assert 4 == len(shared)
+        assert shared.contains("chr1", 5) and shared.contains("chr2", 100)
+        assert not shared.contains("chr1", 100)
+        assert not shared.contains("chr3", 5)
+        assert [5, 9] == list(shared.within("chr1", 2, 10))
+
+
+
+class ProcessorSharedDataTests:
+    """ Data registered with a processor reach its workers. """
+
+    def test_workers_use_shared_data(self, tmpdir, num_cores):
+        outfile = tmpdir.join("counts.txt").strpath
+        processor = MaskedReadCounter(PATH_ALIGNED_FILE, cores=num_cores,
+                                      outfile=outfile)
+        processor.register_files(shared_data={"mask": MASK})
+        mask = processor.shared("mask")
+        assert os.path.dirname(mask.arrays["starts"].path) == \
+            processor.temp_folder
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            observed = {c: int(n) for c, n in
+                        (l.split("\t") for l in f.read().splitlines())}
+        with AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+            expected = {c: sum(1 for r in readsfile.fetch(c)
+                               if _naive_overlaps(MASK, c, r.reference_start,
+                                                  r.reference_end))
+                        for c in readsfile.references}
+        assert expected == observed
+
+    def test_unregistered(self, tmpdir):
+        processor = MaskedReadCounter(PATH_ALIGNED_FILE, cores=1,
+                                      outfile=tmpdir.join("x.txt").strpath)
+        with pytest.raises(CommandOrderException):
+            processor.shared("mask")
+
+
+
+def _naive_overlapping(features, chrom, start, end):
+    return [i for i, (c, s, e, _) in enumerate(features)
+            if c == chrom and s < end and start < e]
+
+
+
+@pytest.fixture(scope="module")
+def features():
+    """ Random features, some overlapping, some sharing a name. """
+    rng = random.Random(11)
+    features = []
+    for i in range(300):
+        start = rng.randint(0, 5000)
+        # A few long features, as genes spanning others would be.
+        size = rng.randint(1000, 3000) if i % 50 == 0 \
+            else rng.randint(1, 100)
+        features.append(("chr{}".format(rng.randint(1, 2)), start,
+                         start + size, "gene{}".format(i % 120)))
+    return features
+
+
+
+class IntervalIndexTests:
+    """ Lookups of overlapping features match naive scans. """
+
+    def test_batch(self, features, tmpdir):
+        index = pickle.loads(pickle.dumps(
+            IntervalIndex.create(features, folder=tmpdir.strpath)))
+        rng = random.Random(5)
+        for chrom in ["chr1", "chr2", "chr3"]:
+            starts = [rng.randint(0, 6000) for _ in range(200)]
+            ends = [s + rng.randint(1, 150) for s in starts]
+            found = index.overlapping_batch(chrom, starts, ends)
+            for start, end, ids in zip(starts, ends, found):
+                assert _naive_overlapping(features, chrom, start, end) == \
+                    sorted(ids)
+            assert [len(ids) for ids in found] == \
+                list(index.count_batch(chrom, starts, ends))
+
+    def test_names(self, features, tmpdir):
+        index = IntervalIndex.create(features, folder=tmpdir.strpath)
+        assert [f[3] for f in features] == \
+            [index.name(i) for i in range(len(features))]
+        unnamed = IntervalIndex.create([f[:3] for f in features],
+                                       folder=tmpdir.strpath)
+        assert unnamed.name(0) is None
+        assert [7] == [i for i in unnamed.overlapping(*features[7][:3])
+                       if i == 7]
+
+    def test_reads(self, tmpdir):
+        features = [(c, s, e, "f{}".format(i)) for i, (c, s, e) in
+                    enumerate(MASK + [("K3_methylated", 0, 236)])]
+        index = IntervalIndex.create(features, folder=tmpdir.strpath)
+        with AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+            reads = list(readsfile)
+        for read, ids in zip(reads, index.overlapping_reads(reads)):
+            assert _naive_overlapping(
+                features, read.reference_name, read.reference_start,
+                read.reference_end) == sorted(ids)
+
+
+
+class FeatureReadCounterTests:
+    """ Reads are counted per feature, across workers. """
+
+    def test_counts(self, tmpdir, num_cores):
+        features = [(c, s, e, "mask") for c, s, e in MASK] + \
+            [("K3_methylated", 0, 50, "start"),
+             ("K3_methylated", 150, 236, "end")]
+        outfile = tmpdir.join("counts.txt").strpath
+        processor = FeatureReadCounter(
+            PATH_ALIGNED_FILE, cores=num_cores, outfile=outfile,
+            features=features, batch_size=7)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        with open(outfile) as f:
+            rows = [l.split("\t") for l in f.read().splitlines()[1:]]
+        with AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+            reads = list(readsfile)
+        expected = {}
+        for name in ("mask", "start", "end"):
+            named = [f for f in features if f[3] == name]
+            expected[name] = sum(
+                1 for r in reads if _naive_overlapping(
+                    named, r.reference_name, r.reference_start,
+                    r.reference_end))
+        assert expected == {name: int(n) for name, n in rows}
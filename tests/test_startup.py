@@ -0,0 +1,62 @@
+""" Tests for the cost of importing the package """
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+# Modules that importing the package mustn't import, as they're costly.
+DEFERRED_MODULES = ["pysam", "multiprocessing", "argparse"]
+# Generous limit on seconds for a fresh interpreter to import the package;
+# this is well above the actual cost, to catch only gross regressions.
+IMPORT_TIME_BUDGET = 0.5
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+
+def _run_fresh(code):
+    """ Run code in a fresh interpreter, returning its standard output. """
+    env = dict(os.environ, PYTHONPATH=PACKAGE_PARENT)
+    return subprocess.check_output([sys.executable, "-c", code], env=env,
+                                   universal_newlines=True)
+
+
+
+class StartupTests:
+    """ Importing the package is quick, deferring costly imports. """
+
+    @pytest.mark.parametrize(argnames="module", argvalues=DEFERRED_MODULES)
+    def test_deferred(self, module):
+        code = "import sys, pararead; print('{0}' in sys.modules)".format(
+            module)
+        assert "False" == _run_fresh(code).strip()
+
+    @pytest.mark.parametrize(argnames="module", argvalues=[
+        "pararead.groups", "pararead.mates", "pararead.pileup",
+        "pararead.processors"])
+    def test_deferred_pysam(self, module):
+        """ Modules of ready-made processors don't import pysam either. """
+        code = "import sys, {}; print('pysam' in sys.modules)".format(module)
+        assert "False" == _run_fresh(code).strip()
+
+    def test_budget(self):
+        code = "import time; start = time.time(); import pararead; " \
+               "print(time.time() - start)"
+        elapsed = min(float(_run_fresh(code)) for _ in range(3))
+        assert elapsed < IMPORT_TIME_BUDGET
+
+    def test_reads_file_maker(self, tmpdir):
+        """ Registering files imports pysam when it's needed. """
+        code = "from pararead.processors import ReadCounter; " \
+               "from tests import PATH_ALIGNED_FILE; " \
+               "p = ReadCounter(PATH_ALIGNED_FILE, cores=1, " \
+               "outfile='{}'); " \
+               "p.register_files(); print(type(p.readsfile).__name__)".\
+            format(tmpdir.join("counts.txt").strpath)
+        assert "AlignmentFile" == _run_fresh(code).strip()
@@ -0,0 +1,159 @@
+""" Tests for compressed output indexed for tabix """
+
+import gzip
+import io
+import os
+import random
+
+import pysam
+import pytest
+
+from pararead.bgzf import BgzfWriter
+from pararead.tabix import \
+    compress_and_index, concatenate_indexed, TABIX_PRESETS
+from tests import PATH_ALIGNED_FILE
+from tests.helpers import ReadIntervalProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+BED = TABIX_PRESETS["bed"]
+
+
+
+def _fetch(path, index_path, chrom, start, end):
+    tbx = pysam.TabixFile(path, index=index_path)
+    try:
+        return [tuple(line.split("\t")[:3])
+                for line in tbx.fetch(chrom, start, end)]
+    finally:
+        tbx.close()
+
+
+
+def _overlapping(intervals, chrom, start, end):
+    return [(c, str(s), str(e)) for c, s, e in intervals
+            if c == chrom and s < end and start < e]
+
+
+
+def _write_parts(folder, intervals_by_part):
+    """ Compress each part's BED lines, returning paths to part and entries """
+    parts = []
+    for i, intervals in enumerate(intervals_by_part):
+        path = os.path.join(folder, "part{}.bed".format(i))
+        with open(path, 'w') as f:
+            f.writelines("{}\t{}\t{}\n".format(*iv) for iv in intervals)
+        compress_and_index(path, path + ".bgz", BED, path + ".idx")
+        parts.append((path + ".bgz", path + ".idx"))
+    return parts
+
+
+
+class BgzfWriterTests:
+    """ Written blocks decompress to the data, with tracked offsets. """
+
+    def test_round_trip(self):
+        rng = random.Random(3)
+        data = bytes(bytearray(rng.getrandbits(8) for _ in range(100000))) + \
+            b"ACGT" * 50000
+        handle = io.BytesIO()
+        writer = BgzfWriter(handle)
+        writer.write(data[:70000])
+        offset = writer.tell()
+        writer.write(data[70000:])
+        writer.close()
+        assert data == gzip.decompress(handle.getvalue())
+        # The block in which the 70000th byte falls, and within it.
+        assert 70000 - 0xFF00 == offset & 0xFFFF
+
+
+
+class TabixIndexTests:
+    """ Indices of joined parts find the lines that tabix should. """
+
+    @pytest.mark.parametrize(argnames="index_type", argvalues=["tbi", "csi"])
+    def test_queries(self, tmpdir, index_type):
+        rng = random.Random(5)
+        sizes = [("chr1", 2000000), ("chr2", 300000), ("chr3", 5000)]
+        intervals_by_part = []
+        for chrom, size in sizes:
+            starts = sorted(rng.randint(0, size) for _ in range(5000))
+            intervals = [(chrom, s, s + rng.randint(1, 3000))
+                         for s in starts]
+            # Split a chromosome between parts, as windows would.
+            intervals_by_part.extend([intervals[:2000], intervals[2000:]])
+        parts = _write_parts(tmpdir.strpath, intervals_by_part)
+        outpath = tmpdir.join("all.bed.gz").strpath
+        index_path = concatenate_indexed(parts, outpath, BED, index_type)
+        assert outpath + "." + index_type == index_path
+        intervals = [iv for ivs in intervals_by_part for iv in ivs]
+        for _ in range(200):
+            chrom, size = rng.choice(sizes)
+            start = rng.randint(0, size)
+            end = start + rng.randint(1, 20000)
+            assert _overlapping(intervals, chrom, start, end) == \
+                _fetch(outpath, index_path, chrom, start, end)
+
+    def test_large_positions(self, tmpdir):
+        intervals = [("chr1", 10, 20), ("chr1", 2 ** 29 + 5, 2 ** 29 + 50),
+                     ("chr1", 2 ** 31, 2 ** 31 + 1)]
+        parts = _write_parts(tmpdir.strpath, [intervals])
+        outpath = tmpdir.join("all.bed.gz").strpath
+        with pytest.raises(ValueError):
+            concatenate_indexed(parts, outpath, BED, "tbi")
+        index_path = concatenate_indexed(parts, outpath, BED, "csi")
+        assert _overlapping(intervals, "chr1", 2 ** 29, 2 ** 31 + 5) == \
+            _fetch(outpath, index_path, "chr1", 2 ** 29, 2 ** 31 + 5)
+
+    @pytest.mark.parametrize(argnames="intervals_by_part", argvalues=[
+        [[("chr1", 50, 60)], [("chr1", 10, 20)]],
+        [[("chr1", 10, 20)], [("chr2", 10, 20)], [("chr1", 30, 40)]]])
+    def test_unsorted(self, tmpdir, intervals_by_part):
+        parts = _write_parts(tmpdir.strpath, intervals_by_part)
+        with pytest.raises(ValueError):
+            concatenate_indexed(parts, tmpdir.join("all.bed.gz").strpath, BED)
+
+
+
+class ProcessorTabixTests:
+    """ Processors write compressed, indexed final output. """
+
+    @pytest.mark.parametrize(argnames="chunking", argvalues=[
+        {}, {"window_size": 50, "region_ownership": "start"}])
+    @pytest.mark.parametrize(argnames="index_type", argvalues=["tbi", "csi"])
+    def test_indexed_output(self, tmpdir, num_cores, chunking, index_type):
+        outfile = tmpdir.join("reads.bed.gz").strpath
+        processor = ReadIntervalProcessor(
+            PATH_ALIGNED_FILE, cores=num_cores, outfile=outfile,
+            tabix="bed", index_type=index_type, **chunking)
+        processor.register_files()
+        processor.combine(processor.run(interleave_chunk_sizes=True),
+                          strict=True)
+        with pysam.AlignmentFile(PATH_ALIGNED_FILE) as readsfile:
+            intervals = [(r.reference_name, r.reference_start,
+                          r.reference_end) for r in readsfile]
+        with gzip.open(outfile, 'rt') as f:
+            assert [(c, str(s), str(e)) for c, s, e in intervals] == \
+                [tuple(l.split("\t")[:3]) for l in f.read().splitlines()]
+        index_path = outfile + "." + index_type
+        for chrom, start, end in [("K1_unmethylated", 0, 236),
+                                  ("K3_methylated", 40, 120),
+                                  ("K3_methylated", 200, 201)]:
+            assert _overlapping(intervals, chrom, start, end) == \
+                _fetch(outfile, index_path, chrom, start, end)
+
+    def test_unknown_preset(self, tmpdir):
+        with pytest.raises(ValueError):
+            ReadIntervalProcessor(PATH_ALIGNED_FILE, cores=1, tabix="bam",
+                                  outfile=tmpdir.join("x.gz").strpath)
+
+    def test_ordered_output(self, tmpdir):
+        processor = ReadIntervalProcessor(
+            PATH_ALIGNED_FILE, cores=1, tabix="bed",
+            outfile=tmpdir.join("x.gz").strpath)
+        processor.register_files()
+        with pytest.raises(ValueError):
+            processor.run(ordered_output=True)
@@ -0,0 +1,216 @@
+""" Tests for automatic choice of the number of cores and of chunks """
+
+import os
+
+import pytest
+
+from pararead.partition import ReadBalancedPartitioner, CHUNKS_PER_CORE
+from pararead.processors import ReadCounter
+from pararead.tuning import \
+    available_cores, calibrate, choose_num_chunks, choose_workers, \
+    estimate_makespan, Calibration
+from tests import PATH_ALIGNED_FILE, NUM_READS_BY_FILE
+from tests.helpers import GroupedNames, ReadStartProcessor
+
+
+__author__ = "Vince Reuter"
+__email__ = "vreuter@virginia.edu"
+
+
+# Cores to pretend are available, for choice among several.
+FAKE_AVAILABLE_CORES = 4
+
+
+
+def _cgroup_files(tmpdir, v2=None, v1=None):
+    """ Write fake cgroup files of a CPU quota, returning their paths. """
+    paths = {"cgroup_v2_max": tmpdir.join("cpu.max").strpath,
+             "cgroup_v1_quota": tmpdir.join("cfs_quota_us").strpath,
+             "cgroup_v1_period": tmpdir.join("cfs_period_us").strpath}
+    if v2 is not None:
+        tmpdir.join("cpu.max").write(v2 + "\n")
+    if v1 is not None:
+        tmpdir.join("cfs_quota_us").write("{}\n".format(v1[0]))
+        tmpdir.join("cfs_period_us").write("{}\n".format(v1[1]))
+    return paths
+
+
+def _affinity():
+    """ Number of CPUs to which this process may be scheduled. """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+
+class AvailableCoresTests:
+    """ Available cores honor affinity and cgroup CPU quotas. """
+
+    @pytest.mark.parametrize(argnames=["v2", "v1", "quota"], argvalues=[
+        (None, None, None), ("max 100000", None, None),
+        ("150000 100000", None, 2), ("50000 100000", None, 1),
+        (None, (-1, 100000), None), (None, (300000, 100000), 3),
+        ("max 100000", (100000, 100000), 1)])
+    def test_quota(self, tmpdir, v2, v1, quota):
+        cores = available_cores(**_cgroup_files(tmpdir, v2=v2, v1=v1))
+        expected = _affinity() if quota is None else min(_affinity(), quota)
+        assert expected == cores
+
+    def test_actual(self):
+        assert 1 <= available_cores() <= _affinity()
+
+
+
+class ChoiceTests:
+    """ Workers and chunks are chosen to minimize estimated makespan. """
+
+    def test_one_worker_in_process(self):
+        assert 3.0 == estimate_makespan([1.0, 2.0], 1)
+
+    def test_in_order(self):
+        """ Chunks go in order to the first worker free. """
+        assert 3.0 + 0.1 == pytest.approx(
+            estimate_makespan([1.0, 1.0, 2.0], 2, worker_startup=0.05))
+        assert 2.0 + 0.1 == pytest.approx(
+            estimate_makespan([2.0, 1.0, 1.0], 2, worker_startup=0.05))
+
+    def test_long_chunks_spread(self):
+        assert 8 == choose_workers([10.0] * 16, 8)
+
+    def test_short_chunks_in_process(self):
+        assert 1 == choose_workers([0.001] * 16, 8)
+
+    def test_no_more_workers_than_chunks(self):
+        assert 3 == choose_workers([10.0] * 3, 8)
+
+    def test_skewed_chunks(self):
+        """ Workers beyond the longest chunk's share don't pay off. """
+        assert 2 == choose_workers([100.0] + [1.0] * 20, 16)
+
+    @pytest.mark.parametrize(argnames=["overhead", "expected"], argvalues=[
+        (0.0, 4 * CHUNKS_PER_CORE), (1e-6, 4 * CHUNKS_PER_CORE),
+        (1000.0, 4), (0.3, 10)])
+    def test_num_chunks(self, overhead, expected):
+        calibration = Calibration(reads_per_second=1e4,
+                                  chunk_overhead=overhead)
+        assert expected == choose_num_chunks(10 ** 5, calibration, 4)
+
+    def test_num_chunks_one_worker(self):
+        assert 1 == choose_num_chunks(10 ** 5, Calibration(1e4, 0.1), 1)
+
+
+
+class CalibrationTests:
+    """ Calibration processes a sample, leaving the processor as it was. """
+
+    def test_calibrate(self, tmpdir):
+        processor = ReadStartProcessor(
+            PATH_ALIGNED_FILE, cores=1, outfile=tmpdir.join("x.txt").strpath)
+        processor.register_files()
+        temp_folder = processor.temp_folder
+        calibration = calibrate(processor, "K3_methylated",
+                                probe_chunk="K1_unmethylated", sample_size=50)
+        assert calibration.reads_per_second > 0
+        assert calibration.chunk_overhead >= 0
+        assert "fetch_chunk" not in vars(processor)
+        assert temp_folder == processor.temp_folder
+        assert [] == os.listdir(temp_folder)
+
+    def test_side_effects(self, tmpdir):
+        """ No output of calibration, of any kind, is left behind. """
+        processor = GroupedNames(PATH_ALIGNED_FILE, cores=1, group_tag="XG",
+                                 outfile=tmpdir.join("x.txt").strpath)
+        processor.register_files()
+        assert calibrate(processor, "K3_methylated") is not None
+        assert [] == os.listdir(processor.temp_folder)
+
+    def test_not_fetched(self, tmpdir):
+        """ Processing that doesn't fetch its reads isn't calibrated. """
+        processor = ReadCounter(PATH_ALIGNED_FILE, cores=1, use_index=True,
+                                outfile=tmpdir.join("x.txt").strpath)
+        processor.register_files()
+        calls = []
+        tally = processor.tally
+        processor.tally = lambda chunk: calls.append(chunk) or tally(chunk)
+        assert calibrate(processor, "K3_methylated",
+                         probe_chunk="K1_unmethylated") is None
+        assert ["K1_unmethylated"] == calls
+        assert [] == os.listdir(processor.temp_folder)
+
+
+
+class AutoCoresTests:
+    """ With cores='auto', cores and chunks are chosen for each run. """
+
+    @pytest.fixture(autouse=True)
+    def fake_cores(self, monkeypatch):
+        monkeypatch.setattr("pararead.processor.available_cores",
+                            lambda: FAKE_AVAILABLE_CORES)
+
+    def test_counts(self, tmpdir):
+        outfile = tmpdir.join("counts.txt").strpath
+        processor = ReadCounter(PATH_ALIGNED_FILE, cores="auto",
+                                outfile=outfile)
+        processor.register_files()
+        chunks = processor.run()
+        processor.combine(chunks, strict=True)
+        # A small file isn't worth starting workers for.
+        assert 1 == processor.cores
+        with open(outfile) as f:
+            next(f)
+            counts = [int(l.split("\t")[1]) for l in f]
+        assert NUM_READS_BY_FILE[PATH_ALIGNED_FILE] == sum(counts)
+
+    def test_partition(self, tmpdir):
+        processor = ReadStartProcessor(
+            PATH_ALIGNED_FILE, cores="auto",
+            outfile=tmpdir.join("starts.txt").strpath,
+            partitioner=ReadBalancedPartitioner())
+        processor.register_files()
+        chunks = processor.run()
+        assert 1 <= processor.cores <= FAKE_AVAILABLE_CORES
+        assert len(chunks) <= FAKE_AVAILABLE_CORES * CHUNKS_PER_CORE
+        records = [r for _, rs in processor.chunk_records(chunks, strict=True)
+                   for r in rs]
+        assert NUM_READS_BY_FILE[PATH_ALIGNED_FILE] == len(records)
+
+    def test_side_effects(self, tmpdir):
+        """ Calibration leaves no output to be merged with the run's. """
+        processor = GroupedNames(PATH_ALIGNED_FILE, cores="auto",
+                                 group_tag="XG", buffer_size=1,
+                                 outfile=tmpdir.join("names.txt").strpath)
+        processor.register_files()
+        processor.combine(processor.run(), strict=True)
+        counts = {}
+        with open(processor.outfile) as index:
+            for group, outpath in (l.split("\t") for l in
+                                   index.read().splitlines()):
+                with open(outpath) as f:
+                    counts[group] = len(f.read().split())
+        assert {"CT": 40, "GA": 83} == counts
+
+    def test_uncalibrated(self, tmpdir):
+        """ Without calibration, all available cores are used. """
+        processor = ReadCounter(PATH_ALIGNED_FILE, cores="auto",
+                                use_index=True,
+                                outfile=tmpdir.join("counts.txt").strpath)
+        processor.register_files()
+        assert 2 == len(processor.run())
+        assert FAKE_AVAILABLE_CORES == processor.cores
+
+    def test_rerun(self, tmpdir):
+        """ Each run chooses anew, from all available cores. """
+        processor = ReadCounter(PATH_ALIGNED_FILE, cores="auto",
+                                outfile=tmpdir.join("counts.txt").strpath)
+        processor.register_files()
+        processor.run()
+        processor.cores = 2
+        processor.run()
+        assert 1 == processor.cores
+
+    def test_fixed_cores(self, tmpdir):
+        processor = ReadCounter(PATH_ALIGNED_FILE, cores=3,
+                                outfile=tmpdir.join("counts.txt").strpath)
+        assert not processor.auto_cores
+        assert 3 == processor.cores
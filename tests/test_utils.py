@@ -8,7 +8,7 @@ from pysam import AlignmentFile, VariantFile
 
 from pararead.exceptions import FileTypeException, MissingHeaderException
 from pararead.utils import \
-    create_reads_builder, parse_bam_header, \
+    create_reads_builder, parse_bam_header, parse_memory_size, \
     partition_chunks_by_null_result,  READS_FILE_MAKER
 from tests import PATH_ALIGNED_FILE, PATH_UNALIGNED_FILE
 from tests.helpers import ReadsfileWrapper
@@ -131,3 +131,20 @@ class PartitionChromosomesByResultTests:
         # Sort is for comparison in case of Mapping rather than Sequence.
         assert expected_scraps == scraps
         assert expected_keeps == keeps
+
+
+
+class ParseMemorySizeTests:
+    """ Tests for interpretation of memory sizes. """
+
+    @pytest.mark.parametrize(
+            argnames=["size", "expected"],
+            argvalues=[(1000, 1000), ("1000", 1000), ("2K", 2048),
+                       ("1.5g", 3 * 2 ** 29), ("8GB", 8 * 2 ** 30)])
+    def test_parses_sizes(self, size, expected):
+        assert expected == parse_memory_size(size)
+
+    @pytest.mark.parametrize(argnames="size", argvalues=["", "G", "lots"])
+    def test_invalid_size(self, size):
+        with pytest.raises(ValueError):
+            parse_memory_size(size)